@@ -9,7 +9,7 @@ from backend_loader import initialize_backend
 from ui_layout import build_ui
 import event_handlers as handlers
 # from config import VIDEO_BASE_PATH, KEYFRAME_BASE_PATH 
-from config import VIDEO_BASE_PATHS, KEYFRAME_BASE_PATHS
+from config import VIDEO_BASE_PATHS, KEYFRAME_BASE_PATHS, SEARCH_CONCURRENCY_LIMIT
 
 print("--- Giai đoạn 2/4: Đang khởi tạo các Động cơ Backend...")
 backend_objects = initialize_backend()
@@ -17,17 +17,33 @@ master_searcher = backend_objects['master_searcher']
 transcript_searcher = backend_objects['transcript_searcher']
 fps_map = backend_objects['fps_map']
 video_path_map = backend_objects['video_path_map']
+clip_prefetcher = backend_objects['clip_prefetcher']
 print("--- ✅ Toàn bộ Backend đã được nạp và sẵn sàng chiến đấu. ---")
 
 
 print("--- Giai đoạn 3/4: Đang xây dựng giao diện và kết nối sự kiện...")
-search_with_backend = partial(handlers.perform_search, master_searcher=master_searcher)
 transcript_search_with_backend = partial(handlers.handle_transcript_search, transcript_searcher=transcript_searcher, fps_map=fps_map)
+transcript_page_with_backend = partial(handlers.update_transcript_page, transcript_searcher=transcript_searcher, fps_map=fps_map)
 calculate_frame_with_backend = partial(handlers.calculate_frame_number, fps_map=fps_map)
+frame_strip_with_backend = partial(handlers.handle_frame_strip, fps_map=fps_map)
 
-def on_transcript_select_wrapper(results_state, query1, query2, query3, evt: gr.SelectData):
+def search_with_backend(query_text, num_results, w_clip, w_obj, w_semantic, lambda_mmr, initial_retrieval_count,
+                        w_spatial, w_fine_grained, deadline_ms, w_transcript, request: gr.Request):
+    yield from handlers.perform_search(
+        query_text, num_results, w_clip, w_obj, w_semantic, lambda_mmr, initial_retrieval_count,
+        w_spatial, w_fine_grained, deadline_ms, w_transcript,
+        master_searcher=master_searcher, clip_prefetcher=clip_prefetcher, request=request
+    )
+
+def update_gallery_page_wrapper(gallery_items, current_page, direction, response_state, request: gr.Request):
+    return handlers.update_gallery_page(
+        gallery_items, current_page, direction, response_state,
+        clip_prefetcher=clip_prefetcher, request=request
+    )
+
+def on_transcript_select_wrapper(results_state, current_page, query1, query2, query3, evt: gr.SelectData):
     return handlers.on_transcript_select(
-        results_state=results_state, video_path_map=video_path_map,
+        results_state=results_state, current_page=current_page, video_path_map=video_path_map,
         transcript_searcher=transcript_searcher,
         query1=query1, query2=query2, query3=query3, 
         evt=evt
@@ -45,7 +61,10 @@ def add_to_submission_wrapper(submission_list, candidate, position):
         return handlers.add_to_submission_list(submission_list, candidate, position, fps_map)
 
 def add_transcript_result_wrapper(submission_list, results_state, selected_index, position):
-    return handlers.add_transcript_result_to_submission(submission_list, results_state, selected_index, position, fps_map)
+    return handlers.add_transcript_result_to_submission(submission_list, results_state, selected_index, position, transcript_searcher, fps_map)
+
+def on_frame_strip_select_wrapper(strip_state, evt: gr.SelectData):
+    return handlers.on_frame_strip_select(strip_state, evt)
 
 def sync_submission_wrapper(submission_list):
     return handlers.sync_submission_state_to_editor(submission_list, fps_map)
@@ -62,14 +81,22 @@ def connect_event_listeners(ui_components):
         ui["w_clip_slider"], ui["w_obj_slider"], 
         ui["w_semantic_slider"], ui["lambda_mmr_slider"], ui["initial_retrieval_slider"],
         ui["w_spatial_slider"],          
-        ui["w_fine_grained_slider"]
+        ui["w_fine_grained_slider"],
+        ui["deadline_slider"],
+        ui["w_transcript_slider"]
     ]
     visual_search_outputs = [
         ui["results_gallery"], ui["status_output"], ui["response_state"], 
         ui["gallery_items_state"], ui["current_page_state"], ui["page_info_display"]
     ]
-    ui["search_button"].click(fn=search_with_backend, inputs=visual_search_inputs, outputs=visual_search_outputs)
-    ui["query_input"].submit(fn=search_with_backend, inputs=visual_search_inputs, outputs=visual_search_outputs)
+    ui["search_button"].click(
+        fn=search_with_backend, inputs=visual_search_inputs, outputs=visual_search_outputs,
+        concurrency_limit=SEARCH_CONCURRENCY_LIMIT, concurrency_id="visual_search"
+    )
+    ui["query_input"].submit(
+        fn=search_with_backend, inputs=visual_search_inputs, outputs=visual_search_outputs,
+        concurrency_limit=SEARCH_CONCURRENCY_LIMIT, concurrency_id="visual_search"
+    )
     
     page_outputs = [ui["results_gallery"], ui["current_page_state"], ui["page_info_display"]]
     
@@ -79,8 +106,8 @@ def connect_event_listeners(ui_components):
         outputs=[ui["results_gallery"]],
         queue=False
     ).then(
-        fn=handlers.update_gallery_page, 
-        inputs=[ui["gallery_items_state"], ui["current_page_state"], gr.Textbox("◀️ Trang trước", visible=False)],
+        fn=update_gallery_page_wrapper, 
+        inputs=[ui["gallery_items_state"], ui["current_page_state"], gr.Textbox("◀️ Trang trước", visible=False), ui["response_state"]],
         outputs=page_outputs,
         queue=False
     )
@@ -91,19 +118,35 @@ def connect_event_listeners(ui_components):
         outputs=[ui["results_gallery"]],
         queue=False
     ).then(
-        fn=handlers.update_gallery_page, 
-        inputs=[ui["gallery_items_state"], ui["current_page_state"], gr.Textbox("▶️ Trang sau", visible=False)],
+        fn=update_gallery_page_wrapper, 
+        inputs=[ui["gallery_items_state"], ui["current_page_state"], gr.Textbox("▶️ Trang sau", visible=False), ui["response_state"]],
         outputs=page_outputs,
         queue=False
     )
     
-    transcript_inputs = [ui["transcript_query_1"], ui["transcript_query_2"], ui["transcript_query_3"]]
-    transcript_outputs = [ui["transcript_results_count"], ui["transcript_results_df"], ui["transcript_results_state"]]
+    transcript_inputs = [ui["transcript_query_1"], ui["transcript_query_2"], ui["transcript_query_3"], ui["transcript_mode_radio"], ui["transcript_window_slider"]]
+    transcript_outputs = [
+        ui["transcript_results_count"], ui["transcript_results_df"], ui["transcript_results_state"],
+        ui["transcript_page_state"], ui["transcript_page_info_display"]
+    ]
     ui["transcript_search_button"].click(fn=transcript_search_with_backend, inputs=transcript_inputs, outputs=transcript_outputs)
 
+    transcript_page_outputs = [ui["transcript_results_df"], ui["transcript_page_state"], ui["transcript_page_info_display"]]
+    ui["transcript_prev_page_button"].click(
+        fn=transcript_page_with_backend,
+        inputs=[ui["transcript_results_state"], ui["transcript_page_state"], gr.Textbox("◀️ Trang trước", visible=False)],
+        outputs=transcript_page_outputs
+    )
+    ui["transcript_next_page_button"].click(
+        fn=transcript_page_with_backend,
+        inputs=[ui["transcript_results_state"], ui["transcript_page_state"], gr.Textbox("▶️ Trang sau", visible=False)],
+        outputs=transcript_page_outputs
+    )
+
     transcript_clear_outputs = [
         ui["transcript_query_1"], ui["transcript_query_2"], ui["transcript_query_3"],
-        ui["transcript_results_count"], ui["transcript_results_df"], ui["transcript_results_state"]
+        ui["transcript_results_count"], ui["transcript_results_df"], ui["transcript_results_state"],
+        ui["transcript_page_state"], ui["transcript_page_info_display"]
     ]
     ui["transcript_clear_button"].click(fn=handlers.clear_transcript_search, inputs=None, outputs=transcript_clear_outputs, queue=False)
     analysis_panel_outputs = [
@@ -125,6 +168,7 @@ def connect_event_listeners(ui_components):
         fn=on_transcript_select_wrapper,
         inputs=[
             ui["transcript_results_state"],
+            ui["transcript_page_state"],
             ui["transcript_query_1"], 
             ui["transcript_query_2"], 
             ui["transcript_query_3"]  
@@ -179,6 +223,17 @@ def connect_event_listeners(ui_components):
         outputs=[ui["frame_calculator_output"]],
         queue=False
     )
+    ui["frame_strip_button"].click(
+        fn=frame_strip_with_backend,
+        inputs=[ui["selected_candidate_for_submission"]],
+        outputs=[ui["frame_strip_gallery"], ui["frame_strip_state"]]
+    )
+    ui["frame_strip_gallery"].select(
+        fn=on_frame_strip_select_wrapper,
+        inputs=[ui["frame_strip_state"]],
+        outputs=[ui["frame_calculator_video_id"], ui["frame_calculator_time_input"], ui["frame_calculator_output"]],
+        queue=False
+    )
     ui["submission_button"].click(
         fn=handlers.handle_submission,
         inputs=[ui["submission_text_editor"], ui["query_id_input"]],
@@ -189,15 +244,19 @@ def connect_event_listeners(ui_components):
         ui["gallery_items_state"], ui["current_page_state"], ui["page_info_display"],
         ui["transcript_query_1"], ui["transcript_query_2"], ui["transcript_query_3"],
         ui["transcript_results_count"], ui["transcript_results_df"], ui["transcript_results_state"],
+        ui["transcript_page_state"], ui["transcript_page_info_display"],
         ui["selected_image_display"], ui["video_player"], ui["full_transcript_display"],
         ui["analysis_display_html"], ui["selected_candidate_for_submission"],
         ui["submission_list_state"], ui["submission_text_editor"],
         ui["frame_calculator_video_id"], ui["frame_calculator_time_input"], ui["frame_calculator_output"],
+        ui["frame_strip_gallery"], ui["frame_strip_state"],
         ui["query_id_input"], ui["submission_file_output"]
     ]
     ui["clear_button"].click(fn=handlers.clear_all, inputs=None, outputs=clear_all_outputs, queue=False)
 
 
+# Video gốc được phục vụ tại chỗ (không băm/sao chép vào cache của Gradio) khi phát toàn bộ video.
+gr.set_static_paths(paths=VIDEO_BASE_PATHS)
 app, ui_components = build_ui(connect_event_listeners)
 
 if __name__ == "__main__":
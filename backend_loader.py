@@ -5,6 +5,7 @@ from search_core.basic_searcher import BasicSearcher
 from search_core.master_searcher import MasterSearcher
 from sentence_transformers import SentenceTransformer
 from search_core.transcript_searcher import TranscriptSearcher
+from utils import ClipPrefetcher, IFrameIndex, get_clip_cache
 
 from config import (
     VIDEO_BASE_PATHS, 
@@ -13,7 +14,15 @@ from config import (
     CLIP_FEATURES_PATH, 
     ALL_ENTITIES_PATH, 
     OPENAI_API_KEY, 
-    GEMINI_API_KEY
+    GEMINI_API_KEY,
+    SEARCH_CACHE_MAX_BYTES,
+    SEARCH_CACHE_TTL_SECONDS,
+    CLIP_PREFETCH_WORKERS,
+    IFRAME_INDEX_PATH,
+    TRANSCRIPT_INDEX_PATH,
+    TRANSCRIPT_FOLD_DIACRITICS,
+    TRANSCRIPT_SEMANTIC_INDEX_PATH,
+    TRANSCRIPT_SEMANTIC_ROWS_PATH
 )
 
 
@@ -49,6 +58,23 @@ def initialize_backend():
         faiss_index_path=FAISS_INDEX_PATH, 
         metadata_path=RERANK_METADATA_PATH
     )
+
+    print("--- 2/3: Khởi tạo TranscriptSearcher (Tai Thính)... ---")
+    METADATA_V6_COMBINED_PATH = RERANK_METADATA_PATH 
+    if not os.path.exists(METADATA_V6_COMBINED_PATH):
+         print(f"--- ⚠️ CẢNH BÁO: Không tìm thấy file metadata hợp nhất tại {METADATA_V6_COMBINED_PATH}. TranscriptSearcher sẽ không hoạt động. ---")
+         transcript_searcher = None
+    else:
+        transcript_searcher = TranscriptSearcher(
+            metadata_path=METADATA_V6_COMBINED_PATH,
+            index_path=TRANSCRIPT_INDEX_PATH,
+            fold_diacritics=TRANSCRIPT_FOLD_DIACRITICS,
+            embedding_model=rerank_model,
+            semantic_index_path=TRANSCRIPT_SEMANTIC_INDEX_PATH,
+            semantic_rows_path=TRANSCRIPT_SEMANTIC_ROWS_PATH
+        )
+    print("--- ✅ TranscriptSearcher đã sẵn sàng. ---")
+
     master_searcher = MasterSearcher(
         basic_searcher=basic_searcher, 
         rerank_model=rerank_model, 
@@ -56,18 +82,12 @@ def initialize_backend():
         gemini_api_key=GEMINI_API_KEY, 
         entities_path=ALL_ENTITIES_PATH, 
         clip_features_path=CLIP_FEATURES_PATH, 
-        video_path_map=video_path_map
+        video_path_map=video_path_map,
+        transcript_searcher=transcript_searcher,
+        result_cache_max_bytes=SEARCH_CACHE_MAX_BYTES,
+        result_cache_ttl=SEARCH_CACHE_TTL_SECONDS
     )    
     print("--- ✅ MasterSearcher đã sẵn sàng. ---")
-
-    print("--- 2/3: Khởi tạo TranscriptSearcher (Tai Thính)... ---")
-    METADATA_V6_COMBINED_PATH = RERANK_METADATA_PATH 
-    if not os.path.exists(METADATA_V6_COMBINED_PATH):
-         print(f"--- ⚠️ CẢNH BÁO: Không tìm thấy file metadata hợp nhất tại {METADATA_V6_COMBINED_PATH}. TranscriptSearcher sẽ không hoạt động. ---")
-         transcript_searcher = None
-    else:
-        transcript_searcher = TranscriptSearcher(metadata_path=METADATA_V6_COMBINED_PATH)
-    print("--- ✅ TranscriptSearcher đã sẵn sàng. ---")
     
     print("--- 3/3: Tải Bản đồ FPS đã Hợp nhất... ---")
     fps_map = {}
@@ -84,11 +104,23 @@ def initialize_backend():
     else:
         print(f"--- ⚠️ Không tìm thấy file FPS map hợp nhất tại {fps_map_path}. Sẽ sử dụng FPS mặc định. ---")
 
+    iframe_index = None
+    if os.path.exists(IFRAME_INDEX_PATH):
+        try:
+            iframe_index = IFrameIndex.load(IFRAME_INDEX_PATH)
+            print(f"--- ✅ Tải chỉ mục I-frame cho {len(iframe_index)} video. Clip sẽ được cắt bằng copy codec. ---")
+        except Exception as e:
+            print(f"--- ⚠️ Lỗi khi tải chỉ mục I-frame: {e}. Clip có thể phải re-encode. ---")
+    else:
+        print(f"--- ⚠️ Không tìm thấy chỉ mục I-frame tại {IFRAME_INDEX_PATH} (chạy build_iframe_index.py). ---")
+    clip_prefetcher = ClipPrefetcher(get_clip_cache(iframe_index=iframe_index), max_workers=CLIP_PREFETCH_WORKERS)
+
     print("\n--- ✅ Backend đã khởi tạo thành công! Hạm đội sẵn sàng chiến đấu trên mọi mặt trận. ---")
     
     return {
         "master_searcher": master_searcher,
         "transcript_searcher": transcript_searcher,
         "fps_map": fps_map,
-        "video_path_map": video_path_map 
+        "video_path_map": video_path_map,
+        "clip_prefetcher": clip_prefetcher
     }
\ No newline at end of file
@@ -0,0 +1,203 @@
+# /batch_runner.py
+"""
+Chạy hàng loạt truy vấn (không cần giao diện Gradio) và xuất file nộp bài `query_id.csv`.
+
+Ví dụ:
+    python batch_runner.py --queries /kaggle/input/round1/queries.csv \
+        --output-dir /kaggle/working/submissions --workers 4
+
+File truy vấn hỗ trợ:
+    - .csv   : có cột `query_id` (hoặc `id`) và `query` (hoặc `text`)
+    - .jsonl : mỗi dòng là {"query_id": ..., "query": ...}
+    - .txt   : mỗi dòng "query_id<TAB>query"
+
+Tiến độ được ghi vào file checkpoint (JSON) sau mỗi truy vấn hoàn thành; chạy lại
+cùng lệnh sẽ bỏ qua các truy vấn đã xong.
+"""
+
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Tuple
+
+from utils.api_utils import RateLimiter
+from utils.formatting import format_for_submission, generate_submission_file
+
+
+def load_queries(path: str) -> List[Tuple[str, str]]:
+    """
+    Đọc file truy vấn và trả về danh sách (query_id, query_text) theo đúng thứ tự trong file.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    queries: List[Tuple[str, str]] = []
+    with open(path, 'r', encoding='utf-8') as f:
+        if ext == '.csv':
+            for row in csv.DictReader(f):
+                qid = (row.get('query_id') or row.get('id') or '').strip()
+                text = (row.get('query') or row.get('text') or '').strip()
+                if qid and text:
+                    queries.append((qid, text))
+        elif ext == '.jsonl':
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                qid = str(item.get('query_id') or item.get('id') or '').strip()
+                text = str(item.get('query') or item.get('text') or '').strip()
+                if qid and text:
+                    queries.append((qid, text))
+        else:
+            for line in f:
+                parts = line.rstrip('\n').split('\t', 1)
+                if len(parts) == 2 and parts[0].strip() and parts[1].strip():
+                    queries.append((parts[0].strip(), parts[1].strip()))
+    return queries
+
+
+class Checkpoint:
+    """
+    Lưu tiến độ batch vào một file JSON dạng {"completed": {query_id: {...}}}.
+    Ghi nguyên tử (file tạm + os.replace) nên một lần dừng đột ngột không làm hỏng checkpoint.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.completed: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.completed = json.load(f).get('completed', {})
+                print(f"--- ♻️ Checkpoint: đã hoàn thành {len(self.completed)} truy vấn trước đó. ---")
+            except (OSError, ValueError) as e:
+                print(f"--- ⚠️ Không đọc được checkpoint '{path}': {e}. Bắt đầu lại từ đầu. ---")
+
+    def is_done(self, query_id: str) -> bool:
+        with self._lock:
+            return query_id in self.completed
+
+    def mark_done(self, query_id: str, info: Dict[str, Any]):
+        with self._lock:
+            self.completed[query_id] = info
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'completed': self.completed}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def run_batch(master_searcher, queries: List[Tuple[str, str]], config: Dict[str, Any],
+              output_dir: str, checkpoint: Checkpoint, workers: int = 4, max_results: int = 100):
+    """
+    Chạy batch theo 3 pha:
+        1. Phân tích truy vấn bằng Gemini song song (bị giới hạn bởi RateLimiter của handler).
+        2. Mã hóa CLIP toàn bộ search_context trong MỘT lần encode theo batch (làm nóng cache embedding).
+        3. Tìm kiếm song song với phân tích đã tính sẵn, rồi ghi `query_id.csv`.
+    """
+    pending = [(qid, text) for qid, text in queries if not checkpoint.is_done(qid)]
+    if not pending:
+        print("--- ✅ Tất cả truy vấn đã hoàn thành theo checkpoint. ---")
+        return
+    print(f"--- 🚀 Batch: {len(pending)} truy vấn cần chạy ({len(queries) - len(pending)} đã xong). ---")
+
+    # --- Pha 1: Phân tích truy vấn song song ---
+    analyses: Dict[str, Dict[str, Any]] = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(master_searcher.analyze_query, text): qid for qid, text in pending}
+        for future in as_completed(futures):
+            qid = futures[future]
+            try:
+                analyses[qid] = future.result()
+            except Exception as e:
+                print(f"--- ⚠️ Phân tích truy vấn {qid} thất bại: {e}. Dùng truy vấn gốc. ---")
+                analyses[qid] = {}
+    print(f"--- ✅ Pha 1: Đã phân tích {len(analyses)} truy vấn. ---")
+
+    # --- Pha 2: Encode CLIP theo batch ---
+    texts_to_encode = []
+    for qid, text in pending:
+        texts_to_encode.append(text)
+        texts_to_encode.append(analyses.get(qid, {}).get('search_context', text))
+    basic_searcher = master_searcher.semantic_searcher.basic_searcher
+    basic_searcher.encode_queries(list(dict.fromkeys(texts_to_encode)))
+    print(f"--- ✅ Pha 2: Đã encode {len(set(texts_to_encode))} câu truy vấn CLIP trong một batch. ---")
+
+    # --- Pha 3: Tìm kiếm song song và ghi file nộp bài ---
+    def _run_one(qid: str, text: str) -> Dict[str, Any]:
+        start = time.time()
+        response = master_searcher.search(text, config, precomputed_analysis=analyses.get(qid))
+        df = format_for_submission(response, max_results=max_results)
+        file_path = generate_submission_file(df, query_id=qid, output_dir=output_dir)
+        task_type = response.get('task_type')
+        return {
+            'task_type': getattr(task_type, 'value', str(task_type)),
+            'num_rows': int(len(df)),
+            'file': file_path,
+            'degraded': bool(response.get('degraded')),
+            'time_s': round(time.time() - start, 2),
+        }
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_run_one, qid, text): qid for qid, text in pending}
+        for i, future in enumerate(as_completed(futures), 1):
+            qid = futures[future]
+            try:
+                info = future.result()
+                checkpoint.mark_done(qid, info)
+                print(f"--- [{i}/{len(pending)}] ✅ {qid}: {info['num_rows']} dòng ({info['time_s']}s) ---")
+            except Exception as e:
+                failed.append(qid)
+                print(f"--- [{i}/{len(pending)}] ❌ {qid}: {e} ---")
+
+    if failed:
+        print(f"--- ⚠️ {len(failed)} truy vấn lỗi: {failed}. Chạy lại lệnh để thử lại. ---")
+    else:
+        print("--- ✅ Batch hoàn tất! ---")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy hàng loạt truy vấn và xuất file nộp bài.")
+    parser.add_argument('--queries', required=True, help="File truy vấn (.csv / .jsonl / .txt)")
+    parser.add_argument('--output-dir', default="/kaggle/working/submissions")
+    parser.add_argument('--checkpoint', default=None, help="Mặc định: <output-dir>/batch_checkpoint.json")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--top-k', type=int, default=100)
+    parser.add_argument('--kis-retrieval', type=int, default=100)
+    parser.add_argument('--deadline-ms', type=int, default=0)
+    parser.add_argument('--gemini-rpm', type=int, default=60)
+    parser.add_argument('--openai-rpm', type=int, default=60)
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    if not queries:
+        print(f"--- ❌ Không đọc được truy vấn nào từ '{args.queries}'. ---")
+        return
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(args.output_dir, "batch_checkpoint.json"))
+
+    from backend_loader import initialize_backend
+    backend_objects = initialize_backend()
+    master_searcher = backend_objects['master_searcher']
+
+    if master_searcher.gemini_handler:
+        master_searcher.gemini_handler.rate_limiter = RateLimiter(rpm_limit=args.gemini_rpm)
+    if master_searcher.openai_handler:
+        master_searcher.openai_handler.rate_limiter = RateLimiter(rpm_limit=args.openai_rpm)
+
+    config = {
+        "top_k_final": args.top_k,
+        "kis_retrieval": args.kis_retrieval,
+        "deadline_ms": args.deadline_ms or None,
+        "use_cache": False,
+    }
+    run_batch(master_searcher, queries, config, args.output_dir, checkpoint,
+              workers=args.workers, max_results=args.top_k)
+
+
+if __name__ == "__main__":
+    main()
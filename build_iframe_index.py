@@ -0,0 +1,79 @@
+# /build_iframe_index.py
+"""
+Dựng OFFLINE chỉ mục thời điểm I-frame cho toàn bộ video (dùng cho ClipCache khi cắt clip).
+
+Mỗi video được quét bằng ffprobe ở mức packet (không giải mã khung hình) để lấy pts của
+các packet keyframe của luồng video đầu tiên. Kết quả được lưu gọn dạng CSR vào một file
+.npz (video_ids, offsets, times float32). Khi cắt clip, điểm bắt đầu được lùi về I-frame gần
+nhất phía trước nên cắt bằng copy codec luôn sạch, gần như không bao giờ phải re-encode.
+
+Ví dụ:
+    python build_iframe_index.py --workers 8
+"""
+
+import argparse
+import glob
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from tqdm import tqdm
+
+from config import VIDEO_BASE_PATHS, IFRAME_INDEX_PATH
+from utils.video_utils import IFrameIndex
+
+
+def probe_iframes(video_path: str) -> Optional[List[float]]:
+    """Thời điểm (giây) các packet keyframe của luồng video đầu tiên, hoặc None nếu ffprobe lỗi."""
+    cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', video_path
+    ]
+    try:
+        output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"--- ⚠️ ffprobe thất bại cho '{video_path}': {e} ---")
+        return None
+    iframe_times = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            iframe_times.append(float(pts_time))
+    return iframe_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dựng chỉ mục I-frame cho các video bằng ffprobe.")
+    parser.add_argument('--video-dirs', nargs='+', default=VIDEO_BASE_PATHS)
+    parser.add_argument('--out', default=IFRAME_INDEX_PATH)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    start = time.time()
+    video_files = []
+    for path in args.video_dirs:
+        if os.path.isdir(path):
+            video_files.extend(glob.glob(os.path.join(path, "**", "*.mp4"), recursive=True))
+        else:
+            print(f"   -> ⚠️ Thư mục video '{path}' không tồn tại. Bỏ qua.")
+    print(f"--- 🎞️ Quét I-frame cho {len(video_files)} video với {args.workers} worker... ---")
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        probed = list(tqdm(executor.map(probe_iframes, video_files), total=len(video_files), desc="   -> ffprobe"))
+
+    iframe_times = {
+        os.path.splitext(os.path.basename(video_path))[0]: times
+        for video_path, times in zip(video_files, probed)
+        if times
+    }
+    index = IFrameIndex.from_dict(iframe_times)
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    index.save(args.out)
+    print(f"--- ✅ Đã lưu {len(index.times)} I-frame của {len(index)} video vào {args.out} "
+          f"({len(video_files) - len(index)} video lỗi/không có I-frame, {time.time() - start:.1f}s). ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# /build_thumbnails.py
+"""
+Dựng OFFLINE thumbnail (WebP/JPEG cỡ nhỏ) cho toàn bộ keyframe trong metadata, song song.
+
+Gallery của ứng dụng chỉ hiển thị thumbnail; thumbnail còn thiếu sẽ được tạo lười khi
+cần, nên chạy script này trước giúp lần tìm kiếm đầu tiên không phải chờ tạo ảnh.
+
+Ví dụ:
+    python build_thumbnails.py --workers 16
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from config import RERANK_METADATA_PATH
+from utils.thumbnail_store import (
+    DEFAULT_THUMBNAIL_DIR,
+    THUMBNAIL_CACHE_MAX_BYTES,
+    THUMBNAIL_MAX_SIZE,
+    ThumbnailStore
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dựng thumbnail cho các keyframe.")
+    parser.add_argument('--metadata', default=RERANK_METADATA_PATH)
+    parser.add_argument('--out-dir', default=DEFAULT_THUMBNAIL_DIR)
+    parser.add_argument('--max-size', type=int, default=THUMBNAIL_MAX_SIZE)
+    parser.add_argument('--max-bytes', type=int, default=THUMBNAIL_CACHE_MAX_BYTES)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    start = time.time()
+    keyframe_paths = (
+        pd.read_parquet(args.metadata, columns=['keyframe_path'])['keyframe_path']
+        .dropna().drop_duplicates().tolist()
+    )
+    print(f"--- 🖼️ Dựng thumbnail {args.max_size}px cho {len(keyframe_paths)} keyframe với {args.workers} worker... ---")
+    store = ThumbnailStore(args.out_dir, max_size=args.max_size, max_bytes=args.max_bytes, max_workers=args.workers)
+    stats = store.generate(keyframe_paths)
+    print(f"--- ✅ Hoàn tất: {stats['created']} mới, {stats['existing']} đã có, {stats['failed']} lỗi "
+          f"({store.store.stats()['bytes'] / 1e6:.1f} MB, {time.time() - start:.1f}s). ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# /build_transcript_embeddings.py
+"""
+Dựng OFFLINE chỉ mục ngữ nghĩa cho transcript (dùng cho TranscriptSearcher.semantic_search).
+
+Mỗi "cửa sổ" gồm `--window` dòng transcript liên tiếp (theo thời gian, trong cùng video),
+trượt với bước `--stride`. Cửa sổ được encode bằng Bi-Encoder tiếng Việt (cùng model
+dùng cho Reranking), chuẩn hóa L2 và lưu vào FAISS index nén (mặc định SQ8, ~4 lần
+nhỏ hơn Flat). Kèm theo là file .npz ánh xạ cửa sổ -> dòng mốc (dòng đầu cửa sổ) và dấu vân tay
+của dữ liệu transcript để TranscriptSearcher phát hiện chỉ mục cũ.
+
+Ví dụ:
+    python build_transcript_embeddings.py --window 3 --stride 1
+"""
+
+import argparse
+import os
+import time
+
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from config import (
+    RERANK_METADATA_PATH,
+    TRANSCRIPT_SEMANTIC_INDEX_PATH,
+    TRANSCRIPT_SEMANTIC_ROWS_PATH
+)
+from search_core.transcript_searcher import load_transcript_data, transcript_fingerprint
+from utils.temporal_utils import VideoTimelineIndex
+
+
+def build_windows(full_data, window: int, stride: int):
+    """
+    Tạo các cửa sổ dòng liên tiếp trong từng video.
+
+    Returns:
+        Tuple[List[str], np.ndarray]: (văn bản của từng cửa sổ, dòng mốc của từng cửa sổ)
+    """
+    timeline = VideoTimelineIndex.from_dataframe(full_data)
+    texts = full_data['transcript_text'].to_numpy()
+    window_texts, window_rows = [], []
+    for video_id in timeline.video_ids:
+        rows = timeline.video_rows(video_id)
+        last_start = max(len(rows) - window, 0)
+        for start in range(0, last_start + 1, stride):
+            window_slice = rows[start:start + window]
+            window_texts.append(" ".join(texts[window_slice]))
+            window_rows.append(int(window_slice[0]))
+        if last_start % stride:
+            # Đảm bảo các dòng cuối video luôn nằm trong ít nhất một cửa sổ.
+            window_slice = rows[last_start:]
+            window_texts.append(" ".join(texts[window_slice]))
+            window_rows.append(int(window_slice[0]))
+    return window_texts, np.asarray(window_rows, dtype=np.int32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dựng chỉ mục ngữ nghĩa FAISS cho transcript.")
+    parser.add_argument('--metadata', default=RERANK_METADATA_PATH)
+    parser.add_argument('--index-out', default=TRANSCRIPT_SEMANTIC_INDEX_PATH)
+    parser.add_argument('--rows-out', default=TRANSCRIPT_SEMANTIC_ROWS_PATH)
+    parser.add_argument('--model', default='bkai-foundation-models/vietnamese-bi-encoder')
+    parser.add_argument('--window', type=int, default=1, help="Số dòng transcript mỗi cửa sổ")
+    parser.add_argument('--stride', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--index-type', default='SQ8', help="Chuỗi faiss.index_factory, ví dụ SQ8, Flat, IVF1024,SQ8")
+    parser.add_argument('--device', default='cuda')
+    args = parser.parse_args()
+
+    start = time.time()
+    full_data = load_transcript_data(args.metadata)
+    window_texts, window_rows = build_windows(full_data, max(1, args.window), max(1, args.stride))
+    print(f"--- 🧱 {len(full_data)} dòng transcript -> {len(window_texts)} cửa sổ (window={args.window}, stride={args.stride}). ---")
+
+    model = SentenceTransformer(args.model, device=args.device)
+    embeddings = model.encode(
+        window_texts,
+        batch_size=args.batch_size,
+        convert_to_numpy=True,
+        show_progress_bar=True
+    ).astype('float32')
+    embeddings = np.ascontiguousarray(embeddings)
+    faiss.normalize_L2(embeddings)
+
+    index = faiss.index_factory(embeddings.shape[1], args.index_type, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        print(f"--- 🏋️ Đang huấn luyện index {args.index_type}... ---")
+        index.train(embeddings)
+    index.add(embeddings)
+
+    for path in (args.index_out, args.rows_out):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    faiss.write_index(index, args.index_out)
+    np.savez(args.rows_out, window_rows=window_rows, num_rows=np.array(len(full_data)),
+             fingerprint=np.array(transcript_fingerprint(full_data)))
+    print(f"--- ✅ Đã lưu {index.ntotal} vector vào {args.index_out} và bảng ánh xạ vào {args.rows_out} "
+          f"({time.time() - start:.1f}s). ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,15 @@ from kaggle_secrets import UserSecretsClient
 ITEMS_PER_PAGE = 20
 MAX_SUBMISSION_RESULTS = 100
 
+# Cache kết quả tìm kiếm (MasterSearcher.search)
+SEARCH_CACHE_MAX_BYTES = 256 * 1024 * 1024
+SEARCH_CACHE_TTL_SECONDS = 30 * 60
+# Số lượt tìm kiếm Visual được xử lý đồng thời (các truy vấn giống hệt nhau sẽ được gộp lại)
+SEARCH_CONCURRENCY_LIMIT = 4
+# Cắt trước clip xem thử cho Top-N kết quả và trang gallery đang xem (chạy nền, ưu tiên thấp)
+CLIP_PREFETCH_TOP_N = 8
+CLIP_PREFETCH_WORKERS = 2
+
 KAGGLE_INPUT_DIR = '/kaggle/input'
 KAGGLE_WORKING_DIR = '/kaggle/working'
 UNIFIED_DATA_DIR = os.path.join(KAGGLE_WORKING_DIR, 'unified_data')
@@ -15,6 +24,26 @@ FAISS_INDEX_PATH = os.path.join(KAGGLE_INPUT_DIR, 'stage1/faiss_combined.index')
 RERANK_METADATA_PATH = os.path.join(KAGGLE_INPUT_DIR, 'stage1/rerank_metadata_v6_combined.parquet')
 ALL_ENTITIES_PATH = os.path.join(KAGGLE_INPUT_DIR, 'stage1/all_entities_combined.json') 
 
+# Inverted index cho transcript (dựng ở lần chạy đầu tiên rồi nạp lại từ đây)
+TRANSCRIPT_INDEX_PATH = os.path.join(KAGGLE_WORKING_DIR, 'transcript_index.npz')
+TRANSCRIPT_FOLD_DIACRITICS = False
+# Số dòng tối đa trả về ở chế độ tìm kiếm transcript có xếp hạng (BM25)
+TRANSCRIPT_TOP_N = 200
+# Số dòng transcript được tô sáng và gửi về giao diện mỗi trang
+TRANSCRIPT_PAGE_SIZE = 50
+# Các chế độ tìm kiếm transcript (nhãn hiển thị trên giao diện, cũng là giá trị để chọn hàm xử lý)
+TRANSCRIPT_MODE_FILTER = "🔎 Lọc (tất cả kết quả)"
+TRANSCRIPT_MODE_RANKED = "🏆 Xếp hạng BM25 (Top-N)"
+TRANSCRIPT_MODE_HYBRID = "🧠 Ngữ nghĩa + Từ khóa (Hybrid)"
+TRANSCRIPT_MODE_COOCCURRENCE = "⏱️ Đồng xuất hiện theo thời gian"
+TRANSCRIPT_MODES = [TRANSCRIPT_MODE_FILTER, TRANSCRIPT_MODE_RANKED, TRANSCRIPT_MODE_HYBRID, TRANSCRIPT_MODE_COOCCURRENCE]
+# Chỉ mục ngữ nghĩa cho transcript (dựng offline bằng build_transcript_embeddings.py)
+TRANSCRIPT_SEMANTIC_INDEX_PATH = os.path.join(KAGGLE_WORKING_DIR, 'transcript_semantic.index')
+TRANSCRIPT_SEMANTIC_ROWS_PATH = os.path.join(KAGGLE_WORKING_DIR, 'transcript_semantic_rows.npz')
+
+# Thời điểm I-frame của từng video (dựng offline bằng build_iframe_index.py), dùng để cắt clip bằng copy codec
+IFRAME_INDEX_PATH = os.path.join(KAGGLE_WORKING_DIR, 'iframe_index.npz')
+
 # VIDEO_BASE_PATH = os.path.join(KAGGLE_INPUT_DIR, 'aic2025-batch-1-video/')
 TRANSCRIPTS_JSON_DIR = os.path.join(KAGGLE_INPUT_DIR, 'aic25-transcripts/transcripts') 
 # KEYFRAME_BASE_PATH = os.path.join(KAGGLE_INPUT_DIR, 'aic25-keyframes-and-metadata/keyframes/')
@@ -3,7 +3,6 @@
 # ==============================================================================
 import html
 from io import StringIO
-import shutil
 import gradio as gr
 import pandas as pd
 import numpy as np
@@ -13,10 +12,11 @@ import re
 import traceback
 from typing import Dict, Any, List, Optional
 
-from config import ITEMS_PER_PAGE, MAX_SUBMISSION_RESULTS
+from config import ITEMS_PER_PAGE, MAX_SUBMISSION_RESULTS, TRANSCRIPT_TOP_N, TRANSCRIPT_PAGE_SIZE, CLIP_PREFETCH_TOP_N
+from config import TRANSCRIPT_MODE_RANKED, TRANSCRIPT_MODE_HYBRID, TRANSCRIPT_MODE_COOCCURRENCE
 from ui_helpers import create_detailed_info_html
 from search_core.task_analyzer import TaskType
-from utils import create_video_segment, generate_submission_file
+from utils import create_video_segment, generate_submission_file, extract_frame_strip
 from utils.formatting import format_submission_list_to_csv_string, format_results_for_mute_gallery 
 
 def highlight_keywords(full_text: str, keywords: List[str]) -> str:
@@ -42,11 +42,29 @@ def highlight_keywords(full_text: str, keywords: List[str]) -> str:
 def get_full_transcript_for_video(video_id: str, transcript_searcher) -> str:
     if not transcript_searcher or transcript_searcher.full_data is None: return "Lỗi: Transcript engine chưa sẵn sàng."
     try:
-        video_transcripts = transcript_searcher.full_data[transcript_searcher.full_data['video_id'] == video_id]
-        full_text = " ".join(video_transcripts['transcript_text'].tolist())
+        full_text = transcript_searcher.get_video_document(video_id)
         return full_text if full_text.strip() else "Video này không có lời thoại."
     except Exception: return "Không thể tải transcript cho video này."
 
+def get_highlighted_transcript_for_video(video_id: str, keywords: List[str], transcript_searcher,
+                                         as_phrases: bool = False) -> str:
+    """
+    Transcript đầy đủ của video dưới dạng HTML đã tô sáng từ khóa. Dùng văn bản dựng sẵn
+    và vị trí khớp từ inverted index; chỉ quay về regex khi index không khả dụng.
+    Với as_phrases=True, mỗi keyword được khớp nguyên cụm (dùng cho câu truy vấn tự nhiên
+    của Visual Search) thay vì tách thành các từ khóa AND.
+    """
+    if not transcript_searcher or transcript_searcher.full_data is None: return "Lỗi: Transcript engine chưa sẵn sàng."
+    try:
+        if not transcript_searcher.get_video_document(video_id).strip():
+            return "Video này không có lời thoại."
+        if transcript_searcher.index is None:
+            return highlight_keywords(transcript_searcher.get_video_document(video_id), keywords)
+        if as_phrases:
+            keywords = [f'"{keyword.replace(chr(34), " ")}"' for keyword in keywords if keyword and keyword.strip()]
+        return transcript_searcher.highlight_video_document(video_id, keywords)
+    except Exception: return "Không thể tải transcript cho video này."
+
 def clear_analysis_panel():
     """Helper để xóa các component trong cột phải."""
     return None, None, "", "", "", None, "", "", None
@@ -59,90 +77,194 @@ def clear_gallery():
     print("--- 🔄 Clearing gallery for page update... ---")
     return None
 
+def prefetch_result_clips(clip_prefetcher, request: Optional[gr.Request], results: List[Dict[str, Any]]):
+    """Giao các kết quả (theo thứ tự ưu tiên) cho ClipPrefetcher; thay thế lượt prefetch trước của phiên."""
+    if clip_prefetcher is None:
+        return
+    session_id = request.session_hash if request is not None else "default"
+    items = [
+        (result.get('video_path'), result.get('timestamp', 0.0))
+        for result in results
+        if result.get('video_path')
+    ]
+    clip_prefetcher.schedule(session_id, items)
+
+STAGE_LABELS = {
+    'retrieval': "⚡ Kết quả FAISS thô",
+    'spatial': "📐 Đã rerank không gian",
+    'fine_grained': "🔬 Đã xác thực chi tiết, đang chạy VQA",
+}
+
 def perform_search(
     query_text: str, num_results: int, 
     w_clip: float, w_obj: float, w_semantic: float, 
     lambda_mmr: float, initial_retrieval_count: int,
     w_spatial: float, w_fine_grained: float,
-    master_searcher
+    deadline_ms: float,
+    w_transcript: float,
+    master_searcher,
+    clip_prefetcher=None,
+    request: gr.Request = None
 ):
     """
     Hàm xử lý sự kiện tìm kiếm chính - Phiên bản PHOENIX hoàn thiện.
+    Là một generator: gallery được cập nhật sau mỗi stage của MasterSearcher.search_iter
+    (FAISS thô -> rerank không gian -> kết quả cuối cùng).
     """
     if not query_text.strip():
         gr.Warning("Vui lòng nhập truy vấn tìm kiếm!")
-        return [], "<div style='color: orange;'>⚠️ Vui lòng nhập truy vấn.</div>", None, [], 1, "Trang 1 / 1"
+        yield [], "<div style='color: orange;'>⚠️ Vui lòng nhập truy vấn.</div>", None, [], 1, "Trang 1 / 1"
+        return
     
     gr.Info("🚀 Kích hoạt quy trình tìm kiếm đa tầng PHOENIX...")
     
-    try:
-        config = {
-            "top_k_final": int(num_results),
-            "kis_retrieval": int(initial_retrieval_count),
-            "lambda_mmr": lambda_mmr,
-            "weights": {
-                'w_clip': w_clip,
-                'w_obj': w_obj, 
-                'w_semantic': w_semantic,
-                'w_spatial': w_spatial,
-                'w_fine_grained': w_fine_grained
-            }
+    config = {
+        "top_k_final": int(num_results),
+        "kis_retrieval": int(initial_retrieval_count),
+        "lambda_mmr": lambda_mmr,
+        "deadline_ms": int(deadline_ms) if deadline_ms else None,
+        "w_transcript": w_transcript,
+        "weights": {
+            'w_clip': w_clip,
+            'w_obj': w_obj, 
+            'w_semantic': w_semantic,
+            'w_spatial': w_spatial,
+            'w_fine_grained': w_fine_grained
         }
-        
-        start_time = time.time()
-        full_response = master_searcher.search(query=query_text, config=config)
-        search_time = time.time() - start_time
-        
+    }
+    start_time = time.time()
+    try:
+        for full_response in master_searcher.search_iter(query=query_text, config=config):
+            search_time = time.time() - start_time
+            gallery_paths = format_results_for_mute_gallery(full_response)
+            num_found = len(gallery_paths)
+            total_pages = int(np.ceil(num_found / ITEMS_PER_PAGE)) or 1
+            page_info = f"Trang 1 / {total_pages}"
+
+            if full_response.get('is_final', True):
+                task_type_msg = full_response.get('task_type', TaskType.KIS).value
+                metrics = full_response.get('metrics', {})
+                cache_msg = f" | ⚡ Cache (hit rate {metrics.get('cache_hit_rate', 0.0):.0%})" if metrics.get('cache_hit') else ""
+                if metrics.get('coalesced'):
+                    cache_msg = " | 🔗 Dùng chung kết quả với truy vấn giống hệt đang chạy"
+                degraded_stages = [name for name, status in full_response.get('stages', {}).items() if status != 'ran']
+                degraded_msg = f" | ⏱️ Rút gọn: {', '.join(degraded_stages)}" if degraded_stages else ""
+                status_msg = f"<div style='color: {'#166534' if num_found > 0 else '#d97706'};'>{'✅' if num_found > 0 else '😔'} **{task_type_msg}** | Tìm thấy {num_found} kết quả ({search_time:.2f}s){cache_msg}{degraded_msg}.</div>"
+            else:
+                stage_label = STAGE_LABELS.get(full_response.get('stage'), full_response.get('stage'))
+                status_msg = f"<div style='color: #2563eb;'>⏳ {stage_label} | {num_found} kết quả tạm thời ({search_time:.2f}s). Đang tinh chỉnh...</div>"
+
+            prefetch_result_clips(clip_prefetcher, request, full_response.get('results', [])[:CLIP_PREFETCH_TOP_N])
+            yield gallery_paths[:ITEMS_PER_PAGE], status_msg, full_response, gallery_paths, 1, page_info
+
     except Exception as e:
         traceback.print_exc()
-        return [], f"<div style='color: red;'>🔥 Lỗi backend: {e}</div>", None, [], 1, "Trang 1 / 1"
-    
-    gallery_paths = format_results_for_mute_gallery(full_response)
-    num_found = len(gallery_paths)
-    task_type_msg = full_response.get('task_type', TaskType.KIS).value
-    status_msg = f"<div style='color: {'#166534' if num_found > 0 else '#d97706'};'>{'✅' if num_found > 0 else '😔'} **{task_type_msg}** | Tìm thấy {num_found} kết quả ({search_time:.2f}s).</div>"
-    
-    initial_gallery_view = gallery_paths[:ITEMS_PER_PAGE]
-    total_pages = int(np.ceil(num_found / ITEMS_PER_PAGE)) or 1
-    page_info = f"Trang 1 / {total_pages}"
-    
-    return initial_gallery_view, status_msg, full_response, gallery_paths, 1, page_info
+        yield [], f"<div style='color: red;'>🔥 Lỗi backend: {e}</div>", None, [], 1, "Trang 1 / 1"
+
+TRANSCRIPT_DISPLAY_COLUMNS = {
+    'video_id': 'Video ID',
+    'fps': 'FPS',
+    'timestamp': 'Timestamp (s)',
+    'highlighted_text': 'Nội dung Lời thoại',
+    'keyframe_path': 'Keyframe Path'
+}
 
-def handle_transcript_search(query1: str, query2: str, query3: str, transcript_searcher, fps_map: dict):
+def handle_transcript_search(query1: str, query2: str, query3: str, mode: str, window_seconds: float, transcript_searcher, fps_map: dict):
+    """
+    Tìm kiếm transcript. Kết quả được giữ ở server dưới dạng mảng chỉ số dòng của
+    full_data (transcript_results_state); chỉ trang đầu tiên được tô sáng và gửi về giao diện.
+    """
     gr.Info("Bắt đầu điều tra transcript...")
-    results = None
-    if query1.strip(): results = transcript_searcher.search(query1, current_results=results)
-    if query2.strip(): results = transcript_searcher.search(query2, current_results=results)
-    if query3.strip(): results = transcript_searcher.search(query3, current_results=results)
-    
-    if results is None or results.empty:
-        return "Nhập truy vấn để bắt đầu hoặc không tìm thấy kết quả.", pd.DataFrame(), None
-        
-    count_str = f"Tìm thấy: {len(results)} kết quả."
-    results['fps'] = results['video_id'].map(fps_map).fillna('N/A')
+    empty_return = ("Nhập truy vấn để bắt đầu hoặc không tìm thấy kết quả.", pd.DataFrame(), None, 1, "Trang 1 / 1")
+    if transcript_searcher is None or transcript_searcher.full_data is None:
+        return empty_return
 
-    keywords_to_highlight = [q for q in [query1, query2, query3] if q and q.strip()]
-    if keywords_to_highlight:
-        results['highlighted_text'] = results['transcript_text'].apply(
-            lambda text: highlight_keywords(text, keywords_to_highlight)
-        )
+    rows, results = None, None
+    if mode == TRANSCRIPT_MODE_COOCCURRENCE:
+        # Các ô truy vấn được nói trong cùng video, cách nhau không quá window_seconds giây.
+        if any(q.strip() for q in [query1, query2, query3]):
+            results = transcript_searcher.search_cooccurrence([query1, query2, query3], window_seconds=window_seconds)
+    elif mode in (TRANSCRIPT_MODE_RANKED, TRANSCRIPT_MODE_HYBRID):
+        # Ô 1 là truy vấn xếp hạng chính; ô 2 và 3 (nếu có) thu hẹp tập dòng trước khi xếp hạng.
+        if query2.strip(): results = transcript_searcher.search(query2, current_results=results)
+        if query3.strip(): results = transcript_searcher.search(query3, current_results=results)
+        ranking_query = query1 if query1.strip() else " ".join(q for q in [query2, query3] if q.strip())
+        if ranking_query.strip() and (results is None or not results.empty):
+            if mode == TRANSCRIPT_MODE_HYBRID:
+                if transcript_searcher.semantic_index is None:
+                    gr.Warning("Chưa có chỉ mục ngữ nghĩa cho transcript. Chỉ dùng kết quả từ khóa.")
+                results = transcript_searcher.search_hybrid(ranking_query, top_n=TRANSCRIPT_TOP_N, current_results=results)
+            else:
+                results = transcript_searcher.search_ranked(ranking_query, top_n=TRANSCRIPT_TOP_N, current_results=results)
     else:
-        results['highlighted_text'] = results['transcript_text']
+        # Chế độ lọc có thể khớp hàng trăm nghìn dòng -> chỉ giao các mảng chỉ số dòng, không dựng DataFrame.
+        for query in [query1, query2, query3]:
+            if query.strip(): rows = transcript_searcher.search_rows(query, candidate_rows=rows)
+
+    if results is not None:
+        rows = results.index.to_numpy(dtype=np.int64)
+    if rows is None or len(rows) == 0:
+        return empty_return
         
-    display_df = results[['video_id', 'fps', 'timestamp', 'highlighted_text', 'keyframe_path']].copy()
-    
-    display_df.rename(columns={
-        'video_id': 'Video ID',
-        'fps': 'FPS', 
-        'timestamp': 'Timestamp (s)',
-        'highlighted_text': 'Nội dung Lời thoại',
-        'keyframe_path': 'Keyframe Path'
-    }, inplace=True)
-    
-    return count_str, display_df, results
+    if mode == TRANSCRIPT_MODE_COOCCURRENCE:
+        count_str = f"Tìm thấy: {len(rows)} dòng trong các đoạn đồng xuất hiện (cửa sổ ±{window_seconds:g}s)."
+    elif mode == TRANSCRIPT_MODE_HYBRID:
+        count_str = f"Top {len(rows)} kết quả theo Hybrid (BM25 + ngữ nghĩa, RRF)."
+    elif mode == TRANSCRIPT_MODE_RANKED:
+        count_str = f"Top {len(rows)} kết quả theo BM25 (điểm cao nhất: {results['bm25_score'].iloc[0]:.2f})."
+    else:
+        count_str = f"Tìm thấy: {len(rows)} kết quả."
+
+    results_state = {
+        "rows": rows,
+        "keywords": [q for q in [query1, query2, query3] if q and q.strip()]
+    }
+    display_df, page, page_info = render_transcript_page(results_state, 1, transcript_searcher, fps_map)
+    return count_str, display_df, results_state, page, page_info
+
+def render_transcript_page(results_state: Dict, page: int, transcript_searcher, fps_map: dict):
+    """
+    Dựng bảng hiển thị cho MỘT trang kết quả transcript: chỉ TRANSCRIPT_PAGE_SIZE dòng
+    được tô sáng và tuần tự hóa, nên payload không phụ thuộc vào tổng số kết quả.
+
+    Returns:
+        Tuple[pd.DataFrame, int, str]: (bảng của trang, số trang đã chuẩn hóa, "Trang x / y")
+    """
+    if not results_state or len(results_state["rows"]) == 0:
+        return pd.DataFrame(), 1, "Trang 1 / 1"
+    all_rows = results_state["rows"]
+    total_pages = int(np.ceil(len(all_rows) / TRANSCRIPT_PAGE_SIZE)) or 1
+    page = min(max(1, int(page)), total_pages)
+    page_rows = all_rows[(page - 1) * TRANSCRIPT_PAGE_SIZE: page * TRANSCRIPT_PAGE_SIZE]
+
+    page_df = transcript_searcher.full_data.iloc[page_rows][['video_id', 'timestamp', 'transcript_text', 'keyframe_path']].copy()
+    page_df['fps'] = page_df['video_id'].map(fps_map).fillna('N/A')
+    keywords = results_state["keywords"]
+    if transcript_searcher.index is not None:
+        page_df['highlighted_text'] = transcript_searcher.highlight_rows(page_rows, keywords)
+    elif keywords:
+        page_df['highlighted_text'] = page_df['transcript_text'].apply(lambda text: highlight_keywords(text, keywords))
+    else:
+        page_df['highlighted_text'] = page_df['transcript_text']
+
+    display_df = page_df[list(TRANSCRIPT_DISPLAY_COLUMNS)].rename(columns=TRANSCRIPT_DISPLAY_COLUMNS)
+    return display_df, page, f"Trang {page} / {total_pages}"
+
+def update_transcript_page(results_state: Dict, current_page: int, direction: str, transcript_searcher, fps_map: dict):
+    new_page = current_page + 1 if direction == "▶️ Trang sau" else current_page - 1
+    return render_transcript_page(results_state, new_page, transcript_searcher, fps_map)
 
 def clear_transcript_search():
-    return "", "", "", "Tìm thấy: 0 kết quả.", pd.DataFrame(), None
+    return "", "", "", "Tìm thấy: 0 kết quả.", pd.DataFrame(), None, 1, "Trang 1 / 1"
+
+def _transcript_row_id(results_state: Optional[Dict], current_page: int, page_index: int) -> Optional[int]:
+    """Chuyển chỉ số dòng trong trang đang hiển thị thành chỉ số dòng của full_data."""
+    if not results_state:
+        return None
+    global_index = (current_page - 1) * TRANSCRIPT_PAGE_SIZE + page_index
+    if global_index < 0 or global_index >= len(results_state["rows"]):
+        return None
+    return int(results_state["rows"][global_index])
 
 
 def on_gallery_select(response_state: Dict, current_page: int, query_text: str, transcript_searcher, evt: gr.SelectData):
@@ -166,9 +288,7 @@ def on_gallery_select(response_state: Dict, current_page: int, query_text: str,
     keyframe_path = selected_result.get('keyframe_path')
     timestamp = selected_result.get('timestamp', 0.0)
     
-    full_transcript = get_full_transcript_for_video(video_id, transcript_searcher)
-    
-    highlighted_transcript = highlight_keywords(full_transcript, [query_text])
+    highlighted_transcript = get_highlighted_transcript_for_video(video_id, [query_text], transcript_searcher, as_phrases=True)
     
     video_clip_path = create_video_segment(video_path, timestamp, duration=30)
     analysis_html = create_detailed_info_html(selected_result, response_state.get("task_type"))
@@ -183,13 +303,14 @@ def on_gallery_select(response_state: Dict, current_page: int, query_text: str,
         video_id, f"{timestamp:.2f}", None
     )
 
-def on_transcript_select(results_state: pd.DataFrame, video_path_map: dict, transcript_searcher, query1: str, query2: str, query3: str, evt: gr.SelectData):
+def on_transcript_select(results_state: Dict, current_page: int, video_path_map: dict, transcript_searcher, query1: str, query2: str, query3: str, evt: gr.SelectData):
     empty_return = clear_analysis_panel()
-    if evt.value is None or results_state is None or results_state.empty: return empty_return
+    if evt.value is None or not results_state: return empty_return
     
     try:
-        selected_index = evt.index[0]
-        selected_row = results_state.iloc[selected_index]
+        selected_index = _transcript_row_id(results_state, current_page, evt.index[0])
+        if selected_index is None: return empty_return
+        selected_row = transcript_searcher.full_data.iloc[selected_index]
         video_id = selected_row['video_id']
         timestamp = selected_row['timestamp']
         keyframe_path = selected_row['keyframe_path']
@@ -204,9 +325,8 @@ def on_transcript_select(results_state: pd.DataFrame, video_path_map: dict, tran
             gr.Error(f"Không tìm thấy đường dẫn cho video ID: {video_id}")
             return empty_return
 
-        full_transcript = get_full_transcript_for_video(video_id, transcript_searcher)
         keywords_to_highlight = [q for q in [query1, query2, query3] if q and q.strip()]
-        highlighted_transcript = highlight_keywords(full_transcript, keywords_to_highlight)
+        highlighted_transcript = get_highlighted_transcript_for_video(video_id, keywords_to_highlight, transcript_searcher)
         video_clip_path = create_video_segment(video_path, timestamp, duration=30)
         
         candidate_for_submission = {
@@ -250,13 +370,14 @@ def add_to_submission_list(submission_list: list, candidate: dict, position: str
     
     return submission_list, format_submission_list_to_csv_string(submission_list, fps_map)
 
-def add_transcript_result_to_submission(submission_list: list, results_state: pd.DataFrame, selected_index: int, position: str, fps_map: dict):
-    if selected_index is None or results_state is None or results_state.empty:
+def add_transcript_result_to_submission(submission_list: list, results_state: Dict, selected_index: int, position: str, transcript_searcher, fps_map: dict):
+    """`selected_index` là chỉ số dòng trong full_data (do on_transcript_select đặt)."""
+    if selected_index is None or not results_state:
         gr.Warning("Chưa có kết quả Transcript nào được chọn để thêm!")
         return submission_list, format_submission_list_to_csv_string(submission_list, fps_map)
     
     try:
-        selected_row = results_state.iloc[selected_index]
+        selected_row = transcript_searcher.full_data.iloc[selected_index]
         candidate = {
             "video_id": selected_row['video_id'], "timestamp": selected_row['timestamp'],
             "keyframe_id": os.path.basename(selected_row['keyframe_path']).replace('.jpg', ''),
@@ -294,13 +415,16 @@ def handle_submission(submission_text: str, query_id: str):
         gr.Error(f"Lỗi khi xử lý nội dung nộp bài: {e}. Hãy kiểm tra lại định dạng CSV.")
         return None
 
-def update_gallery_page(gallery_items: list, current_page: int, direction: str):
+def update_gallery_page(gallery_items: list, current_page: int, direction: str, response_state: Dict = None,
+                        clip_prefetcher=None, request: gr.Request = None):
     if not gallery_items: return [], 1, "Trang 1 / 1"
     total_items = len(gallery_items)
     total_pages = int(np.ceil(total_items / ITEMS_PER_PAGE)) or 1
     new_page = min(total_pages, current_page + 1) if direction == "▶️ Trang sau" else max(1, current_page - 1)
     start_index = (new_page - 1) * ITEMS_PER_PAGE
     end_index = start_index + ITEMS_PER_PAGE
+    if response_state:
+        prefetch_result_clips(clip_prefetcher, request, response_state.get("results", [])[start_index:end_index])
     return gallery_items[start_index:end_index], new_page, f"Trang {new_page} / {total_pages}"
 
 def calculate_frame_number(video_id: str, time_input: str, fps_map: dict):
@@ -320,20 +444,62 @@ def calculate_frame_number(video_id: str, time_input: str, fps_map: dict):
         return f"Lỗi: Định dạng thời gian '{time_input}' không hợp lệ."
 
 
+def handle_frame_strip(selected_candidate: Dict, fps_map: dict):
+    """
+    Dựng dải khung hình quanh thời điểm của ứng viên đang chọn (một lần giải mã ffmpeg),
+    kèm số frame chính xác theo fps_map, để chọn khung đúng mà không phải cắt clip lại nhiều lần.
+    """
+    if not selected_candidate or not isinstance(selected_candidate, dict):
+        gr.Warning("Vui lòng chọn một kết quả trước khi trích dải khung hình.")
+        return None, None
+    video_id = selected_candidate.get('video_id')
+    video_path = selected_candidate.get('video_path')
+    timestamp = float(selected_candidate.get('timestamp', 0.0))
+    if not video_path or not os.path.exists(video_path):
+        gr.Warning(f"Không tìm thấy file video nguồn cho: {video_id}")
+        return None, None
+
+    fps = fps_map.get(video_id, 30.0)
+    strip = extract_frame_strip(video_path, timestamp, fps=fps)
+    if not strip:
+        gr.Warning("Không trích được dải khung hình cho kết quả này.")
+        return None, None
+
+    center_frame = round(timestamp * fps)
+    gallery_items = [
+        (image, f"{'🎯 ' if frame_number == center_frame else ''}#{frame_number} @ {frame_time:.2f}s")
+        for image, frame_number, frame_time in strip
+    ]
+    strip_state = {
+        "video_id": video_id,
+        "frames": [(frame_number, frame_time) for _, frame_number, frame_time in strip]
+    }
+    return gallery_items, strip_state
+
+def on_frame_strip_select(strip_state: Dict, evt: gr.SelectData):
+    """Điền Video ID, thời gian và Frame Index của khung được chọn vào Máy tính Frame."""
+    if not strip_state or evt is None or evt.index >= len(strip_state.get("frames", [])):
+        return gr.update(), gr.update(), gr.update()
+    frame_number, frame_time = strip_state["frames"][evt.index]
+    return strip_state["video_id"], f"{frame_time:.3f}", str(frame_number)
+
+
 def clear_all():
     return (
         "", gr.Gallery(value=None), "", None, [], 1, "Trang 1 / 1",
-        "", "", "", "Tìm thấy: 0 kết quả.", pd.DataFrame(), None,
+        "", "", "", "Tìm thấy: 0 kết quả.", pd.DataFrame(), None, 1, "Trang 1 / 1",
         None, None, "", "", None, 
         [], "",
         "", "", "",
+        None, None,
         "", None
     )
     
 def handle_view_full_video(selected_candidate: Dict):
     """
-    Sao chép video gốc từ /kaggle/input sang /kaggle/working để phát.
-    Phiên bản này có log chi tiết để theo dõi quá trình.
+    Phát trực tiếp video gốc: các thư mục VIDEO_BASE_PATHS được đăng ký là static path
+    (gr.set_static_paths trong app.py) nên Gradio phục vụ file tại chỗ, không băm hay sao chép
+    vào cache của nó. Phiên bản này có log chi tiết để theo dõi quá trình.
     """
     print("\n" + "="*20 + " LOG: Tải Video Gốc " + "="*20)
     
@@ -354,35 +520,8 @@ def handle_view_full_video(selected_candidate: Dict):
         print("="*60 + "\n")
         return None
 
-    destination_dir = "/kaggle/working/temp_full_videos"
-    os.makedirs(destination_dir, exist_ok=True)
-    destination_path = os.path.join(destination_dir, os.path.basename(source_path))
-    print(f"   -> Đường dẫn đích (destination): '{destination_path}'")
-
-    if not os.path.exists(destination_path):
-        gr.Info(f"Đang sao chép video '{os.path.basename(source_path)}'...")
-        print(f"   -> File chưa tồn tại ở đích. Bắt đầu sao chép...")
-        
-        start_time = time.time() 
-        try:
-            shutil.copy(source_path, destination_path)
-            end_time = time.time() 
-            elapsed_time = end_time - start_time
-            
-            gr.Success("Sao chép hoàn tất! Bắt đầu phát video.")
-            print(f"   -> ✅ Sao chép thành công sau {elapsed_time:.2f} giây.")
-
-        except Exception as e:
-            gr.Error(f"Lỗi khi sao chép video: {e}")
-            print(f"   -> ❌ LỖI trong quá trình sao chép: {e}")
-            print("="*60 + "\n")
-            return None
-    else:
-        gr.Info("Video đã có sẵn trong cache, bắt đầu phát.")
-        print("   -> File đã tồn tại ở đích. Bỏ qua bước sao chép.")
-
-    print(f"-> Hoàn tất. Trả về đường dẫn '{destination_path}' cho Gradio.")
+    print(f"-> Hoàn tất. Trả về đường dẫn nguồn '{source_path}' cho Gradio (static path, không sao chép).")
     print("="*60 + "\n")
     
-    return gr.Video(value=destination_path, label=f"Video Gốc: {os.path.basename(source_path)}")
+    return gr.Video(value=source_path, label=f"Video Gốc: {os.path.basename(source_path)}")
 
@@ -1,11 +1,15 @@
 # /search_core/basic_searcher.py
 
+import threading
+from collections import OrderedDict
 import faiss
 import pandas as pd
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from typing import List, Dict
 
+from utils.temporal_utils import VideoTimelineIndex
+
 class BasicSearcher:
     """
     BasicSearcher: Động cơ Retrieval Nền tảng (Core Retrieval Engine).
@@ -21,13 +25,17 @@ class BasicSearcher:
                  faiss_index_path: str, 
                  metadata_path: str, 
                  clip_model_name: str = 'clip-ViT-B-32',
-                 device: str = "cuda"):
+                 device: str = "cuda",
+                 embedding_cache_size: int = 4096):
         """
         Khởi tạo BasicSearcher.
         Tải tất cả các tài nguyên cần thiết vào bộ nhớ.
         """
         print("--- 🔍 Khởi tạo BasicSearcher (Core Retrieval Engine - Phoenix Edition)... ---")
         self.device = device
+        self.embedding_cache_size = embedding_cache_size
+        self._embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._embedding_lock = threading.Lock()
         try:
             print(f"   -> Đang tải FAISS index từ: {faiss_index_path}")
             self.index = faiss.read_index(faiss_index_path)
@@ -37,6 +45,8 @@ class BasicSearcher:
                 columns=['keyframe_id', 'video_id', 'timestamp', 'keyframe_path']
             )
             print(f"--- ✅ Tải thành công {self.index.ntotal} vector và metadata tương ứng. ---")
+            self.timeline = VideoTimelineIndex.from_dataframe(self.metadata)
+            print(f"   -> Đã dựng chỉ mục thời gian cho {len(self.timeline.video_ids)} video.")
             print(f"   -> Đang tải CLIP model: {clip_model_name} lên {self.device}")
             self.model = SentenceTransformer(clip_model_name, device=self.device)
             print("--- ✅ Tải CLIP model thành công. BasicSearcher sẵn sàng hoạt động! ---")
@@ -48,6 +58,58 @@ class BasicSearcher:
             print(f"--- ❌ Lỗi không xác định khi khởi tạo BasicSearcher: {e} ---")
             raise e
 
+    def encode_queries(self, query_texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """
+        Mã hóa nhiều truy vấn văn bản trong MỘT lần gọi model (theo batch) và cache lại.
+        Các truy vấn đã có trong cache sẽ không bị mã hóa lại.
+
+        Args:
+            query_texts (List[str]): Danh sách truy vấn.
+            batch_size (int): Kích thước batch khi gọi model.
+
+        Returns:
+            np.ndarray: Ma trận (len(query_texts), dim) các vector đã chuẩn hóa L2 (float32).
+        """
+        vectors: Dict[str, np.ndarray] = {}
+        with self._embedding_lock:
+            for text in query_texts:
+                cached_vector = self._embedding_cache.get(text)
+                if cached_vector is not None:
+                    vectors[text] = cached_vector
+                    self._embedding_cache.move_to_end(text)
+        missing = [text for text in dict.fromkeys(query_texts) if text not in vectors]
+        if missing:
+            embeddings = self.model.encode(
+                missing,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                device=self.device,
+                show_progress_bar=len(missing) > batch_size
+            ).astype('float32')
+            embeddings = np.ascontiguousarray(embeddings.reshape(len(missing), -1))
+            faiss.normalize_L2(embeddings)
+            with self._embedding_lock:
+                for text, vector in zip(missing, embeddings):
+                    vectors[text] = vector
+                    self._embedding_cache[text] = vector
+                while len(self._embedding_cache) > self.embedding_cache_size:
+                    self._embedding_cache.popitem(last=False)
+        return np.stack([vectors[text] for text in query_texts]).astype('float32')
+
+    def _build_results(self, distances: np.ndarray, indices: np.ndarray) -> List[Dict]:
+        """
+        Chuyển một hàng kết quả FAISS (distances, indices) thành danh sách dictionary metadata.
+        """
+        results = []
+        for idx, distance in zip(indices, distances):
+            if idx < 0:
+                continue
+            meta_info = self.metadata.iloc[idx].to_dict()
+            meta_info['clip_score'] = float(distance)
+            meta_info['original_index'] = int(idx)
+            results.append(meta_info)
+        return results
+
     def search(self, query_text: str, top_k: int) -> List[Dict]:
         """
         Thực hiện tìm kiếm vector trên FAISS index.
@@ -61,22 +123,94 @@ class BasicSearcher:
         """
         if not query_text or not query_text.strip():
             return []
-        query_embedding = self.model.encode(
-            query_text, 
-            convert_to_tensor=True, 
-            device=self.device,
-            show_progress_bar=False 
-        )
-        query_embedding_np = query_embedding.cpu().numpy().reshape(1, -1)
-        faiss.normalize_L2(query_embedding_np)
+        query_embedding_np = self.encode_queries([query_text])
         distances, indices = self.index.search(query_embedding_np, top_k)
-        results = []
-        result_indices = indices[0]
-        result_distances = distances[0]
-        for i in range(len(result_indices)):
-            idx = result_indices[i]
-            meta_info = self.metadata.iloc[idx].to_dict()
-            meta_info['clip_score'] = float(result_distances[i])
-            meta_info['original_index'] = int(idx)
-            results.append(meta_info)
-        return results
\ No newline at end of file
+        return self._build_results(distances[0], indices[0])
+
+    def search_batch(self, query_texts: List[str], top_k: int) -> List[List[Dict]]:
+        """
+        Tìm kiếm nhiều truy vấn cùng lúc: mã hóa tất cả trong một batch và gọi FAISS
+        một lần với ma trận truy vấn.
+
+        Returns:
+            List[List[Dict]]: Kết quả tương ứng với từng truy vấn (truy vấn rỗng -> []).
+        """
+        valid_positions = [i for i, text in enumerate(query_texts) if text and text.strip()]
+        all_results: List[List[Dict]] = [[] for _ in query_texts]
+        if not valid_positions:
+            return all_results
+        query_matrix = self.encode_queries([query_texts[i] for i in valid_positions])
+        distances, indices = self.index.search(query_matrix, top_k)
+        for row, position in enumerate(valid_positions):
+            all_results[position] = self._build_results(distances[row], indices[row])
+        return all_results
+
+    def _reconstruct_rows(self, row_ids: np.ndarray) -> np.ndarray:
+        """
+        Lấy lại vector gốc của các dòng trong FAISS index (float32, shape (n, dim)).
+        Với index IVF, direct map sẽ được bật ở lần gọi đầu tiên.
+        """
+        row_ids = np.ascontiguousarray(row_ids, dtype='int64')
+        try:
+            return self.index.reconstruct_batch(row_ids)
+        except RuntimeError:
+            if not hasattr(self.index, 'make_direct_map'):
+                raise
+            self.index.make_direct_map()
+            return self.index.reconstruct_batch(row_ids)
+
+    def score_rows(self, query_text: str, row_ids: np.ndarray) -> List[Dict]:
+        """
+        Chấm điểm CLIP của truy vấn cho các dòng cho trước (không qua FAISS search),
+        ví dụ các keyframe chỉ được tìm thấy qua transcript. Giữ nguyên thứ tự `row_ids`.
+        """
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        if len(row_ids) == 0 or not query_text or not query_text.strip():
+            return []
+        query_vector = self.encode_queries([query_text])[0]
+        return self._build_results(self._reconstruct_rows(row_ids) @ query_vector, row_ids)
+
+    def search_within_videos(self,
+                             query_texts: List[str],
+                             video_min_timestamps: Dict[str, float],
+                             top_k_per_video: int
+                            ) -> List[List[Dict]]:
+        """
+        Tìm kiếm giới hạn trong một tập video (dùng cho các bước sau của TRAKE).
+
+        Chỉ xét các keyframe thuộc video trong `video_min_timestamps` và có timestamp
+        lớn hơn mốc tương ứng của video đó; chấm điểm trực tiếp bằng tích vô hướng
+        với vector gốc trong index, rồi lấy top-N keyframe cho MỖI video.
+
+        Args:
+            query_texts (List[str]): Danh sách truy vấn (mã hóa trong một batch).
+            video_min_timestamps (Dict[str, float]): {video_id: timestamp mốc (giây)}.
+            top_k_per_video (int): Số keyframe tối đa giữ lại cho mỗi video.
+
+        Returns:
+            List[List[Dict]]: Kết quả cho từng truy vấn, sắp xếp theo clip_score giảm dần.
+        """
+        all_results: List[List[Dict]] = [[] for _ in query_texts]
+        if not query_texts or not video_min_timestamps or top_k_per_video <= 0:
+            return all_results
+
+        row_groups = [self.timeline.rows_after(video_id, t) for video_id, t in video_min_timestamps.items()]
+        row_ids = np.concatenate(row_groups) if row_groups else np.empty(0, dtype=np.int64)
+        if len(row_ids) == 0:
+            return all_results
+        video_codes = np.repeat(np.arange(len(row_groups)), [len(rows) for rows in row_groups])
+
+        query_matrix = self.encode_queries(query_texts)
+        scores_matrix = self._reconstruct_rows(row_ids) @ query_matrix.T
+
+        for q in range(len(query_texts)):
+            scores = scores_matrix[:, q]
+            order = np.lexsort((-scores, video_codes))
+            sorted_codes = video_codes[order]
+            group_start = np.searchsorted(sorted_codes, sorted_codes, side='left')
+            rank_in_video = np.arange(len(order)) - group_start
+            selected = order[rank_in_video < top_k_per_video]
+            selected = selected[np.argsort(-scores[selected], kind='stable')]
+            all_results[q] = self._build_results(scores[selected], row_ids[selected])
+        return all_results
+
@@ -1,10 +1,11 @@
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
-from typing import Dict, Any, List, Set
+from typing import Dict, Any, List, Set, Optional
 import json
 import re
 
-from utils import api_retrier
+from utils import api_retrier, RateLimiter
+from utils.singleflight import SingleFlight, make_request_key
 
 class GeminiTextHandler:
     """
@@ -19,7 +20,10 @@ class GeminiTextHandler:
         
         try:
             genai.configure(api_key=api_key)
+            self.model_name = model_name
             self.model = genai.GenerativeModel(model_name)
+            self._inflight = SingleFlight()
+            self.rate_limiter: Optional[RateLimiter] = None
             self.known_entities_prompt_segment: str = "[]" 
             self.generation_config = {
                 "temperature": 0.1,
@@ -94,9 +98,22 @@ class GeminiTextHandler:
     Now, analyze the user's query and provide ONLY the JSON output, strictly following these rules.
     """
 
-    @api_retrier(max_retries=3, initial_delay=1)
     def _gemini_api_call(self, content_list: list) -> genai.GenerativeModel.generate_content:
+        """
+        Thực hiện lệnh gọi API của Gemini. Các prompt giống hệt nhau được gửi
+        đồng thời (từ nhiều phiên/luồng) sẽ được gộp lại và chỉ gửi đi một lần.
+        """
+        key = make_request_key(self.model_name, content_list, self.generation_config)
+        response, shared = self._inflight.do(key, self._gemini_api_call_with_retry, content_list)
+        if shared:
+            print("--- 🔗 Gemini: Dùng chung kết quả với một request giống hệt đang chạy. ---")
+        return response
+
+    @api_retrier(max_retries=3, initial_delay=1)
+    def _gemini_api_call_with_retry(self, content_list: list) -> genai.GenerativeModel.generate_content:
         """Hàm con được "trang trí", chuyên thực hiện lệnh gọi API của Gemini."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
         return self.model.generate_content(
             content_list,
             generation_config=self.generation_config,
@@ -1,9 +1,14 @@
 # search_core/master_searcher.py
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Iterator, Tuple
 import os
+import re
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+import threading
+import unicodedata
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
 import numpy as np
+import pandas as pd
 from tqdm import tqdm
 from search_core.basic_searcher import BasicSearcher
 from search_core.semantic_searcher import SemanticSearcher
@@ -12,6 +17,35 @@ from search_core.gemini_text_handler import GeminiTextHandler
 from search_core.openai_handler import OpenAIHandler
 from search_core.task_analyzer import TaskType
 from search_core.mmr_builder import MMRResultBuilder 
+from utils.temporal_utils import deduplicate_temporally
+from utils.cache_manager import SearchResultCache
+from utils.singleflight import SingleFlight
+from utils.deadline import Deadline
+
+# Các khóa config thực sự ảnh hưởng đến kết quả tìm kiếm (dùng để tạo cache key).
+RESULT_AFFECTING_CONFIG_KEYS = (
+    'top_k_final', 'kis_retrieval', 'vqa_candidates', 'vqa_retrieval',
+    'trake_candidates_per_step', 'trake_max_sequences', 'trake_min_gap', 'trake_max_gap',
+    'trake_video_scoped', 'trake_per_video',
+    'w_clip', 'w_obj', 'w_semantic', 'lambda_mmr', 'weights', 'w_transcript',
+)
+
+# Chi phí ước tính tối thiểu (ms) của từng stage tùy chọn khi chạy với config['deadline_ms'].
+STAGE_MIN_BUDGET_MS = {
+    'llm_analysis': 2500,
+    'grounding_entities': 1500,
+    'grounding_objects': 1500,
+    'trake': 8000,
+    'fine_grained': 1500,
+    'vqa': 3000,
+}
+# Thời gian luôn chừa lại cho các stage bắt buộc (CLIP retrieval, spatial, xếp hạng).
+CORE_RESERVE_MS = 500
+# Số lời gọi LLM (phân tích, grounding) được chạy đồng thời trên pool riêng của các stage LLM.
+LLM_STAGE_WORKERS = 4
+DEGRADED_STAGE_STATUSES = ('skipped', 'timeout', 'partial', 'failed')
+# Hằng số k của Reciprocal Rank Fusion khi hợp nhất kết quả CLIP và transcript.
+TRANSCRIPT_RRF_K = 60
 
 
 class MasterSearcher:
@@ -28,7 +62,10 @@ class MasterSearcher:
                  openai_api_key: Optional[str] = None,
                  entities_path: str = None,
                  clip_features_path: str = None,
-                 video_path_map: dict = None):
+                 video_path_map: dict = None,
+                 transcript_searcher=None,
+                 result_cache_max_bytes: int = 256 * 1024 * 1024,
+                 result_cache_ttl: float = 1800.0):
         """
         Khởi tạo MasterSearcher và hệ sinh thái AI lai.
         """
@@ -46,6 +83,12 @@ class MasterSearcher:
         else:
             print("--- ⚠️ Không tìm thấy file CLIP features, MMR sẽ không hoạt động. ---")
         self.video_path_map = video_path_map
+        self._link_transcripts(transcript_searcher)
+        self.result_cache = SearchResultCache(max_bytes=result_cache_max_bytes, ttl_seconds=result_cache_ttl)
+        self._search_flight = SingleFlight()
+        self._transcript_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="transcript")
+        self._llm_executor = ThreadPoolExecutor(max_workers=LLM_STAGE_WORKERS, thread_name_prefix="llm_stage")
+        self._llm_slots = threading.BoundedSemaphore(LLM_STAGE_WORKERS)
         self.gemini_handler: Optional[GeminiTextHandler] = None
         self.openai_handler: Optional[OpenAIHandler] = None
         self.trake_solver: Optional[TRAKESolver] = None
@@ -84,6 +127,145 @@ class MasterSearcher:
 
         print(f"--- ✅ Master Searcher đã sẵn sàng! (AI Enabled: {self.ai_enabled}) ---")
         
+    def _link_transcripts(self, transcript_searcher) -> None:
+        """
+        Nối các dòng transcript với keyframe trong FAISS index qua keyframe_path:
+        _transcript_keyframe_rows[dòng transcript] -> dòng FAISS và _keyframe_transcript_rows
+        theo chiều ngược lại (-1 nếu không có).
+        """
+        self.transcript_searcher = None
+        self._transcript_keyframe_rows: Optional[np.ndarray] = None
+        self._keyframe_transcript_rows: Optional[np.ndarray] = None
+        if transcript_searcher is None or transcript_searcher.full_data is None:
+            return
+        metadata = self.semantic_searcher.basic_searcher.metadata
+        keyframe_rows = pd.Series(np.arange(len(metadata)), index=metadata['keyframe_path'].to_numpy())
+        keyframe_rows = keyframe_rows[~keyframe_rows.index.duplicated()]
+        transcript_keyframe_rows = (
+            keyframe_rows.reindex(transcript_searcher.full_data['keyframe_path'].to_numpy())
+            .fillna(-1).to_numpy(dtype=np.int64)
+        )
+        linked = np.flatnonzero(transcript_keyframe_rows >= 0)
+        keyframe_transcript_rows = np.full(len(metadata), -1, dtype=np.int64)
+        keyframe_transcript_rows[transcript_keyframe_rows[linked]] = linked
+
+        self.transcript_searcher = transcript_searcher
+        self._transcript_keyframe_rows = transcript_keyframe_rows
+        self._keyframe_transcript_rows = keyframe_transcript_rows
+        print(f"--- 🔗 Đã nối {len(linked)}/{len(transcript_keyframe_rows)} dòng transcript với keyframe. ---")
+
+    def _attach_transcript_text(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Gắn 'transcript_text' (lời thoại tại keyframe) cho các ứng viên chưa có."""
+        if self._keyframe_transcript_rows is None:
+            return candidates
+        texts = self.transcript_searcher.full_data['transcript_text'].to_numpy()
+        for cand in candidates:
+            keyframe_row = cand.get('original_index')
+            if cand.get('transcript_text') or keyframe_row is None:
+                continue
+            transcript_row = self._keyframe_transcript_rows[keyframe_row]
+            if transcript_row >= 0:
+                cand['transcript_text'] = texts[transcript_row]
+        return candidates
+
+    @staticmethod
+    def _weighted_rrf(visual_rank: Optional[int], transcript_rank: Optional[int], w_transcript: float) -> float:
+        """(1 - w) / (k + hạng CLIP) + w / (k + hạng transcript); hạng None không đóng góp."""
+        score = 0.0
+        if visual_rank is not None:
+            score += (1.0 - w_transcript) / (TRANSCRIPT_RRF_K + visual_rank)
+        if transcript_rank is not None:
+            score += w_transcript / (TRANSCRIPT_RRF_K + transcript_rank)
+        return score
+
+    def _retrieve_transcript(self, query: str, top_n: int) -> Dict[int, Tuple[int, float]]:
+        """
+        Truy xuất transcript (Hybrid BM25 + ngữ nghĩa nếu có chỉ mục ngữ nghĩa, ngược lại BM25)
+        rồi quy về keyframe.
+
+        Returns:
+            Dict[int, Tuple[int, float]]: {dòng FAISS: (hạng bắt đầu từ 1, điểm transcript)}.
+        """
+        if self.transcript_searcher.semantic_index is not None:
+            ranked_df = self.transcript_searcher.search_hybrid(query, top_n=top_n)
+            score_column = 'hybrid_score'
+        else:
+            ranked_df = self.transcript_searcher.search_ranked(query, top_n=top_n)
+            score_column = 'bm25_score'
+        hits: Dict[int, Tuple[int, float]] = {}
+        if ranked_df.empty:
+            return hits
+        keyframe_rows = self._transcript_keyframe_rows[ranked_df.index.to_numpy()]
+        for keyframe_row, score in zip(keyframe_rows.tolist(), ranked_df[score_column].tolist()):
+            if keyframe_row >= 0 and keyframe_row not in hits:
+                hits[keyframe_row] = (len(hits) + 1, float(score))
+        return hits
+
+    def _retrieve_fused(self, clip_query: str, transcript_query: str, top_k: int, w_transcript: float,
+                        deadline: Deadline, stages: Dict[str, str],
+                        clip_candidates: Optional[List[Dict[str, Any]]] = None
+                       ) -> Tuple[List[Dict[str, Any]], Dict[int, Tuple[int, float]]]:
+        """
+        Tầng 1 lai: truy xuất CLIP và transcript chạy SONG SONG, rồi hợp nhất theo keyframe
+        bằng weighted RRF. Keyframe chỉ được tìm thấy qua transcript sẽ được chấm điểm CLIP
+        trực tiếp để các tầng rerank phía sau vẫn dùng được.
+        Truy xuất transcript chạy trên pool riêng và chỉ được chờ trong giới hạn deadline;
+        nếu quá hạn hoặc lỗi thì chỉ dùng kết quả CLIP.
+
+        Returns:
+            Tuple: (Top-K ứng viên theo điểm RRF, hits transcript của _retrieve_transcript)
+        """
+        basic_searcher = self.semantic_searcher.basic_searcher
+        transcript_future = self._transcript_executor.submit(self._retrieve_transcript, transcript_query, top_k)
+        if clip_candidates is None:
+            clip_candidates = basic_searcher.search(clip_query, top_k=top_k)
+        clip_candidates = clip_candidates[:top_k]
+        try:
+            transcript_hits = transcript_future.result(timeout=deadline.timeout_s(reserve_ms=CORE_RESERVE_MS))
+            stages['transcript'] = 'ran'
+        except FutureTimeoutError:
+            transcript_future.cancel()
+            print("--- ⏱️ Truy xuất transcript quá hạn. Chỉ dùng kết quả CLIP. ---")
+            stages['transcript'] = 'timeout'
+            return clip_candidates, {}
+        except Exception as e:
+            print(f"--- ⚠️ Lỗi khi truy xuất transcript: {e}. Chỉ dùng kết quả CLIP. ---")
+            stages['transcript'] = 'failed'
+            return clip_candidates, {}
+
+        visual_ranks = {cand['original_index']: rank for rank, cand in enumerate(clip_candidates, 1)}
+        candidates_by_row = {cand['original_index']: cand for cand in clip_candidates}
+        transcript_only_rows = [row for row in transcript_hits if row not in candidates_by_row]
+        for cand in basic_searcher.score_rows(clip_query, transcript_only_rows):
+            candidates_by_row[cand['original_index']] = cand
+
+        fused_rows = sorted(
+            candidates_by_row,
+            key=lambda row: self._weighted_rrf(visual_ranks.get(row), transcript_hits.get(row, (None,))[0], w_transcript),
+            reverse=True
+        )[:top_k]
+        print(f"--- 🎙️ Hợp nhất CLIP ({len(clip_candidates)}) + transcript ({len(transcript_hits)}) "
+              f"-> {len(fused_rows)} ứng viên ({len(transcript_only_rows)} chỉ có từ transcript). ---")
+        return [dict(candidates_by_row[row]) for row in fused_rows], transcript_hits
+
+    def _fuse_transcript_ranks(self, candidates: List[Dict[str, Any]], transcript_hits: Dict[int, Tuple[int, float]],
+                               w_transcript: float) -> List[Dict[str, Any]]:
+        """
+        Xếp hạng cuối bằng weighted RRF giữa thứ hạng sau rerank thị giác và thứ hạng transcript.
+        Điểm RRF (thang rất nhỏ, ~1/k) chỉ dùng làm khóa sắp xếp và được lưu trong scores['rrf'];
+        final_score vẫn là điểm thị giác để hiển thị cùng thang với các truy vấn không có transcript.
+        """
+        if not transcript_hits:
+            return candidates
+        for rank, cand in enumerate(candidates, 1):
+            hit = transcript_hits.get(cand.get('original_index'))
+            cand['scores'] = {
+                **cand.get('scores', {}),
+                'transcript_score': hit[1] if hit else 0.0,
+                'rrf': self._weighted_rrf(rank, hit[0] if hit else None, w_transcript)
+            }
+        return sorted(candidates, key=lambda x: x['scores']['rrf'], reverse=True)
+
     def perform_semantic_grounding(self, entities_to_ground: List[str]) -> Dict[str, str]:
         """
         Dịch các nhãn entity tự do về các nhãn chuẩn có trong từ điển.
@@ -115,6 +297,8 @@ class MasterSearcher:
     def _deduplicate_temporally(self, results: List[Dict[str, Any]], time_threshold: int = 5) -> List[Dict[str, Any]]:
         """
         Lọc các kết quả bị trùng lặp về mặt thời gian trong cùng một video.
+        Một frame chỉ được giữ nếu không có frame nào điểm cao hơn đã được giữ
+        trong cùng video cách nó <= time_threshold giây (tính vector hóa bằng NumPy).
 
         Args:
             results (List[Dict[str, Any]]): Danh sách kết quả đã được sắp xếp theo điểm.
@@ -127,61 +311,347 @@ class MasterSearcher:
         if not results:
             return []
         print(f"--- 🛡️ Bắt đầu Lọc Trùng lặp Thời gian (Ngưỡng: {time_threshold}s)... ---")
-        last_timestamp_per_video = {}
-        deduplicated_results = []
-        for result in results:
-            video_id = result.get('video_id')
-            timestamp = result.get('timestamp')
-            if not video_id or timestamp is None:
-                continue 
-            last_seen_timestamp = last_timestamp_per_video.get(video_id)
-            if last_seen_timestamp is None or abs(timestamp - last_seen_timestamp) > time_threshold:
-                deduplicated_results.append(result)
-                last_timestamp_per_video[video_id] = timestamp
-        
+        deduplicated_results = deduplicate_temporally(results, time_threshold=time_threshold)
         print(f"--- ✅ Lọc hoàn tất. Từ {len(results)} -> còn {len(deduplicated_results)} kết quả. ---")
         return deduplicated_results
 
-    def search(self, query: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """Chuẩn hóa query để các biến thể chỉ khác khoảng trắng/hoa-thường dùng chung cache."""
+        normalized = unicodedata.normalize('NFC', query or '')
+        return re.sub(r'\s+', ' ', normalized).strip().lower()
+
+    def _build_cache_key(self, query: str, config: Dict[str, Any]) -> str:
+        """Tạo cache key từ query đã chuẩn hóa và các giá trị config ảnh hưởng đến kết quả."""
+        relevant_config = {k: config.get(k) for k in RESULT_AFFECTING_CONFIG_KEYS if k in config}
+        return json.dumps([self._normalize_query(query), relevant_config], sort_keys=True, ensure_ascii=False, default=str)
+
+    def search(self, query: str, config: Dict[str, Any],
+               precomputed_analysis: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Hàm tìm kiếm chính, nhận một dictionary config để tùy chỉnh hành vi.
+        precomputed_analysis (tùy chọn) là kết quả analyze_query() đã tính sẵn.
+        Kết quả được cache theo (query đã chuẩn hóa, config) nên việc phân trang,
+        chỉnh lại slider về giá trị cũ hay nhiều người cùng chạy một query sẽ
+        không phải chạy lại toàn bộ pipeline. Đặt config['use_cache'] = False để bỏ qua cache.
+        Các request giống hệt nhau đến cùng lúc được gộp vào một lần tính toán duy nhất.
         """
-        top_k_final = int(config.get('top_k_final', 100))
-        kis_retrieval = int(config.get('kis_retrieval', 200))
-        vqa_candidates_to_rank = int(config.get('vqa_candidates', 20))
-        vqa_retrieval = int(config.get('vqa_retrieval', 200))
-        trake_candidates_per_step = int(config.get('trake_candidates_per_step', 20))
-        trake_max_sequences = int(config.get('trake_max_sequences', 50))
-        w_clip = config.get('w_clip', 0.4)
-        w_obj = config.get('w_obj', 0.3)
-        w_semantic = config.get('w_semantic', 0.3)
-        lambda_mmr = config.get('lambda_mmr', 0.7)
+        start_time = time.time()
+        use_cache = config.get('use_cache', True)
+        cache_key = self._build_cache_key(query, config)
+
+        response = self.result_cache.get(cache_key) if use_cache else None
+        cache_hit = response is not None
+        coalesced = False
+        if cache_hit:
+            print(f"--- ⚡ Cache HIT cho truy vấn: '{query}' ---")
+        else:
+            flight_key = (cache_key, config.get('deadline_ms'))
+            response, coalesced = self._search_flight.do(flight_key, self._search_uncached, query, config, precomputed_analysis)
+            if coalesced:
+                print(f"--- 🔗 Gộp với một truy vấn giống hệt đang chạy: '{query}' ---")
+            elif use_cache and not response.get('degraded'):
+                self.result_cache.set(cache_key, response)
 
+        return {**response, 'metrics': self._build_metrics(cache_hit, coalesced, start_time)}
+
+    def search_iter(self, query: str, config: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Phiên bản streaming của search(): yield các response trung gian ngay khi
+        từng stage hoàn tất để UI hiển thị sớm:
+          1. 'retrieval' - kết quả FAISS thô cho query gốc (chỉ khi chúng được dùng lại
+             ở Tầng 1, tức là phân tích Gemini sẽ không viết lại query),
+          2. 'spatial'   - danh sách đã rerank không gian,
+          3. 'final'     - danh sách cuối cùng (sau xác thực chi tiết / VQA / TRAKE).
+        Mỗi response có thêm 'stage' và 'is_final'. Response cuối cùng giống hệt search()
+        và được ghi vào cache; nếu cache hit thì chỉ yield duy nhất response cuối.
+        Giống search(), các request giống hệt nhau đến cùng lúc chỉ chạy pipeline một lần:
+        request đến sau chờ và chỉ nhận response cuối của request đang chạy.
+        """
+        start_time = time.time()
+        use_cache = config.get('use_cache', True)
+        cache_key = self._build_cache_key(query, config)
+
+        cached_response = self.result_cache.get(cache_key) if use_cache else None
+        if cached_response is not None:
+            print(f"--- ⚡ Cache HIT cho truy vấn: '{query}' ---")
+            yield {**cached_response, 'metrics': self._build_metrics(True, False, start_time)}
+            return
+
+        flight_key = (cache_key, config.get('deadline_ms'))
+        future, is_leader = self._search_flight.begin(flight_key)
+        while not is_leader:
+            try:
+                response = future.result()
+            except CancelledError:
+                future, is_leader = self._search_flight.begin(flight_key)
+                continue
+            print(f"--- 🔗 Gộp với một truy vấn giống hệt đang chạy: '{query}' ---")
+            yield {**response, 'metrics': self._build_metrics(False, True, start_time)}
+            return
+
+        try:
+            for response in self._search_stages(query, config, stream=True):
+                if response['is_final']:
+                    if use_cache and not response.get('degraded'):
+                        self.result_cache.set(cache_key, response)
+                    future.set_result(response)
+                yield {**response, 'metrics': self._build_metrics(False, False, start_time)}
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            raise
+        finally:
+            # Generator bị đóng trước response cuối: các request đang chờ sẽ tự chạy lại.
+            if not future.done():
+                future.cancel()
+            self._search_flight.end(flight_key, future)
+
+    def _build_metrics(self, cache_hit: bool, coalesced: bool, start_time: float) -> Dict[str, Any]:
+        cache_stats = self.result_cache.stats()
+        return {
+            'cache_hit': cache_hit,
+            'coalesced': coalesced,
+            'cache_hit_rate': cache_stats['hit_rate'],
+            'cache_entries': cache_stats['entries'],
+            'cache_bytes': cache_stats['bytes'],
+            'total_time_s': time.time() - start_time,
+        }
+
+    def _call_with_deadline(self, stage: str, deadline: Deadline, stages: Dict[str, str], fallback: Any, fn, *args) -> Any:
+        """
+        Chạy một stage tùy chọn (gọi LLM...) trong giới hạn thời gian còn lại.
+        Nếu ngân sách không đủ thì bỏ qua; nếu quá hạn thì trả về fallback và để
+        lời gọi nền tự kết thúc (không chặn pipeline).
+
+        Lời gọi chạy trên pool LLM riêng và phải giữ một trong LLM_STAGE_WORKERS slot cho đến
+        khi thực sự kết thúc, nên các lời gọi bị treo không thể xếp hàng vô hạn: khi mọi slot
+        đều bận quá hạn, stage trả về fallback ('timeout') thay vì chờ trong hàng đợi.
+        """
+        if not deadline.allows(STAGE_MIN_BUDGET_MS[stage] + CORE_RESERVE_MS):
+            print(f"--- ⏱️ Bỏ qua stage '{stage}' (còn {deadline.remaining_ms():.0f}ms). ---")
+            stages[stage] = 'skipped'
+            return fallback
+        if not deadline.enabled:
+            stages[stage] = 'ran'
+            return fn(*args)
+        if not self._llm_slots.acquire(timeout=deadline.timeout_s(reserve_ms=CORE_RESERVE_MS)):
+            print(f"--- ⏱️ Stage '{stage}': mọi worker LLM đều bận, dùng kết quả dự phòng. ---")
+            stages[stage] = 'timeout'
+            return fallback
+        try:
+            future = self._llm_executor.submit(fn, *args)
+        except BaseException:
+            self._llm_slots.release()
+            raise
+        future.add_done_callback(lambda _: self._llm_slots.release())
+        try:
+            result = future.result(timeout=deadline.timeout_s(reserve_ms=CORE_RESERVE_MS))
+            stages[stage] = 'ran'
+            return result
+        except FutureTimeoutError:
+            future.cancel()
+            print(f"--- ⏱️ Stage '{stage}' quá hạn, dùng kết quả dự phòng. ---")
+            stages[stage] = 'timeout'
+            return fallback
+
+    def _run_vqa(self, candidates_for_vqa: List[Dict[str, Any]], specific_question: str,
+                 deadline: Deadline, stages: Dict[str, str]) -> List[Dict[str, Any]]:
+        """
+        Chạy VQA song song trên các ứng viên trong giới hạn deadline.
+        Các ứng viên chưa kịp xử lý khi hết giờ được giữ nguyên điểm tìm kiếm
+        và xếp sau các ứng viên đã có câu trả lời.
+        """
+        vqa_enhanced_candidates = []
+        print(f"--- 💬 Bắt đầu Quét VQA song song trên {len(candidates_for_vqa)} ứng viên... ---")
+
+        executor = ThreadPoolExecutor(max_workers=8)
+        future_to_candidate = {
+            executor.submit(
+                self.openai_handler.perform_vqa, 
+                image_path=cand['keyframe_path'], 
+                question=specific_question, 
+                context_text=cand.get('transcript_text', '')
+            ): cand 
+            for cand in candidates_for_vqa
+        }
+        pending = set(future_to_candidate)
+        try:
+            for future in tqdm(as_completed(future_to_candidate, timeout=deadline.timeout_s(reserve_ms=CORE_RESERVE_MS)),
+                               total=len(candidates_for_vqa), desc="   -> VQA Progress"):
+                pending.discard(future)
+                cand = future_to_candidate[future]
+                try:
+                    vqa_result = future.result()
+                    new_cand = cand.copy()
+                    new_cand['answer'] = vqa_result['answer']
+                    search_score = new_cand.get('final_score', 0)
+                    vqa_confidence = vqa_result.get('confidence', 0)
+                    new_cand['final_score'] = search_score * vqa_confidence
+                    new_cand['scores'] = {**new_cand.get('scores', {}), 'vqa_confidence': vqa_confidence}
+                    vqa_enhanced_candidates.append(new_cand)
+                except Exception as exc:
+                    print(f"--- ❌ Lỗi khi xử lý VQA cho keyframe {cand.get('keyframe_id')}: {exc} ---")
+            stages['vqa'] = 'ran'
+        except FutureTimeoutError:
+            print(f"--- ⏱️ VQA quá hạn: {len(pending)}/{len(candidates_for_vqa)} ứng viên chưa được xử lý. ---")
+            stages['vqa'] = 'partial'
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        vqa_enhanced_candidates.sort(key=lambda x: x['final_score'], reverse=True)
+        if stages['vqa'] == 'partial':
+            unfinished = [future_to_candidate[f] for f in pending]
+            unfinished.sort(key=lambda x: x.get('final_score', 0), reverse=True)
+            vqa_enhanced_candidates.extend(unfinished)
+        return vqa_enhanced_candidates
+
+    def analyze_query(self, 
+                      query: str, 
+                      deadline: Optional[Deadline] = None, 
+                      stages: Optional[Dict[str, str]] = None
+                     ) -> Dict[str, Any]:
+        """
+        Phân tích truy vấn bằng Gemini (phân tích có cấu trúc + Semantic Grounding).
+        Có thể gọi riêng (ví dụ chạy song song cho nhiều truy vấn trong batch) rồi
+        truyền kết quả vào search(..., precomputed_analysis=...).
+
+        Returns:
+            Dict[str, Any]: Kết quả phân tích, hoặc {} nếu AI không khả dụng.
+        """
+        if deadline is None:
+            deadline = Deadline()
+        if stages is None:
+            stages = {}
         query_analysis = {}
-        task_type = TaskType.KIS
         if self.ai_enabled and self.gemini_handler:
             print("--- ✨ Bắt đầu phân tích truy vấn bằng Gemini Text Handler... ---")
-            query_analysis = self.gemini_handler.analyze_query_fully(query)
+            query_analysis = self._call_with_deadline(
+                'llm_analysis', deadline, stages, {}, self.gemini_handler.analyze_query_fully, query
+            )
             
             entities_to_ground = query_analysis.get('entities_to_ground', [])
             if entities_to_ground:
-                grounding_map = self.gemini_handler.perform_semantic_grounding(entities_to_ground)
+                grounding_map = self._call_with_deadline(
+                    'grounding_entities', deadline, stages, {}, self.gemini_handler.perform_semantic_grounding, entities_to_ground
+                )
                 query_analysis['grounding_map'] = grounding_map
             else:
                 query_analysis['grounding_map'] = {}
             
             original_objects = query_analysis.get('objects_en', [])
             if original_objects:
-                grounded_objects = self.gemini_handler.perform_semantic_grounding(original_objects)
+                grounded_objects = self._call_with_deadline(
+                    'grounding_objects', deadline, stages, original_objects, self.gemini_handler.perform_semantic_grounding, original_objects
+                )
                 if original_objects != grounded_objects:
                      print(f"--- 🧠 Semantic Grounding: {original_objects} -> {grounded_objects} ---")
                 query_analysis['objects_en'] = grounded_objects
-                
-            task_type_str = query_analysis.get('task_type', 'KIS').upper()
-            try:
-                task_type = TaskType[task_type_str]
-            except KeyError:
-                task_type = TaskType.KIS
+        return query_analysis
+
+    def _search_uncached(self, query: str, config: Dict[str, Any],
+                         precomputed_analysis: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Chạy toàn bộ pipeline tìm kiếm (không qua cache) và trả về response cuối cùng.
+        """
+        final_response: Dict[str, Any] = {}
+        for response in self._search_stages(query, config, stream=False, precomputed_analysis=precomputed_analysis):
+            final_response = response
+        return final_response
+
+    def _prepare_results(self, results: List[Dict[str, Any]], task_type: TaskType, top_k_final: int) -> List[Dict[str, Any]]:
+        """Lọc trùng lặp thời gian, gắn video_path, lời thoại và cắt Top-K cho một danh sách kết quả."""
+        if task_type in [TaskType.KIS, TaskType.QNA]:
+            results = self._deduplicate_temporally(results, time_threshold=2)
+            self._attach_transcript_text(results[:top_k_final])
+        if self.video_path_map and task_type in [TaskType.KIS, TaskType.QNA]:
+            for result in results:
+                result['video_path'] = self.video_path_map.get(result.get('video_id'))
+        return results[:top_k_final]
+
+    def _search_stages(self, query: str, config: Dict[str, Any], stream: bool = False,
+                       precomputed_analysis: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Pipeline tìm kiếm dạng generator. Với stream=True, yield thêm các response
+        trung gian ('retrieval' nếu kết quả FAISS thô dùng lại được, 'spatial');
+        response cuối cùng luôn có is_final=True.
+        Nếu có precomputed_analysis thì bỏ qua bước phân tích Gemini.
+
+        Nếu config['w_transcript'] > 0 và có TranscriptSearcher, Tầng 1 của KIS/QNA truy xuất
+        CLIP và transcript song song rồi hợp nhất theo keyframe bằng weighted RRF; thứ hạng
+        cuối cũng được hợp nhất lại với thứ hạng transcript theo cùng trọng số.
+
+        Nếu có config['deadline_ms'], các stage tùy chọn (phân tích LLM, grounding,
+        TRAKE, xác thực chi tiết, VQA) sẽ bị bỏ qua hoặc thu hẹp khi ngân sách còn lại
+        thấp, để luôn trả về ít nhất kết quả mức CLIP đúng hạn. Trạng thái từng stage
+        được ghi trong response['stages'].
+        """
+        top_k_final = int(config.get('top_k_final', 100))
+        kis_retrieval = int(config.get('kis_retrieval', 200))
+        vqa_candidates_to_rank = int(config.get('vqa_candidates', 20))
+        vqa_retrieval = int(config.get('vqa_retrieval', 200))
+        trake_candidates_per_step = int(config.get('trake_candidates_per_step', 20))
+        trake_max_sequences = int(config.get('trake_max_sequences', 50))
+        trake_min_gap = float(config.get('trake_min_gap') or 0.0)
+        trake_max_gap = config.get('trake_max_gap')
+        trake_max_gap = float(trake_max_gap) if trake_max_gap else None
+        trake_video_scoped = bool(config.get('trake_video_scoped', False))
+        trake_per_video = int(config.get('trake_per_video', 10))
+        w_clip = config.get('w_clip', 0.4)
+        w_obj = config.get('w_obj', 0.3)
+        w_semantic = config.get('w_semantic', 0.3)
+        lambda_mmr = config.get('lambda_mmr', 0.7)
+        w_transcript = min(max(float(config.get('w_transcript') or 0.0), 0.0), 1.0)
+        use_transcript = w_transcript > 0 and self.transcript_searcher is not None
+        transcript_hits: Dict[int, Tuple[int, float]] = {}
+        deadline = Deadline(config.get('deadline_ms'))
+        stages: Dict[str, str] = {}
+
+        def partial_response(stage: str, results: List[Dict[str, Any]], task_type: TaskType, query_analysis: Dict[str, Any]) -> Dict[str, Any]:
+            return {
+                "task_type": task_type,
+                "results": self._prepare_results(list(results), task_type, top_k_final),
+                "query_analysis": query_analysis,
+                "stages": dict(stages),
+                "stage": stage,
+                "is_final": False
+            }
+
+        # Kết quả FAISS thô của query gốc chỉ được dùng lại ở Tầng 1 khi search_context == query,
+        # nên không chạy preview nếu phân tích Gemini sắp viết lại query.
+        if precomputed_analysis is not None:
+            analysis_rewrites_query = precomputed_analysis.get('search_context', query) != query
+        else:
+            analysis_rewrites_query = (
+                self.ai_enabled and self.gemini_handler is not None
+                and deadline.allows(STAGE_MIN_BUDGET_MS['llm_analysis'] + CORE_RESERVE_MS)
+            )
+
+        raw_candidates = None
+        if stream and not analysis_rewrites_query:
+            print(f"--- ⚡ Stage nhanh: Lấy Top-{kis_retrieval} kết quả FAISS thô cho query gốc... ---")
+            raw_candidates = self.semantic_searcher.basic_searcher.search(query, top_k=kis_retrieval)
+            preview = []
+            for cand in raw_candidates:
+                preview_cand = dict(cand)
+                preview_cand['scores'] = {'clip_score': cand.get('clip_score', 0.0)}
+                preview_cand['final_score'] = cand.get('clip_score', 0.0)
+                preview.append(preview_cand)
+            yield partial_response('retrieval', preview, TaskType.KIS, {})
+
+        if precomputed_analysis is not None:
+            query_analysis = dict(precomputed_analysis)
+            if self.ai_enabled and self.gemini_handler:
+                # Phân tích batch thất bại trả về {}: coi là 'failed' để response không bị cache.
+                stages['llm_analysis'] = 'ran' if precomputed_analysis else 'failed'
+        else:
+            query_analysis = self.analyze_query(query, deadline=deadline, stages=stages)
+
+        task_type_str = str(query_analysis.get('task_type', 'KIS')).upper()
+        try:
+            task_type = TaskType[task_type_str]
+        except KeyError:
+            task_type = TaskType.KIS
         
         print(f"--- Đã phân loại truy vấn là: {task_type.value} ---")
 
@@ -189,83 +659,99 @@ class MasterSearcher:
         query_analysis.update({'w_clip': w_clip, 'w_obj': w_obj, 'w_semantic': w_semantic})
         search_context = query_analysis.get('search_context', query)
 
+        def reusable_candidates(top_k_retrieval: int) -> Optional[List[Dict[str, Any]]]:
+            """Dùng lại kết quả FAISS thô nếu query và số lượng truy xuất trùng khớp."""
+            if raw_candidates is not None and search_context == query and top_k_retrieval <= kis_retrieval:
+                return raw_candidates
+            return None
+
+        def initial_candidates(top_k_retrieval: int) -> Optional[List[Dict[str, Any]]]:
+            """Ứng viên Tầng 1: FAISS thô, hoặc CLIP + transcript đã hợp nhất nếu bật w_transcript."""
+            nonlocal transcript_hits
+            clip_candidates = reusable_candidates(top_k_retrieval)
+            if not use_transcript:
+                return clip_candidates
+            fused_candidates, transcript_hits = self._retrieve_fused(
+                search_context, query, top_k_retrieval, w_transcript, deadline, stages, clip_candidates
+            )
+            return fused_candidates
+
         if task_type == TaskType.TRAKE:
+            # Phân rã là một lời gọi LLM: chạy trong giới hạn deadline như các stage LLM khác;
+            # phân tích bước con và rerank từng bước tự kiểm tra deadline bên trong find_sequences.
+            sub_queries = []
             if self.trake_solver:
-                sub_queries = self.trake_solver.decompose_query(query)
+                sub_queries = self._call_with_deadline(
+                    'trake', deadline, stages, [], self.trake_solver.decompose_query, query
+                )
+            if self.trake_solver and stages.get('trake') == 'ran':
                 final_results = self.trake_solver.find_sequences(
                     sub_queries, 
                     self.semantic_searcher,
                     original_query_analysis=query_analysis,
                     top_k_per_step=trake_candidates_per_step,
-                    max_sequences=trake_max_sequences
+                    max_sequences=trake_max_sequences,
+                    min_gap=trake_min_gap,
+                    max_gap=trake_max_gap,
+                    video_scoped=trake_video_scoped,
+                    top_k_per_video=trake_per_video,
+                    deadline=deadline,
+                    reserve_ms=CORE_RESERVE_MS,
+                    stage_report=stages
                 )
             else:
+                if self.trake_solver:
+                    print("--- ⏱️ Không đủ thời gian cho TRAKE. Fallback về KIS. ---")
                 task_type = TaskType.KIS
 
         elif task_type == TaskType.QNA:
             if self.openai_handler:
-                candidates = self.semantic_searcher.search(
+                candidates = []
+                for stage_name, stage_candidates in self.semantic_searcher.search_iter(
                     query_text=search_context,
                     precomputed_analysis=query_analysis,
                     top_k_final=vqa_retrieval,
-                    top_k_retrieval=vqa_retrieval
-                )
+                    top_k_retrieval=vqa_retrieval,
+                    deadline=deadline,
+                    stage_report=stages,
+                    initial_candidates=initial_candidates(vqa_retrieval)
+                ):
+                    if stage_name == 'final':
+                        candidates = self._fuse_transcript_ranks(stage_candidates, transcript_hits, w_transcript)
+                    elif stream:
+                        yield partial_response(stage_name, stage_candidates, task_type, query_analysis)
                 
                 if not candidates:
                     final_results = []
+                elif not deadline.allows(STAGE_MIN_BUDGET_MS['vqa'] + CORE_RESERVE_MS):
+                    print(f"--- ⏱️ Bỏ qua VQA (còn {deadline.remaining_ms():.0f}ms). Trả về kết quả tìm kiếm. ---")
+                    stages['vqa'] = 'skipped'
+                    final_results = candidates
                 else:
-                    candidates_for_vqa = candidates[:vqa_candidates_to_rank]
+                    if stream:
+                        yield partial_response('fine_grained', candidates, task_type, query_analysis)
+                    candidates_for_vqa = self._attach_transcript_text(candidates[:vqa_candidates_to_rank])
                     specific_question = query_analysis.get('specific_question', query)
-                    vqa_enhanced_candidates = []
-                    
-                    print(f"--- 💬 Bắt đầu Quét VQA song song trên {len(candidates_for_vqa)} ứng viên... ---")
-                    
-                    with ThreadPoolExecutor(max_workers=8) as executor:
-                        future_to_candidate = {
-                            executor.submit(
-                                self.openai_handler.perform_vqa, 
-                                image_path=cand['keyframe_path'], 
-                                question=specific_question, 
-                                context_text=cand.get('transcript_text', '')
-                            ): cand 
-                            for cand in candidates_for_vqa
-                        }
-                        
-                        for future in tqdm(as_completed(future_to_candidate), total=len(candidates_for_vqa), desc="   -> VQA Progress"):
-                            cand = future_to_candidate[future]
-                            try:
-                                vqa_result = future.result()
-                                new_cand = cand.copy()
-                                new_cand['answer'] = vqa_result['answer']
-                                search_score = new_cand.get('final_score', 0)
-                                vqa_confidence = vqa_result.get('confidence', 0)
-                                new_cand['final_score'] = search_score * vqa_confidence
-                                new_cand['scores']['vqa_confidence'] = vqa_confidence
-                                vqa_enhanced_candidates.append(new_cand)
-                            except Exception as exc:
-                                print(f"--- ❌ Lỗi khi xử lý VQA cho keyframe {cand.get('keyframe_id')}: {exc} ---")
-                    
-                    if vqa_enhanced_candidates:
-                        final_results = sorted(vqa_enhanced_candidates, key=lambda x: x['final_score'], reverse=True)
-                    else:
-                        final_results = []
+                    final_results = self._run_vqa(candidates_for_vqa, specific_question, deadline, stages)
             else:
                 print("--- ⚠️ OpenAI (VQA) handler chưa được kích hoạt. Fallback về KIS. ---")
                 task_type = TaskType.KIS
 
         if not final_results or task_type == TaskType.KIS:
-            final_results = self.semantic_searcher.search(
+            for stage_name, stage_candidates in self.semantic_searcher.search_iter(
                 query_text=search_context,
                 precomputed_analysis=query_analysis,
                 top_k_final=kis_retrieval, 
-                top_k_retrieval=kis_retrieval
-            )
-        if task_type in [TaskType.KIS, TaskType.QNA]:
-            final_results = self._deduplicate_temporally(final_results, time_threshold=2)
-        if self.video_path_map and task_type in [TaskType.KIS, TaskType.QNA]:
-            for result in final_results:
-                result['video_path'] = self.video_path_map.get(result.get('video_id'))
-        diverse_results = final_results
+                top_k_retrieval=kis_retrieval,
+                deadline=deadline,
+                stage_report=stages,
+                initial_candidates=initial_candidates(kis_retrieval)
+            ):
+                if stage_name == 'final':
+                    final_results = self._fuse_transcript_ranks(stage_candidates, transcript_hits, w_transcript)
+                elif stream:
+                    yield partial_response(stage_name, stage_candidates, task_type, query_analysis)
+        final_results_for_submission = self._prepare_results(final_results, task_type, top_k_final)
         # if self.mmr_builder and final_results:
         #     if task_type in [TaskType.KIS, TaskType.QNA]:
         #         diverse_results = self.mmr_builder.build_diverse_list(
@@ -273,13 +759,13 @@ class MasterSearcher:
         #             target_size=len(final_results),
         #             lambda_val=lambda_mmr
         #         )
-        final_results_for_submission = diverse_results[:top_k_final]
         print("\n" + "="*20 + " DEBUG LOG: MASTER SEARCHER OUTPUT " + "="*20)
         print(f"-> Task Type cuối cùng: {task_type.value}")
-        print(f"-> Số lượng kết quả cuối cùng: {len(final_results)}")
-        if final_results:
+        print(f"-> Số lượng kết quả cuối cùng: {len(final_results_for_submission)}")
+        print(f"-> Các stage: {stages} ({deadline.elapsed_ms():.0f}ms)")
+        if final_results_for_submission:
             print("-> Ví dụ kết quả đầu tiên:")
-            first_result = final_results[0]
+            first_result = final_results_for_submission[0]
             if task_type == TaskType.TRAKE:
                 print(f"  - video_id: {first_result.get('video_id')}")
                 print(f"  - final_score: {first_result.get('final_score')}")
@@ -293,8 +779,12 @@ class MasterSearcher:
             print("-> Không có kết quả nào được tạo ra.")
         print("="*68 + "\n")
         
-        return {
+        yield {
             "task_type": task_type,
             "results": final_results_for_submission,
-            "query_analysis": query_analysis
-        }
\ No newline at end of file
+            "query_analysis": query_analysis,
+            "stages": stages,
+            "degraded": any(status in DEGRADED_STAGE_STATUSES for status in stages.values()),
+            "stage": "final",
+            "is_final": True
+        }
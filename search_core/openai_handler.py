@@ -5,7 +5,8 @@ import base64
 from typing import Dict, Any, List, Optional
 import io
 from PIL import Image
-from utils import api_retrier
+from utils import api_retrier, RateLimiter
+from utils.singleflight import SingleFlight, make_request_key
 import os
 
 class OpenAIHandler:
@@ -19,6 +20,8 @@ class OpenAIHandler:
         self.client = openai.OpenAI(api_key=api_key)
         self.model = model
         self.vision_model = "gpt-4o"
+        self._inflight = SingleFlight()
+        self.rate_limiter: Optional[RateLimiter] = None
         
     @api_retrier(max_retries=2, initial_delay=1)
     def check_api_health(self) -> bool:
@@ -34,10 +37,24 @@ class OpenAIHandler:
             print(f"--- ❌ Lỗi OpenAI API: Không thể kết nối đến OpenAI. Lỗi: {e} ---")
             return False
 
-    @api_retrier(max_retries=3, initial_delay=2)
     def _openai_vision_call(self, messages: List[Dict], is_json: bool = True, is_vision: bool = False) -> str:
+        """
+        Gọi Chat Completions. Các request giống hệt nhau (cùng model, messages, định dạng)
+        đang chạy đồng thời sẽ được gộp lại và chỉ gửi đi một lần.
+        """
+        model_to_use = self.vision_model if is_vision else self.model
+        key = make_request_key(model_to_use, messages, is_json)
+        content, shared = self._inflight.do(key, self._openai_vision_call_with_retry, messages, is_json, is_vision)
+        if shared:
+            print("--- 🔗 OpenAI: Dùng chung kết quả với một request giống hệt đang chạy. ---")
+        return content
+
+    @api_retrier(max_retries=3, initial_delay=2)
+    def _openai_vision_call_with_retry(self, messages: List[Dict], is_json: bool = True, is_vision: bool = False) -> str:
         model_to_use = self.vision_model if is_vision else self.model
         response_format = {"type": "json_object"} if is_json else {"type": "text"}
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
         
         response = self.client.chat.completions.create(
             model=model_to_use, messages=messages, response_format=response_format,
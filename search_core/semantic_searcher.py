@@ -7,11 +7,16 @@ import json
 import re
 import torch
 from tqdm import tqdm
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterator, Tuple
 from utils.cache_manager import ObjectVectorCache
 from utils.spatial_engine import is_above, is_below, is_between, is_behind, is_inside, is_next_to, is_on
 from utils.image_cropper import crop_image_by_box
 from search_core.basic_searcher import BasicSearcher
+from utils.deadline import Deadline
+
+# Chi phí tối thiểu (ms) để bắt đầu / tiếp tục Xác thực Chi tiết khi có deadline.
+FINE_GRAINED_MIN_BUDGET_MS = 1500
+FINE_GRAINED_PER_CANDIDATE_MS = 150
 
 class SemanticSearcher:
     def __init__(self, basic_searcher, rerank_model, device="cuda"):
@@ -139,16 +144,33 @@ class SemanticSearcher:
         print("    -> Ví dụ điểm không gian (có Grounding):", {c['keyframe_id']: f"{c['scores']['spatial_score']:.2f}" for c in candidates[:5]})
         return candidates
     
-    def _apply_fine_grained_filter(self, candidates: List[Dict], verification_rules: List[Dict]) -> List[Dict]:
+    def _apply_fine_grained_filter(self, 
+                                   candidates: List[Dict], 
+                                   verification_rules: List[Dict],
+                                   deadline: Optional[Deadline] = None,
+                                   stage_report: Optional[Dict[str, str]] = None
+                                  ) -> List[Dict]:
         """
         Sử dụng CLIP trên các vùng ảnh đã crop để xác thực các chi tiết nhỏ.
+        Khi có deadline: bỏ qua nếu không đủ ngân sách, hoặc dừng sớm giữa chừng;
+        các ứng viên chưa được xác thực nhận điểm trung tính 0.5.
         """
+        if stage_report is None:
+            stage_report = {}
         if not verification_rules or self.master_object_df is None or self.master_object_df.empty:
             for cand in candidates:
                 cand['scores']['fine_grained_score'] = 1.0
             return candidates
 
+        if deadline is not None and not deadline.allows(FINE_GRAINED_MIN_BUDGET_MS):
+            print(f"--- ⏱️ Bỏ qua Xác thực Chi tiết (còn {deadline.remaining_ms():.0f}ms). ---")
+            stage_report['fine_grained'] = 'skipped'
+            for cand in candidates:
+                cand['scores']['fine_grained_score'] = 0.5
+            return candidates
+
         print(f"--- 🔬 Áp dụng {len(verification_rules)} Quy tắc Xác thực Chi tiết...")
+        stage_report['fine_grained'] = 'ran'
         
         top_candidates = candidates[:50]
         
@@ -157,7 +179,13 @@ class SemanticSearcher:
             text_features = self.clip_model.encode(detailed_descriptions, convert_to_tensor=True, device=self.device)
             text_features /= text_features.norm(dim=-1, keepdim=True)
 
+        num_verified = 0
         for cand in tqdm(top_candidates, desc="Xác thực chi tiết (soi kính hiển vi)"):
+            if deadline is not None and not deadline.allows(FINE_GRAINED_PER_CANDIDATE_MS):
+                print(f"--- ⏱️ Hết thời gian, dừng Xác thực Chi tiết sau {num_verified}/{len(top_candidates)} ứng viên. ---")
+                stage_report['fine_grained'] = 'partial'
+                break
+            num_verified += 1
             keyframe_id = cand['keyframe_id']
             keyframe_objects = self.master_object_df.loc[self.master_object_df.index == keyframe_id]
             
@@ -206,7 +234,7 @@ class SemanticSearcher:
 
             cand['scores']['fine_grained_score'] = total_score / len(verification_rules) if verification_rules else 1.0
 
-        for cand in candidates[50:]:
+        for cand in candidates[num_verified:]:
             cand['scores']['fine_grained_score'] = 0.5 
 
         return candidates
@@ -216,12 +244,52 @@ class SemanticSearcher:
                top_k_final: int,
                top_k_retrieval: int,
                precomputed_analysis: Dict[str, Any] = None,
-               weights: Dict[str, float] = None
+               weights: Dict[str, float] = None,
+               deadline: Optional[Deadline] = None,
+               stage_report: Optional[Dict[str, str]] = None,
+               initial_candidates: Optional[List[Dict[str, Any]]] = None
               ) -> List[Dict[str, Any]]:
         """
         Thực hiện tìm kiếm và tái xếp hạng đa tầng theo kiến trúc PHOENIX.
         Luồng xử lý: Contextual -> Spatial -> Fine-grained Verification.
+        Nếu truyền deadline, tầng Xác thực Chi tiết có thể bị thu hẹp/bỏ qua;
+        trạng thái các tầng được ghi vào stage_report (nếu có).
+        """
+        final_candidates: List[Dict[str, Any]] = []
+        for stage_name, stage_candidates in self.search_iter(
+            query_text=query_text,
+            top_k_final=top_k_final,
+            top_k_retrieval=top_k_retrieval,
+            precomputed_analysis=precomputed_analysis,
+            weights=weights,
+            deadline=deadline,
+            stage_report=stage_report,
+            initial_candidates=initial_candidates
+        ):
+            if stage_name == 'final':
+                final_candidates = stage_candidates
+        return final_candidates
+
+    def search_iter(self,
+                    query_text: str,
+                    top_k_final: int,
+                    top_k_retrieval: int,
+                    precomputed_analysis: Dict[str, Any] = None,
+                    weights: Dict[str, float] = None,
+                    deadline: Optional[Deadline] = None,
+                    stage_report: Optional[Dict[str, str]] = None,
+                    initial_candidates: Optional[List[Dict[str, Any]]] = None
+                   ) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Phiên bản generator của search(): yield ('spatial', danh sách) ngay sau khi
+        rerank không gian, rồi ('final', danh sách) sau Xác thực Chi tiết.
+
+        Args:
+            initial_candidates: Kết quả Tầng 1 đã có sẵn (ví dụ từ một lần gọi FAISS
+                                trước đó với cùng query). Nếu có, bỏ qua bước retrieval.
         """
+        if stage_report is None:
+            stage_report = {}
         print("\n--- 🔱 Bắt đầu quy trình tìm kiếm đa tầng PHOENIX... ---")
 
         if precomputed_analysis is None: precomputed_analysis = {}
@@ -233,12 +301,18 @@ class SemanticSearcher:
             **(weights or {})
         }
         print(f"    -> Trọng số hỏa lực: {final_weights}")
-        print(f"--- Tầng 1: Lấy Top-{top_k_retrieval} ứng viên theo Ngữ cảnh... ---")
-        candidates = self.basic_searcher.search(query_text, top_k=top_k_retrieval)
+        if initial_candidates is not None:
+            print(f"--- Tầng 1: Dùng lại {len(initial_candidates)} ứng viên đã truy xuất trước đó... ---")
+            candidates = [dict(cand) for cand in initial_candidates[:top_k_retrieval]]
+        else:
+            print(f"--- Tầng 1: Lấy Top-{top_k_retrieval} ứng viên theo Ngữ cảnh... ---")
+            candidates = self.basic_searcher.search(query_text, top_k=top_k_retrieval)
         if not candidates:
             print("--- ⛔ Không tìm thấy ứng viên nào ở Tầng 1. Dừng tìm kiếm. ---")
-            return []
+            yield 'final', []
+            return
         print(f"    -> Tìm thấy {len(candidates)} ứng viên tiềm năng.")
+        stage_report['retrieval'] = 'ran'
         for cand in candidates:
             cand['scores'] = {'clip_score': cand.get('clip_score', 0.0)}
         print("--- Tầng 1.5: Tinh chỉnh điểm Ngữ nghĩa bằng Bi-Encoder... ---")
@@ -254,6 +328,7 @@ class SemanticSearcher:
             spatial_rules=spatial_rules, 
             precomputed_analysis=precomputed_analysis
         )
+        stage_report['spatial'] = 'ran'
 
         verification_rules = precomputed_analysis.get('fine_grained_verification', [])
         
@@ -264,10 +339,14 @@ class SemanticSearcher:
                 final_weights['w_semantic'] * s.get('semantic_score', 0.0) +
                 final_weights['w_spatial'] * s.get('spatial_score', 0.5)
             )
+            cand['final_score'] = cand['temp_score']
         
         sorted_before_fine_grained = sorted(candidates_after_spatial, key=lambda x: x.get('temp_score', 0.0), reverse=True)
+        yield 'spatial', sorted_before_fine_grained[:top_k_final]
 
-        candidates_after_fine_grained = self._apply_fine_grained_filter(sorted_before_fine_grained, verification_rules)
+        candidates_after_fine_grained = self._apply_fine_grained_filter(
+            sorted_before_fine_grained, verification_rules, deadline=deadline, stage_report=stage_report
+        )
 
 
         print("--- 🎯 Tính toán điểm hỏa lực cuối cùng và sắp xếp... ---")
@@ -289,4 +368,4 @@ class SemanticSearcher:
         for i, cand in enumerate(final_sorted_candidates[:3]):
             print(f"  Top {i+1}: {cand['keyframe_id']} | Score: {cand['final_score']:.4f} | Scores: {cand['scores']}")
 
-        return final_sorted_candidates[:top_k_final]
\ No newline at end of file
+        yield 'final', final_sorted_candidates[:top_k_final]
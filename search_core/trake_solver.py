@@ -1,11 +1,19 @@
-
-from typing import List, Dict, Any
+import heapq
+import itertools
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Optional
+from utils.deadline import Deadline
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from search_core.openai_handler import OpenAIHandler
     from search_core.semantic_searcher import SemanticSearcher
 
+# Chi phí tối thiểu (ms) để phân tích các bước con bằng LLM / rerank một bước khi có deadline.
+SUB_QUERY_ANALYSIS_MIN_BUDGET_MS = 2500
+STEP_RERANK_MIN_BUDGET_MS = 300
+
 class TRAKESolver:
     """
     Class xử lý Nhiệm vụ 3: TRAKE (TRacking Action KEyframes).
@@ -17,15 +25,25 @@ class TRAKESolver:
         b. Lắp ráp các ứng viên thành các chuỗi hợp lệ (cùng video, đúng thứ tự).
     """
 
-    def __init__(self, ai_handler: 'OpenAIHandler'):
+    def __init__(self, ai_handler: 'OpenAIHandler', max_workers: int = 4):
         """
         Khởi tạo TRAKESolver.
 
         Args:
             ai_handler (OpenAIHandler): Một instance của AI Handler (ví dụ: OpenAIHandler)
                                         để thực hiện việc phân rã và phân tích truy vấn.
+            max_workers (int): Số luồng tối đa để phân tích và rerank các bước con song song.
         """
         self.ai_handler = ai_handler
+        self.max_workers = max_workers
+
+    def _analyze_sub_query(self, sub_query: str) -> Dict[str, Any]:
+        """Phân tích một bước con; trả về phân tích tối thiểu nếu AI handler lỗi."""
+        try:
+            return dict(self.ai_handler.analyze_query_fully(sub_query) or {})
+        except Exception as e:
+            print(f"--- ⚠️ Lỗi khi phân tích bước con '{sub_query}': {e}. Dùng truy vấn gốc. ---")
+            return {'search_context': sub_query}
 
     def decompose_query(self, query: str) -> List[str]:
         """
@@ -34,80 +52,290 @@ class TRAKESolver:
         print(f"--- 🤖 Phân rã truy vấn TRAKE bằng AI Handler... ---")
         return self.ai_handler.decompose_trake_query(query)
 
+    def _analyze_sub_queries(self,
+                             sub_queries: List[str],
+                             deadline: Optional[Deadline],
+                             reserve_ms: float,
+                             stage_report: Dict[str, str]
+                            ) -> List[Dict[str, Any]]:
+        """
+        Phân tích tất cả bước con song song (RateLimiter của handler vẫn được tôn trọng).
+        Khi có deadline: bỏ qua nếu không đủ ngân sách, và chỉ chờ đến khi còn lại đủ thời gian
+        cho rerank + reserve_ms; bước nào chưa xong thì dùng truy vấn gốc của bước đó.
+        Pool riêng không được chờ khi đóng, nên lời gọi LLM đang treo không chặn các bước sau.
+        """
+        if deadline is not None and not deadline.allows(SUB_QUERY_ANALYSIS_MIN_BUDGET_MS + reserve_ms):
+            print(f"--- ⏱️ Bỏ qua phân tích bước con TRAKE (còn {deadline.remaining_ms():.0f}ms). Dùng truy vấn gốc. ---")
+            stage_report['trake'] = 'partial'
+            return [{'search_context': sub_query} for sub_query in sub_queries]
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(sub_queries))))
+        futures = [executor.submit(self._analyze_sub_query, sub_query) for sub_query in sub_queries]
+        executor.shutdown(wait=False)
+        timeout = deadline.timeout_s(reserve_ms=STEP_RERANK_MIN_BUDGET_MS + reserve_ms) if deadline is not None else None
+        wait(futures, timeout=timeout)
+        analyses = []
+        for sub_query, future in zip(sub_queries, futures):
+            if future.done():
+                analyses.append(future.result())
+            else:
+                future.cancel()
+                print(f"--- ⏱️ Phân tích bước con '{sub_query}' quá hạn. Dùng truy vấn gốc. ---")
+                stage_report['trake'] = 'partial'
+                analyses.append({'search_context': sub_query})
+        return analyses
+
     def find_sequences(self, 
                        sub_queries: List[str], 
                        searcher: 'SemanticSearcher',
                        original_query_analysis: Dict[str, Any],
                        top_k_per_step: int, 
                        max_sequences: int,
-                       beam_width: int = 5 
+                       min_gap: float = 0.0,
+                       max_gap: Optional[float] = None,
+                       video_scoped: bool = False,
+                       top_k_per_video: int = 10,
+                       deadline: Optional[Deadline] = None,
+                       reserve_ms: float = 0.0,
+                       stage_report: Optional[Dict[str, str]] = None
                       ) -> List[Dict[str, Any]]:
         """
-        Tìm các chuỗi keyframe hợp lệ bằng thuật toán Beam Search.
+        Tìm top-K chuỗi keyframe tốt nhất (cùng video, đúng thứ tự thời gian).
+
+        Args:
+            min_gap (float): Khoảng cách thời gian tối thiểu (giây) giữa hai bước liên tiếp.
+            max_gap (Optional[float]): Khoảng cách tối đa (giây); None = không giới hạn.
+            video_scoped (bool): Nếu True, bước 1 chọn tập video ứng viên và các bước sau chỉ
+                                 tìm trong các video đó, sau mốc thời gian sớm nhất của bước 1.
+            top_k_per_video (int): Số ứng viên mỗi video cho các bước sau (chế độ video_scoped).
+            deadline (Optional[Deadline]): Nếu có, phân tích bước con và rerank từng bước chỉ chạy
+                                 khi còn đủ ngân sách (chừa lại reserve_ms); bước không kịp rerank
+                                 dùng thứ hạng CLIP thô. stage_report['trake'] = 'partial' khi đó.
         """
+        if stage_report is None:
+            stage_report = {}
         if not sub_queries:
             return []
 
         print(f"--- Bắt đầu tìm kiếm ứng viên cho {len(sub_queries)} bước TRAKE ---")
-        
-        step_candidates = []
-        for i, sub_query in enumerate(sub_queries):
-            print(f"   -> Bước {i+1}: Đang tìm kiếm cho '{sub_query}'")
-            
-            sub_query_analysis = self.ai_handler.analyze_query_fully(sub_query)
-            sub_query_analysis['w_clip'] = original_query_analysis.get('w_clip')
-            sub_query_analysis['w_obj'] = original_query_analysis.get('w_obj')
-            sub_query_analysis['w_semantic'] = original_query_analysis.get('w_semantic')
-            search_context = sub_query_analysis.get('search_context', sub_query)
-            
-            results = searcher.search(
-                query_text=search_context,
-                precomputed_analysis=sub_query_analysis,
-                top_k_final=top_k_per_step,
-                top_k_retrieval=200
-            )
-            step_candidates.append(results)
-        
+        num_workers = max(1, min(self.max_workers, len(sub_queries)))
+        # 1. Phân tích tất cả bước con song song.
+        sub_query_analyses = self._analyze_sub_queries(sub_queries, deadline, reserve_ms, stage_report)
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            for sub_query_analysis in sub_query_analyses:
+                sub_query_analysis['w_clip'] = original_query_analysis.get('w_clip')
+                sub_query_analysis['w_obj'] = original_query_analysis.get('w_obj')
+                sub_query_analysis['w_semantic'] = original_query_analysis.get('w_semantic')
+            search_contexts = [
+                analysis.get('search_context') or sub_query
+                for sub_query, analysis in zip(sub_queries, sub_query_analyses)
+            ]
+
+            def _rerank_step(i: int, initial_candidates: List[Dict[str, Any]], top_k_final: int) -> List[Dict[str, Any]]:
+                if deadline is not None and not deadline.allows(STEP_RERANK_MIN_BUDGET_MS + reserve_ms):
+                    print(f"   -> ⏱️ Bước {i+1}: Hết thời gian rerank, dùng thứ hạng CLIP thô.")
+                    stage_report['trake'] = 'partial'
+                    return _clip_ranked(initial_candidates, top_k_final)
+                print(f"   -> Bước {i+1}: Đang tìm kiếm cho '{sub_queries[i]}'")
+                step_report: Dict[str, str] = {}
+                step_results = searcher.search(
+                    query_text=search_contexts[i],
+                    precomputed_analysis=sub_query_analyses[i],
+                    top_k_final=top_k_final,
+                    top_k_retrieval=max(200, len(initial_candidates)),
+                    deadline=deadline,
+                    stage_report=step_report,
+                    initial_candidates=initial_candidates
+                )
+                if step_report.get('fine_grained') in ('skipped', 'partial'):
+                    stage_report['trake'] = 'partial'
+                return step_results
+
+            if video_scoped and len(sub_queries) > 1:
+                # 2a. Bước 1 tìm kiếm toàn cục và quyết định tập video ứng viên.
+                first_raw = searcher.basic_searcher.search_batch(search_contexts[:1], top_k=200)[0]
+                first_step = _rerank_step(0, first_raw, top_k_per_step)
+                video_min_timestamps: Dict[str, float] = {}
+                for cand in first_step:
+                    video_id, timestamp = cand.get('video_id'), cand.get('timestamp')
+                    if video_id is None or timestamp is None:
+                        continue
+                    video_min_timestamps[video_id] = min(timestamp, video_min_timestamps.get(video_id, timestamp))
+                print(f"--- 🎯 Bước 1 chọn {len(video_min_timestamps)} video; các bước sau chỉ tìm trong các video này. ---")
+
+                # 2b. Các bước sau: tìm kiếm giới hạn theo video + thời gian, rerank song song.
+                scoped_candidates = searcher.basic_searcher.search_within_videos(
+                    search_contexts[1:], video_min_timestamps, top_k_per_video
+                )
+                later_steps = list(executor.map(
+                    lambda i: _rerank_step(i, scoped_candidates[i - 1], len(scoped_candidates[i - 1])),
+                    range(1, len(sub_queries))
+                ))
+                step_candidates = [first_step] + later_steps
+            else:
+                # 2. Retrieval cho tất cả bước: một lần encode + một lần FAISS search.
+                raw_candidates = searcher.basic_searcher.search_batch(search_contexts, top_k=200)
+
+                # 3. Rerank từng bước song song.
+                step_candidates = list(executor.map(
+                    lambda i: _rerank_step(i, raw_candidates[i], top_k_per_step),
+                    range(len(sub_queries))
+                ))
+
+        return self._align_sequences(step_candidates, max_sequences, min_gap=min_gap, max_gap=max_gap)
+
+    def _align_sequences(self,
+                         step_candidates: List[List[Dict[str, Any]]],
+                         max_sequences: int,
+                         min_gap: float = 0.0,
+                         max_gap: Optional[float] = None
+                        ) -> List[Dict[str, Any]]:
+        """
+        Lắp ráp chuỗi tối ưu bằng Quy hoạch động (kiểu Viterbi) trên từng video.
+
+        Với mỗi video, ứng viên của từng bước được sắp theo timestamp thành mảng NumPy.
+        Đi ngược từ bước cuối, g[s][i] = điểm của ứng viên i ở bước s + điểm tốt nhất có thể
+        đạt được cho các bước còn lại (chỉ xét các ứng viên bước s+1 có timestamp nằm trong
+        [t_i + min_gap, t_i + max_gap] khi min_gap > 0, hoặc (t_i, t_i + max_gap] khi min_gap = 0
+        để giữ thứ tự nghiêm ngặt). Khoảng hợp lệ được tìm bằng searchsorted, và max trên
+        khoảng dùng mảng suffix-max (không có max_gap) hoặc sparse table (có max_gap),
+        nên mỗi bước là O(n log n).
+
+        Top-K chuỗi chính xác (trên TẤT CẢ video) được lấy bằng tìm kiếm best-first: g là cận
+        trên chính xác của phần còn lại, nên các chuỗi hoàn chỉnh được lấy ra khỏi heap
+        đúng theo thứ tự điểm giảm dần.
+        """
+        num_steps = len(step_candidates)
+        if num_steps == 0 or max_sequences <= 0:
+            return []
+        min_gap = max(0.0, float(min_gap or 0.0))
+
         print("\n--- Đang nhóm các ứng viên theo video ---")
         candidates_by_video: Dict[str, List[List[Dict]]] = {}
         for i, candidates in enumerate(step_candidates):
             for cand in candidates:
-                video_id = cand['video_id']
+                video_id = cand.get('video_id')
+                if video_id is None or cand.get('timestamp') is None:
+                    continue
                 if video_id not in candidates_by_video:
-                    candidates_by_video[video_id] = [[] for _ in sub_queries]
+                    candidates_by_video[video_id] = [[] for _ in range(num_steps)]
                 candidates_by_video[video_id][i].append(cand)
-        
-        print(f"\n--- Bắt đầu lắp ráp chuỗi bằng Beam Search (beam_width={beam_width}) ---")
-        all_valid_sequences = []
+
+        print(f"\n--- Bắt đầu lắp ráp chuỗi bằng Quy hoạch động (min_gap={min_gap}, max_gap={max_gap}) ---")
+        videos = []
+        heap = []
+        counter = itertools.count()
         for video_id, video_step_candidates in candidates_by_video.items():
             if not all(video_step_candidates):
                 continue
-            
-            beam = [([cand], cand['final_score']) for cand in video_step_candidates[0]]
-            
-            for step_idx in range(1, len(sub_queries)):
-                next_beam = []
-                for current_sequence, current_score in beam:
-                    last_frame_timestamp = current_sequence[-1]['timestamp']
-                    
-                    for next_candidate in video_step_candidates[step_idx]:
-                        if next_candidate['timestamp'] > last_frame_timestamp:
-                            new_sequence = current_sequence + [next_candidate]
-                            new_score = current_score + next_candidate['final_score']
-                            next_beam.append((new_sequence, new_score))
-                
-                next_beam.sort(key=lambda x: x[1], reverse=True)
-                beam = next_beam[:beam_width]
-
-            for final_sequence, total_score in beam:
-                avg_score = total_score / len(final_sequence)
+            steps = []
+            for cands in video_step_candidates:
+                cands = sorted(cands, key=lambda c: c['timestamp'])
+                steps.append((
+                    cands,
+                    np.array([c['timestamp'] for c in cands], dtype=np.float64),
+                    np.array([c.get('final_score', 0.0) for c in cands], dtype=np.float64)
+                ))
+            g, ranges = _viterbi_backward(steps, min_gap, max_gap)
+            video_idx = len(videos)
+            videos.append((video_id, steps, g, ranges))
+            for i in np.flatnonzero(np.isfinite(g[0])):
+                node = (0, int(i), None)
+                heapq.heappush(heap, (-g[0][i], next(counter), video_idx, float(steps[0][2][i]), node))
+
+        all_valid_sequences = []
+        while heap and len(all_valid_sequences) < max_sequences:
+            neg_bound, _, video_idx, acc, node = heapq.heappop(heap)
+            video_id, steps, g, ranges = videos[video_idx]
+            step, idx, _ = node
+            if step == num_steps - 1:
+                sequence = []
+                while node is not None:
+                    sequence.append(steps[node[0]][0][node[1]])
+                    node = node[2]
+                sequence.reverse()
                 all_valid_sequences.append({
                     "video_id": video_id,
-                    "sequence": final_sequence,
-                    "final_score": avg_score
+                    "sequence": sequence,
+                    "final_score": acc / num_steps
                 })
+                continue
+            lo, hi = ranges[step][0][idx], ranges[step][1][idx]
+            next_scores = steps[step + 1][2]
+            next_g = g[step + 1]
+            for j in range(lo, hi):
+                if np.isfinite(next_g[j]):
+                    child = (step + 1, j, node)
+                    heapq.heappush(heap, (-(acc + next_g[j]), next(counter), video_idx, acc + next_scores[j], child))
+
+        print(f"--- Tìm thấy {len(all_valid_sequences)} chuỗi tốt nhất. ---")
+        return all_valid_sequences
+
 
-        print(f"--- Tìm thấy tổng cộng {len(all_valid_sequences)} chuỗi hợp lệ. Đang sắp xếp... ---")
-        sorted_sequences = sorted(all_valid_sequences, key=lambda x: x['final_score'], reverse=True)
-        
-        return sorted_sequences[:max_sequences]
\ No newline at end of file
+def _clip_ranked(candidates: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+    """Ứng viên của một bước theo thứ hạng CLIP thô (dùng khi không kịp rerank)."""
+    ranked = []
+    for cand in candidates[:top_k]:
+        ranked_cand = dict(cand)
+        ranked_cand['scores'] = {'clip_score': cand.get('clip_score', 0.0)}
+        ranked_cand['final_score'] = cand.get('clip_score', 0.0)
+        ranked.append(ranked_cand)
+    return ranked
+
+
+def _range_max(values: np.ndarray, lo: np.ndarray, hi: np.ndarray, bounded: bool) -> np.ndarray:
+    """
+    max(values[lo[i]:hi[i]]) cho mọi i (khoảng rỗng -> -inf).
+    bounded=False: mọi hi đều bằng len(values) nên chỉ cần mảng suffix-max.
+    bounded=True: dùng sparse table O(n log n) dựng một lần, truy vấn O(1).
+    """
+    n = len(values)
+    out = np.full(len(lo), -np.inf)
+    if n == 0:
+        return out
+    non_empty = lo < hi
+    if not bounded:
+        suffix_max = np.maximum.accumulate(values[::-1])[::-1]
+        out[non_empty] = suffix_max[lo[non_empty]]
+        return out
+
+    table = [values]
+    width = 1
+    while width * 2 <= n:
+        prev = table[-1]
+        table.append(np.maximum(prev[:-width], prev[width:]))
+        width *= 2
+    lengths = hi[non_empty] - lo[non_empty]
+    levels = np.floor(np.log2(lengths)).astype(np.int64)
+    lo_ne, hi_ne = lo[non_empty], hi[non_empty]
+    result = np.empty(len(lengths))
+    for level in np.unique(levels):
+        mask = levels == level
+        row = table[level]
+        result[mask] = np.maximum(row[lo_ne[mask]], row[hi_ne[mask] - (1 << int(level))])
+    out[non_empty] = result
+    return out
+
+
+def _viterbi_backward(steps, min_gap: float, max_gap: Optional[float]):
+    """
+    Tính g[s] (điểm tốt nhất từ bước s đến hết, bắt đầu tại từng ứng viên) và khoảng chỉ số
+    [lo, hi) các ứng viên hợp lệ ở bước s+1 cho từng ứng viên ở bước s.
+    """
+    num_steps = len(steps)
+    g = [None] * num_steps
+    ranges = [None] * num_steps
+    g[-1] = steps[-1][2].copy()
+    for s in range(num_steps - 2, -1, -1):
+        ts, scores = steps[s][1], steps[s][2]
+        next_ts = steps[s + 1][1]
+        # Thứ tự nghiêm ngặt: min_gap = 0 nghĩa là t_next > t_cur.
+        lo = np.searchsorted(next_ts, ts + min_gap, side='right' if min_gap == 0 else 'left')
+        if max_gap is not None:
+            hi = np.searchsorted(next_ts, ts + max_gap, side='right')
+        else:
+            hi = np.full(len(ts), len(next_ts), dtype=np.int64)
+        best_next = _range_max(g[s + 1], lo, hi, bounded=max_gap is not None)
+        g[s] = scores + best_next
+        ranges[s] = (lo, hi)
+    return g, ranges
@@ -0,0 +1,626 @@
+# /search_core/transcript_index.py
+
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+_QUERY_PATTERN = re.compile(r'"([^"]*)"|\bNEAR/(\d+)\b|(\S+)')
+_FUZZY_SUFFIX = re.compile(r'~(\d)?$')
+_POSITION_BITS = 32
+
+
+def _build_fold_table() -> Dict[int, str]:
+    """
+    Bảng bỏ dấu theo TỪNG KÝ TỰ (ví dụ 'ệ' -> 'e', 'đ' -> 'd').
+    Mỗi ký tự NFC chỉ ánh xạ sang đúng một ký tự, nên độ dài chuỗi (và offset) được giữ nguyên.
+    """
+    table = {ord('đ'): 'd', ord('Đ'): 'D'}
+    for code_point in range(0x00C0, 0x1F00):
+        char = chr(code_point)
+        base = ''.join(c for c in unicodedata.normalize('NFD', char) if not unicodedata.combining(c))
+        if len(base) == 1 and base != char:
+            table[code_point] = base
+    return table
+
+
+_FOLD_TABLE = _build_fold_table()
+
+
+def normalize_text(text: str, fold_diacritics: bool = False) -> str:
+    """
+    Chuẩn hóa văn bản cho việc lập chỉ mục/truy vấn: Unicode NFC + chữ thường,
+    và (tùy chọn) bỏ dấu tiếng Việt.
+    """
+    text = unicodedata.normalize('NFC', text or '').lower()
+    if fold_diacritics:
+        text = text.translate(_FOLD_TABLE)
+    return text
+
+
+def tokenize(text: str, fold_diacritics: bool = False) -> List[Tuple[str, int, int]]:
+    """
+    Tách token kèm offset ký tự [start, end) trên chuỗi đã chuẩn hóa NFC.
+
+    Returns:
+        List[Tuple[str, int, int]]: Danh sách (token, start, end).
+    """
+    normalized = normalize_text(text, fold_diacritics)
+    return [(m.group(), m.start(), m.end()) for m in TOKEN_PATTERN.finditer(normalized)]
+
+
+def _trigrams(term: str) -> List[str]:
+    """
+    Các trigram ký tự (không trùng) của một token, có đệm '$' ở hai đầu.
+    Tính trên dạng ĐÃ BỎ DẤU: lỗi ASR thường chỉ sai dấu thanh, mà với âm tiết ngắn thì
+    một dấu sai đủ làm mất gần hết trigram chung (ví dụ 'viet' và 'việt').
+    """
+    padded = f"${term.translate(_FOLD_TABLE)}$"
+    return list(dict.fromkeys(padded[i:i + 3] for i in range(max(len(padded) - 2, 1))))
+
+
+def _edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Khoảng cách Levenshtein, dừng sớm (trả về max_distance + 1) khi chắc chắn vượt ngưỡng."""
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class TranscriptIndex:
+    """
+    Inverted index (token -> danh sách dòng) cho transcript, lưu dạng CSR:
+        - vocab: từ điển token -> term_id (vocab_terms sắp xếp tăng dần)
+        - offsets[term_id] : offsets[term_id + 1] là đoạn posting của token
+        - rows: chỉ số dòng (tăng dần trong mỗi posting)
+        - tf: số lần token xuất hiện trong dòng tương ứng
+        - positions / char_starts / char_ends: với posting thứ k, đoạn
+          position_offsets[k] : position_offsets[k + 1] chứa vị trí token (thứ tự từ trong
+          dòng) và offset ký tự [start, end) của từng lần xuất hiện
+
+    Dựng một lần khi khởi động (hoặc nạp từ file .npz đã dựng sẵn). Cú pháp truy vấn:
+        - từ thường: AND giữa các từ (giao posting list, bắt đầu từ list ngắn nhất)
+        - "cụm từ chính xác": so khớp vị trí liên tiếp
+        - A NEAR/k B: A và B cách nhau không quá k từ (hai chiều)
+        - tiền_tố*: mọi token bắt đầu bằng tiền tố (gộp posting của một đoạn vocab)
+        - từ~ hoặc từ~N: mọi token trong vocab cách từ đó tối đa N lỗi chỉnh sửa
+          (chọn ứng viên qua chỉ mục trigram bỏ dấu của vocab)
+    Tất cả được đánh giá bằng cách trộn posting list, không quét lại văn bản.
+    """
+    def __init__(self, fold_diacritics: bool = False):
+        self.fold_diacritics = fold_diacritics
+        self.num_rows = 0
+        # Dấu vân tay của dữ liệu đã dùng để dựng index (do nơi gọi gán), dùng để phát hiện index cũ.
+        self.fingerprint = ''
+        self.vocab: Dict[str, int] = {}
+        self.vocab_terms = np.array([], dtype=str)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.rows = np.array([], dtype=np.int32)
+        self.tf = np.array([], dtype=np.int32)
+        self.positions = np.array([], dtype=np.int32)
+        self.char_starts = np.array([], dtype=np.int32)
+        self.char_ends = np.array([], dtype=np.int32)
+        self.position_offsets = np.zeros(1, dtype=np.int64)
+        self.doc_lengths = np.array([], dtype=np.float32)
+        self.idf = np.array([], dtype=np.float32)
+        self.avg_doc_length = 0.0
+
+    @classmethod
+    def build(cls, texts: Iterable[str], fold_diacritics: bool = False) -> 'TranscriptIndex':
+        """Dựng index từ danh sách văn bản (chỉ số dòng = vị trí trong danh sách)."""
+        index = cls(fold_diacritics=fold_diacritics)
+        term_ids: Dict[str, int] = {}
+        posting_terms: List[int] = []
+        posting_rows: List[int] = []
+        posting_tf: List[int] = []
+        flat_positions: List[int] = []
+        flat_starts: List[int] = []
+        flat_ends: List[int] = []
+        num_rows = 0
+        for row, text in enumerate(texts):
+            num_rows += 1
+            occurrences: Dict[str, List[Tuple[int, int, int]]] = {}
+            for position, match in enumerate(TOKEN_PATTERN.finditer(normalize_text(text, fold_diacritics))):
+                occurrences.setdefault(match.group(), []).append((position, match.start(), match.end()))
+            for term, term_occurrences in occurrences.items():
+                posting_terms.append(term_ids.setdefault(term, len(term_ids)))
+                posting_rows.append(row)
+                posting_tf.append(len(term_occurrences))
+                for position, char_start, char_end in term_occurrences:
+                    flat_positions.append(position)
+                    flat_starts.append(char_start)
+                    flat_ends.append(char_end)
+
+        # Đánh lại term_id theo thứ tự từ điển để vocab_terms luôn được sắp xếp.
+        unsorted_terms = list(term_ids.keys())
+        alphabetical = np.argsort(np.array(unsorted_terms, dtype=str), kind='stable') if unsorted_terms else np.array([], dtype=np.int64)
+        remap = np.empty(len(unsorted_terms), dtype=np.int64)
+        remap[alphabetical] = np.arange(len(unsorted_terms))
+
+        terms = remap[np.asarray(posting_terms, dtype=np.int64)] if posting_terms else np.array([], dtype=np.int64)
+        rows = np.asarray(posting_rows, dtype=np.int32)
+        tf = np.asarray(posting_tf, dtype=np.int32)
+        order = np.lexsort((rows, terms))
+
+        # Sắp lại mảng vị trí phẳng theo thứ tự posting mới (mỗi posting giữ nguyên khối tf vị trí).
+        old_starts = np.cumsum(tf, dtype=np.int64) - tf
+        new_tf = tf[order]
+        new_starts = np.cumsum(new_tf, dtype=np.int64) - new_tf
+        gather = (np.arange(int(new_tf.sum()), dtype=np.int64)
+                  - np.repeat(new_starts, new_tf) + np.repeat(old_starts[order], new_tf))
+
+        index.num_rows = num_rows
+        index.vocab_terms = np.array(unsorted_terms, dtype=str)[alphabetical] if unsorted_terms else np.array([], dtype=str)
+        index.rows = rows[order]
+        index.tf = new_tf
+        index.offsets = np.searchsorted(terms[order], np.arange(len(unsorted_terms) + 1), side='left').astype(np.int64)
+        index.positions = np.asarray(flat_positions, dtype=np.int32)[gather]
+        index.char_starts = np.asarray(flat_starts, dtype=np.int32)[gather]
+        index.char_ends = np.asarray(flat_ends, dtype=np.int32)[gather]
+        index._finalize()
+        return index
+
+    def _finalize(self):
+        """Dựng từ điển token và các mảng thống kê BM25 (độ dài dòng, IDF) từ dữ liệu CSR."""
+        self.vocab = {term: term_id for term_id, term in enumerate(self.vocab_terms.tolist())}
+        self.position_offsets = np.concatenate([[0], np.cumsum(self.tf, dtype=np.int64)])
+        self.doc_lengths = np.bincount(self.rows, weights=self.tf, minlength=self.num_rows).astype(np.float32)
+        self.avg_doc_length = float(self.doc_lengths.mean()) if self.num_rows else 0.0
+        doc_freq = np.diff(self.offsets).astype(np.float64)
+        self.idf = np.log1p((self.num_rows - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+        self._build_trigram_index()
+
+    def _build_trigram_index(self):
+        """
+        Chỉ mục trigram ký tự trên VOCAB (không phải trên các dòng): trigram -> các term_id
+        chứa nó, dạng CSR. Dùng để tìm nhanh các token gần đúng cho truy vấn mờ.
+        """
+        trigram_ids: Dict[str, int] = {}
+        pair_trigrams: List[int] = []
+        pair_terms: List[int] = []
+        self.term_trigram_counts = np.zeros(len(self.vocab_terms), dtype=np.int32)
+        for term_id, term in enumerate(self.vocab_terms.tolist()):
+            grams = _trigrams(term)
+            self.term_trigram_counts[term_id] = len(grams)
+            for gram in grams:
+                pair_trigrams.append(trigram_ids.setdefault(gram, len(trigram_ids)))
+                pair_terms.append(term_id)
+        trigram_codes = np.asarray(pair_trigrams, dtype=np.int64)
+        order = np.argsort(trigram_codes, kind='stable')
+        self.trigram_vocab = trigram_ids
+        self.trigram_terms = np.asarray(pair_terms, dtype=np.int32)[order]
+        self.trigram_offsets = np.searchsorted(trigram_codes[order], np.arange(len(trigram_ids) + 1), side='left').astype(np.int64)
+
+    def fuzzy_term_ids(self,
+                       term: str,
+                       max_edits: Optional[int] = None,
+                       min_similarity: float = 0.2,
+                       limit: int = 20
+                      ) -> List[Tuple[int, str, int]]:
+        """
+        Tìm các token trong vocab gần với `term` (chịu được lỗi chính tả của ASR).
+
+        Ứng viên được chọn qua chỉ mục trigram trên dạng bỏ dấu (số trigram chung / Jaccard
+        >= min_similarity), sau đó chỉ các ứng viên này mới được tính khoảng cách chỉnh sửa
+        (Levenshtein) trên dạng GỐC, nên sai một dấu thanh tính là một lỗi.
+
+        Args:
+            max_edits (Optional[int]): Số lỗi tối đa; mặc định 1 với từ <= 4 ký tự, 2 với từ dài hơn.
+
+        Returns:
+            List[Tuple[int, str, int]]: (term_id, token, số lỗi), xếp theo số lỗi tăng dần
+                                        rồi độ tương đồng trigram giảm dần.
+        """
+        if max_edits is None:
+            max_edits = 1 if len(term) <= 4 else 2
+        grams = [self.trigram_vocab[g] for g in _trigrams(term) if g in self.trigram_vocab]
+        if not grams:
+            return []
+        candidates = np.concatenate([
+            self.trigram_terms[self.trigram_offsets[g]:self.trigram_offsets[g + 1]] for g in grams
+        ])
+        candidate_ids, shared = np.unique(candidates, return_counts=True)
+        similarity = shared / (len(_trigrams(term)) + self.term_trigram_counts[candidate_ids] - shared)
+        keep = similarity >= min_similarity
+        candidate_ids, similarity = candidate_ids[keep], similarity[keep]
+        order = np.argsort(-similarity, kind='stable')[:limit * 5]
+
+        matches = []
+        for i in order:
+            candidate = self.vocab_terms[candidate_ids[i]]
+            if abs(len(candidate) - len(term)) > max_edits:
+                continue
+            distance = _edit_distance(term, candidate, max_edits)
+            if distance <= max_edits:
+                matches.append((int(candidate_ids[i]), str(candidate), distance, -float(similarity[i])))
+        matches.sort(key=lambda m: (m[2], m[3]))
+        return [(term_id, candidate, distance) for term_id, candidate, distance, _ in matches[:limit]]
+
+    def save(self, path: str):
+        """Lưu index ra file .npz (ghi file tạm rồi os.replace)."""
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            vocab_terms=self.vocab_terms, offsets=self.offsets, rows=self.rows, tf=self.tf,
+            positions=self.positions, char_starts=self.char_starts, char_ends=self.char_ends,
+            num_rows=np.array(self.num_rows), fold_diacritics=np.array(self.fold_diacritics),
+            fingerprint=np.array(self.fingerprint)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'TranscriptIndex':
+        """Nạp index đã dựng sẵn từ file .npz."""
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(fold_diacritics=bool(data['fold_diacritics']))
+            index.vocab_terms = data['vocab_terms']
+            index.offsets = data['offsets']
+            index.rows = data['rows']
+            index.tf = data['tf']
+            index.positions = data['positions']
+            index.char_starts = data['char_starts']
+            index.char_ends = data['char_ends']
+            index.num_rows = int(data['num_rows'])
+            index.fingerprint = str(data['fingerprint']) if 'fingerprint' in data.files else ''
+        index._finalize()
+        return index
+
+    def query_terms(self, query: str) -> List[str]:
+        """Các token của truy vấn, chuẩn hóa giống hệt lúc lập chỉ mục."""
+        return TOKEN_PATTERN.findall(normalize_text(query, self.fold_diacritics))
+
+    def postings(self, term: str) -> np.ndarray:
+        """Posting list (các dòng chứa token, tăng dần) của một token đã chuẩn hóa."""
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            return self.rows[0:0]
+        return self.rows[self.offsets[term_id]:self.offsets[term_id + 1]]
+
+    def term_range(self, term: str) -> Tuple[int, int]:
+        """Đoạn term_id [lo, hi) của token chính xác."""
+        term_id = self.vocab.get(term)
+        return (term_id, term_id + 1) if term_id is not None else (0, 0)
+
+    def prefix_range(self, prefix: str) -> Tuple[int, int]:
+        """Đoạn term_id [lo, hi) của mọi token bắt đầu bằng prefix (vocab đã sắp xếp)."""
+        lo = int(np.searchsorted(self.vocab_terms, prefix, side='left'))
+        hi = int(np.searchsorted(self.vocab_terms, prefix + '\U0010ffff', side='left'))
+        return lo, hi
+
+    def occurrences(self, term_ranges: List[Tuple[int, int]], rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Mọi lần xuất hiện của các token trong các đoạn term_id, dưới dạng khóa tổng hợp
+        row * 2^32 + vị trí (đã sắp xếp) cùng mảng chỉ số trong `positions`/`char_starts`.
+
+        Args:
+            rows (Optional[np.ndarray]): Nếu có (mảng tăng dần), chỉ lấy các lần xuất hiện trong
+                                         những dòng này; mỗi posting list chỉ được tra bằng
+                                         searchsorted nên chi phí không phụ thuộc độ dài posting.
+        """
+        entries = []
+        for lo, hi in term_ranges:
+            if lo >= hi:
+                continue
+            if rows is None:
+                entries.append(np.arange(self.offsets[lo], self.offsets[hi], dtype=np.int64))
+                continue
+            for term_id in range(lo, hi):
+                posting_lo, posting_hi = self.offsets[term_id], self.offsets[term_id + 1]
+                posting_rows = self.rows[posting_lo:posting_hi]
+                idx = np.searchsorted(posting_rows, rows)
+                found = idx < len(posting_rows)
+                found[found] = posting_rows[idx[found]] == rows[found]
+                entries.append(posting_lo + idx[found].astype(np.int64))
+        if not entries:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        entries = np.concatenate(entries)
+        entry_tf = self.tf[entries].astype(np.int64)
+        entry_starts = np.cumsum(entry_tf) - entry_tf
+        flat_indices = (np.repeat(self.position_offsets[entries], entry_tf)
+                        + np.arange(int(entry_tf.sum()), dtype=np.int64) - np.repeat(entry_starts, entry_tf))
+        keys = (np.repeat(self.rows[entries].astype(np.int64), entry_tf) << _POSITION_BITS) + self.positions[flat_indices]
+        order = np.argsort(keys, kind='stable')
+        return keys[order], flat_indices[order]
+
+    def _element_ranges(self, term: str, mode: str, max_edits: Optional[int]) -> List[Tuple[int, int]]:
+        """Các đoạn term_id ứng với một phần tử truy vấn (từ chính xác, tiền tố, hoặc mờ)."""
+        if mode == 'prefix':
+            return [self.prefix_range(term)]
+        if mode == 'fuzzy':
+            return [(term_id, term_id + 1) for term_id, _, _ in self.fuzzy_term_ids(term, max_edits=max_edits)]
+        return [self.term_range(term)]
+
+    def _unit_matches(self, 
+                      unit: Tuple[str, List[Tuple[str, str, Optional[int]]]], 
+                      rows: Optional[np.ndarray] = None,
+                      collected: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None
+                     ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Các lần khớp (khóa bắt đầu, khóa kết thúc) của một đơn vị truy vấn: một từ, một
+        tiền tố, một từ mờ hoặc một cụm từ (các phần tử phải đứng liên tiếp).
+        Nếu có `collected`, các lần xuất hiện (khóa, chỉ số phẳng) của từng phần tử được
+        thêm vào đó để tra offset ký tự về sau.
+        """
+        starts = None
+        for offset, (term, mode, max_edits) in enumerate(unit[1]):
+            keys, flat_indices = self.occurrences(self._element_ranges(term, mode, max_edits), rows)
+            if collected is not None:
+                collected.append((keys, flat_indices))
+            if starts is None:
+                starts = keys
+            else:
+                starts = starts[np.isin(starts + offset, keys)]
+            if len(starts) == 0:
+                break
+        if starts is None:
+            starts = np.array([], dtype=np.int64)
+        return starts, starts + max(len(unit[1]) - 1, 0)
+
+    def _clause_spans(self, 
+                      clause: List[Any], 
+                      rows: Optional[np.ndarray] = None,
+                      collected: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None
+                     ) -> Tuple[np.ndarray, np.ndarray]:
+        """Các lần khớp của một mệnh đề (đơn vị đầu tiên, nối tiếp bởi các NEAR/k)."""
+        spans = self._unit_matches(clause[0], rows, collected)
+        for i in range(1, len(clause), 2):
+            spans = self._near(spans, self._unit_matches(clause[i + 1], rows, collected), clause[i])
+        return spans
+
+    @staticmethod
+    def _near(a: Tuple[np.ndarray, np.ndarray], b: Tuple[np.ndarray, np.ndarray], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        A NEAR/k B: giữ các lần khớp của A có một lần khớp B cùng dòng, cách không quá k từ
+        (B sau A hoặc trước A). Kết quả trải dài từ đầu đến cuối cặp khớp.
+        """
+        a_starts, a_ends = a
+        b_starts, b_ends = b
+        if len(a_starts) == 0 or len(b_starts) == 0:
+            return a_starts[0:0], a_ends[0:0]
+        b_order = np.argsort(b_ends, kind='stable')
+        b_ends_sorted, b_starts_by_end = b_ends[b_order], b_starts[b_order]
+
+        # B đứng sau A: lần bắt đầu đầu tiên của B sau khi A kết thúc.
+        after = np.searchsorted(b_starts, a_ends + 1, side='left')
+        has_after = after < len(b_starts)
+        after_start = np.where(has_after, b_starts[np.minimum(after, len(b_starts) - 1)], 0)
+        after_ok = has_after & (after_start - a_ends - 1 <= k)
+        after_end = np.where(after_ok, b_ends[np.minimum(after, len(b_starts) - 1)], a_ends)
+
+        # B đứng trước A: lần kết thúc cuối cùng của B trước khi A bắt đầu.
+        before = np.searchsorted(b_ends_sorted, a_starts, side='left') - 1
+        has_before = before >= 0
+        before_end = np.where(has_before, b_ends_sorted[np.maximum(before, 0)], 0)
+        before_ok = has_before & (a_starts - before_end - 1 <= k)
+        before_start = np.where(before_ok, b_starts_by_end[np.maximum(before, 0)], a_starts)
+
+        keep = after_ok | before_ok
+        return np.minimum(a_starts, before_start)[keep], np.maximum(a_ends, after_end)[keep]
+
+    def parse_query(self, query: str) -> List[List[Any]]:
+        """
+        Tách truy vấn thành các mệnh đề AND. Mỗi mệnh đề là chuỗi xen kẽ
+        [đơn vị, k, đơn vị, k, ...] nối bởi NEAR/k; mỗi đơn vị là
+        ('unit', [(token, mode, max_edits), ...]) với mode là 'exact', 'prefix' hoặc 'fuzzy'.
+        """
+        clauses: List[List[Any]] = []
+        pending_near: Optional[int] = None
+        for match in _QUERY_PATTERN.finditer(query or ''):
+            phrase, near, word = match.group(1), match.group(2), match.group(3)
+            if near is not None:
+                if clauses:
+                    pending_near = int(near)
+                continue
+            text, mode, max_edits = phrase, 'exact', None
+            if phrase is None:
+                fuzzy = _FUZZY_SUFFIX.search(word)
+                if fuzzy:
+                    text, mode = word[:fuzzy.start()], 'fuzzy'
+                    max_edits = int(fuzzy.group(1)) if fuzzy.group(1) else None
+                elif word.endswith('*'):
+                    text, mode = word, 'prefix'
+                else:
+                    text = word
+            tokens = self.query_terms(text)
+            if not tokens:
+                continue
+            elements = [(token, 'exact', None) for token in tokens]
+            elements[-1] = (tokens[-1], mode, max_edits)
+            unit = ('unit', elements)
+            if pending_near is not None:
+                clauses[-1].extend([pending_near, unit])
+                pending_near = None
+            else:
+                clauses.append([unit])
+        return clauses
+
+    def match_spans(self, query: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Tất cả các lần khớp của truy vấn dưới dạng (khóa bắt đầu, khóa kết thúc), với
+        khóa = row * 2^32 + vị trí token. Chỉ giữ các dòng thỏa TẤT CẢ mệnh đề.
+        Trả về None nếu truy vấn không có token nào.
+        """
+        clauses = self.parse_query(query)
+        if not clauses:
+            return None
+        clause_spans = [self._clause_spans(clause) for clause in clauses]
+
+        rows = None
+        for starts, _ in sorted(clause_spans, key=lambda spans: len(spans[0])):
+            clause_rows = np.unique(starts >> _POSITION_BITS)
+            rows = clause_rows if rows is None else np.intersect1d(rows, clause_rows, assume_unique=True)
+        all_starts = np.concatenate([spans[0] for spans in clause_spans])
+        all_ends = np.concatenate([spans[1] for spans in clause_spans])
+        keep = np.isin(all_starts >> _POSITION_BITS, rows)
+        return all_starts[keep], all_ends[keep]
+
+    def highlight_offsets(self, query: str, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Offset ký tự của mọi đoạn khớp truy vấn trong các dòng cho trước, lấy trực tiếp từ
+        posting có vị trí (không quét lại văn bản). Khác với search(), mỗi mệnh đề được
+        tô sáng độc lập, không yêu cầu dòng phải thỏa tất cả mệnh đề.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: (dòng, char_start, char_end) trên văn bản NFC của dòng.
+        """
+        empty = (np.array([], dtype=np.int64),) * 3
+        clauses = self.parse_query(query)
+        rows = np.unique(np.asarray(rows, dtype=self.rows.dtype))
+        if not clauses or len(rows) == 0:
+            return empty
+
+        collected: List[Tuple[np.ndarray, np.ndarray]] = []
+        spans = [self._clause_spans(clause, rows, collected) for clause in clauses]
+        starts = np.concatenate([span[0] for span in spans])
+        ends = np.concatenate([span[1] for span in spans])
+        if len(starts) == 0:
+            return empty
+
+        lookup_keys, first = np.unique(np.concatenate([keys for keys, _ in collected]), return_index=True)
+        lookup_flat = np.concatenate([flat for _, flat in collected])[first]
+        start_flat = lookup_flat[np.searchsorted(lookup_keys, starts)]
+        end_flat = lookup_flat[np.searchsorted(lookup_keys, ends)]
+        return starts >> _POSITION_BITS, self.char_starts[start_flat], self.char_ends[end_flat]
+
+    def search(self, query: str) -> Optional[np.ndarray]:
+        """
+        Các dòng thỏa truy vấn (từ thường, "cụm từ", A NEAR/k B, tiền_tố*, từ_mờ~).
+
+        Returns:
+            Optional[np.ndarray]: Mảng chỉ số dòng tăng dần, hoặc None nếu truy vấn
+                                  không có token nào (người gọi tự quyết định cách xử lý).
+        """
+        clauses = self.parse_query(query)
+        if not clauses:
+            return None
+        simple_terms = [
+            clause[0][1][0][0] for clause in clauses
+            if len(clause) == 1 and len(clause[0][1]) == 1 and clause[0][1][0][1] == 'exact'
+        ]
+        if len(simple_terms) == len(clauses):
+            # Chỉ có từ thường: giao posting list, không cần đến vị trí.
+            posting_lists = sorted((self.postings(term) for term in dict.fromkeys(simple_terms)), key=len)
+            result = posting_lists[0]
+            for posting in posting_lists[1:]:
+                if len(result) == 0:
+                    break
+                result = np.intersect1d(result, posting, assume_unique=True)
+            return result
+        starts, _ = self.match_spans(query)
+        return np.unique(starts >> _POSITION_BITS).astype(self.rows.dtype)
+
+    def scoring_terms(self, query: str) -> List[str]:
+        """
+        Các token dùng cho BM25 và tăng điểm lân cận: từ chính xác, cộng với các token
+        trong vocab mà từ mờ (~) khớp tới. Tiền tố không được tính điểm.
+        """
+        terms: List[str] = []
+        for clause in self.parse_query(query):
+            for item in clause:
+                if not isinstance(item, tuple):
+                    continue
+                for token, mode, max_edits in item[1]:
+                    if mode == 'exact':
+                        terms.append(token)
+                    elif mode == 'fuzzy':
+                        terms.extend(term for _, term, _ in self.fuzzy_term_ids(token, max_edits=max_edits))
+        return list(dict.fromkeys(terms))
+
+    def positions_in_row(self, term: str, row: int) -> np.ndarray:
+        """Vị trí (thứ tự từ) của token trong một dòng, dùng posting list có vị trí."""
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            return self.positions[0:0]
+        lo, hi = self.offsets[term_id], self.offsets[term_id + 1]
+        k = lo + int(np.searchsorted(self.rows[lo:hi], row))
+        if k >= hi or self.rows[k] != row:
+            return self.positions[0:0]
+        return self.positions[self.position_offsets[k]:self.position_offsets[k + 1]]
+
+    def bm25(self,
+             query: str,
+             top_n: int = 100,
+             candidate_rows: Optional[np.ndarray] = None,
+             k1: float = 1.2,
+             b: float = 0.75
+            ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Xếp hạng các dòng theo BM25 (OR trên các token của truy vấn).
+
+        Chỉ duyệt posting list của các token trong truy vấn; độ dài dòng và IDF đã được
+        tính sẵn khi dựng index.
+
+        Args:
+            candidate_rows (Optional[np.ndarray]): Nếu có, chỉ xếp hạng trong các dòng này.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (các dòng, điểm BM25) của top-N, điểm giảm dần.
+        """
+        empty = (self.rows[0:0], np.array([], dtype=np.float32))
+        term_ids = [self.vocab[t] for t in self.scoring_terms(query) if t in self.vocab]
+        if not term_ids or top_n <= 0:
+            return empty
+
+        all_rows, all_scores = [], []
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows = self.rows[start:end]
+            tf = self.tf[start:end].astype(np.float32)
+            norm = k1 * (1.0 - b + b * self.doc_lengths[rows] / max(self.avg_doc_length, 1e-9))
+            all_rows.append(rows)
+            all_scores.append(self.idf[term_id] * tf * (k1 + 1.0) / (tf + norm))
+        rows = np.concatenate(all_rows)
+        scores = np.concatenate(all_scores)
+
+        if candidate_rows is not None:
+            in_candidates = np.isin(rows, candidate_rows)
+            rows, scores = rows[in_candidates], scores[in_candidates]
+            if len(rows) == 0:
+                return empty
+
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        row_scores = np.bincount(inverse, weights=scores).astype(np.float32)
+        if len(unique_rows) > top_n:
+            top = np.argpartition(-row_scores, top_n - 1)[:top_n]
+        else:
+            top = np.arange(len(unique_rows))
+        top = top[np.argsort(-row_scores[top], kind='stable')]
+        return unique_rows[top], row_scores[top]
+
+
+def min_cover_span(term_positions: List[Tuple[int, str]]) -> Optional[int]:
+    """
+    Độ dài (tính bằng số token) của cửa sổ ngắn nhất chứa tất cả các token khác nhau
+    xuất hiện trong danh sách (vị trí, token). Trả về None nếu có ít hơn 2 token khác nhau.
+    """
+    distinct = {term for _, term in term_positions}
+    if len(distinct) < 2:
+        return None
+    events = sorted(term_positions)
+    counts: Dict[str, int] = {}
+    covered = 0
+    best = None
+    left = 0
+    for position, term in events:
+        counts[term] = counts.get(term, 0) + 1
+        if counts[term] == 1:
+            covered += 1
+        while covered == len(distinct):
+            left_position, left_term = events[left]
+            span = position - left_position + 1
+            if best is None or span < best:
+                best = span
+            counts[left_term] -= 1
+            if counts[left_term] == 0:
+                covered -= 1
+            left += 1
+    return best
@@ -1,6 +1,63 @@
+import html
+import hashlib
 import pandas as pd
 import os
-from typing import Optional
+import faiss
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from utils.temporal_utils import VideoTimelineIndex
+from search_core.transcript_index import TranscriptIndex, min_cover_span
+
+
+def _mark_spans(text: str, starts: np.ndarray, ends: np.ndarray) -> str:
+    """Bọc các đoạn [start, end) của văn bản bằng <mark> (bỏ phần chồng lấn), trả về HTML đã escape."""
+    order = np.argsort(starts, kind='stable')
+    pieces, cursor = [], 0
+    for start, end in zip(np.asarray(starts)[order].tolist(), np.asarray(ends)[order].tolist()):
+        if end <= cursor:
+            continue
+        start = max(start, cursor)
+        pieces.append(html.escape(text[cursor:start]))
+        pieces.append(f"<mark>{html.escape(text[start:end])}</mark>")
+        cursor = end
+    pieces.append(html.escape(text[cursor:]))
+    return "".join(pieces).replace("\n", "<br>")
+
+
+def load_transcript_data(metadata_path: str) -> pd.DataFrame:
+    """
+    Tải và làm sạch dữ liệu transcript (strip, chuẩn hóa NFC, bỏ dòng rỗng).
+    Thứ tự dòng trả về chính là "chỉ số dòng" dùng chung cho inverted index và
+    chỉ mục ngữ nghĩa dựng offline (build_transcript_embeddings.py).
+    """
+    if not os.path.exists(metadata_path):
+        raise FileNotFoundError(f"File metadata không tồn tại tại: {metadata_path}")
+
+    cols_to_load = [
+        'video_id', 'timestamp', 'transcript_text', 'keyframe_path'
+    ]
+
+    print(f"-> Đang tải dữ liệu transcript từ {metadata_path}...")
+    full_data = pd.read_parquet(metadata_path, columns=cols_to_load)
+    print("-> Đang làm sạch (strip) và lọc dữ liệu transcript...")
+    full_data['transcript_text'] = full_data['transcript_text'].str.strip().str.normalize('NFC')
+    full_data.dropna(subset=['transcript_text'], inplace=True)
+    full_data = full_data[full_data['transcript_text'] != ''].copy()
+    full_data.reset_index(drop=True, inplace=True)
+    return full_data
+
+
+def transcript_fingerprint(full_data: pd.DataFrame) -> str:
+    """
+    Dấu vân tay nội dung của transcript đã làm sạch (video_id, timestamp, transcript_text theo
+    đúng thứ tự dòng). Được lưu kèm các chỉ mục dựng sẵn để phát hiện chỉ mục cũ khi dữ liệu
+    thay đổi mà số dòng vẫn giữ nguyên.
+    """
+    row_hashes = pd.util.hash_pandas_object(full_data[['video_id', 'timestamp', 'transcript_text']], index=False)
+    return hashlib.sha1(row_hashes.to_numpy().tobytes()).hexdigest()
+
 
 class TranscriptSearcher:
     """
@@ -8,41 +65,196 @@ class TranscriptSearcher:
     Nó tải trước toàn bộ dữ liệu vào bộ nhớ để thực hiện các thao tác
     lọc và tìm kiếm lồng nhau một cách gần như tức thời.
     """
-    def __init__(self, metadata_path: str):
+    def __init__(self, 
+                 metadata_path: str, 
+                 index_path: Optional[str] = None, 
+                 fold_diacritics: bool = False,
+                 embedding_model: Optional[Any] = None,
+                 semantic_index_path: Optional[str] = None,
+                 semantic_rows_path: Optional[str] = None):
         """
         Khởi tạo TranscriptSearcher bằng cách tải và chuẩn bị dữ liệu.
-        PHIÊN BẢN NÂNG CẤP: Tự động làm sạch (strip) dữ liệu transcript.
+        PHIÊN BẢN NÂNG CẤP: Tự động làm sạch (strip) dữ liệu transcript và dựng inverted index.
 
         Args:
             metadata_path (str): Đường dẫn đến file rerank_metadata_v6.parquet.
+            index_path (Optional[str]): File .npz của inverted index. Nếu tồn tại và khớp dữ liệu
+                                        thì nạp lại; nếu chưa có thì dựng mới và lưu vào đây.
+            fold_diacritics (bool): Tìm kiếm không phân biệt dấu tiếng Việt.
+            embedding_model: Bi-Encoder (SentenceTransformer) đã nạp sẵn, dùng để encode truy vấn ngữ nghĩa.
+            semantic_index_path / semantic_rows_path: FAISS index và bảng ánh xạ cửa sổ -> dòng
+                                                      do build_transcript_embeddings.py tạo ra.
         """
         print("--- 🧠 Khởi tạo Transcript Searcher (Động cơ 'Tai Thính')... ---")
         self.full_data: Optional[pd.DataFrame] = None
+        self.data_fingerprint = ''
+        self.timeline: Optional[VideoTimelineIndex] = None
+        self.index: Optional[TranscriptIndex] = None
+        self.embedding_model = embedding_model
+        self.semantic_index = None
+        self.semantic_window_rows: Optional[np.ndarray] = None
+        self.video_documents: Dict[str, str] = {}
+        self.row_document_offsets: Optional[np.ndarray] = None
         
         try:
-            if not os.path.exists(metadata_path):
-                raise FileNotFoundError(f"File metadata không tồn tại tại: {metadata_path}")
-            
-            cols_to_load = [
-                'video_id', 'timestamp', 'transcript_text', 'keyframe_path'
-            ]
-            
-            print(f"-> Đang tải dữ liệu transcript từ {metadata_path}...")
-            self.full_data = pd.read_parquet(metadata_path, columns=cols_to_load)
-            print("-> Đang làm sạch (strip) và lọc dữ liệu transcript...")
-            self.full_data['transcript_text'] = self.full_data['transcript_text'].str.strip()
-            self.full_data.dropna(subset=['transcript_text'], inplace=True)
-            self.full_data = self.full_data[self.full_data['transcript_text'] != ''].copy()
-            self.full_data.reset_index(drop=True, inplace=True)
+            self.full_data = load_transcript_data(metadata_path)
+            self.data_fingerprint = transcript_fingerprint(self.full_data)
+            self.timeline = VideoTimelineIndex.from_dataframe(self.full_data)
+            self.index = self._load_or_build_index(index_path, fold_diacritics)
+            self._video_codes = pd.factorize(self.full_data['video_id'])[0].astype(np.int64)
+            self._timestamps = self.full_data['timestamp'].to_numpy(dtype=np.float64)
+            self._load_semantic_index(semantic_index_path, semantic_rows_path)
+            self._build_video_documents()
             
             print(f"--- ✅ Transcript Searcher đã nạp và chuẩn bị {len(self.full_data)} dòng transcript sạch. Sẵn sàng hoạt động! ---")
 
         except Exception as e:
             print(f"--- ❌ LỖI NGHIÊM TRỌNG khi khởi tạo TranscriptSearcher: {e} ---")
             
+    def _load_or_build_index(self, index_path: Optional[str], fold_diacritics: bool) -> TranscriptIndex:
+        """
+        Nạp inverted index từ đĩa nếu khớp dữ liệu hiện tại (số dòng, chế độ bỏ dấu và dấu vân tay
+        nội dung), nếu không thì dựng mới (và lưu lại).
+        """
+        if index_path and os.path.exists(index_path):
+            try:
+                index = TranscriptIndex.load(index_path)
+                if (index.num_rows == len(self.full_data) and index.fold_diacritics == fold_diacritics
+                        and index.fingerprint == self.data_fingerprint):
+                    print(f"-> Đã nạp inverted index dựng sẵn từ {index_path} ({len(index.vocab)} token).")
+                    return index
+                print("-> ⚠️ Inverted index trên đĩa không khớp dữ liệu hiện tại. Dựng lại...")
+            except Exception as e:
+                print(f"-> ⚠️ Không nạp được inverted index từ {index_path}: {e}. Dựng lại...")
+
+        print("-> Đang dựng inverted index cho transcript...")
+        index = TranscriptIndex.build(self.full_data['transcript_text'].tolist(), fold_diacritics=fold_diacritics)
+        index.fingerprint = self.data_fingerprint
+        print(f"-> Đã dựng inverted index: {len(index.vocab)} token, {len(index.rows)} posting.")
+        if index_path:
+            try:
+                os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+                index.save(index_path)
+            except OSError as e:
+                print(f"-> ⚠️ Không lưu được inverted index: {e}")
+        return index
+
+    def _load_semantic_index(self, index_path: Optional[str], rows_path: Optional[str]):
+        """
+        Nạp chỉ mục ngữ nghĩa dựng offline nếu có và khớp với dữ liệu transcript hiện tại
+        (số dòng và dấu vân tay nội dung).
+        """
+        if not index_path or not rows_path:
+            return
+        if not (os.path.exists(index_path) and os.path.exists(rows_path)):
+            print("-> ⚠️ Chưa có chỉ mục ngữ nghĩa cho transcript. Chạy build_transcript_embeddings.py để tạo.")
+            return
+        if self.embedding_model is None:
+            print("-> ⚠️ Không có Bi-Encoder. Bỏ qua chỉ mục ngữ nghĩa cho transcript.")
+            return
+        try:
+            with np.load(rows_path, allow_pickle=False) as data:
+                window_rows = data['window_rows']
+                num_rows = int(data['num_rows'])
+                fingerprint = str(data['fingerprint']) if 'fingerprint' in data.files else ''
+            if num_rows != len(self.full_data) or fingerprint != self.data_fingerprint:
+                print("-> ⚠️ Chỉ mục ngữ nghĩa không khớp dữ liệu transcript hiện tại. Hãy dựng lại.")
+                return
+            self.semantic_index = faiss.read_index(index_path)
+            self.semantic_window_rows = window_rows
+            print(f"-> Đã nạp chỉ mục ngữ nghĩa transcript ({self.semantic_index.ntotal} cửa sổ).")
+        except Exception as e:
+            print(f"-> ⚠️ Không nạp được chỉ mục ngữ nghĩa transcript: {e}")
+            self.semantic_index = None
+            self.semantic_window_rows = None
+
+    def _build_video_documents(self):
+        """
+        Dựng sẵn văn bản transcript đầy đủ của từng video (các dòng nối theo thứ tự thời gian)
+        cùng offset ký tự bắt đầu của từng dòng trong văn bản đó. Mở một kết quả chỉ còn
+        là một lần tra dict, không phụ thuộc kích thước corpus.
+        """
+        texts = self.full_data['transcript_text'].to_numpy()
+        self.row_document_offsets = np.zeros(len(texts), dtype=np.int64)
+        for video_id in self.timeline.video_ids:
+            rows = self.timeline.video_rows(video_id)
+            parts = texts[rows].tolist()
+            lengths = np.fromiter((len(part) + 1 for part in parts), dtype=np.int64, count=len(parts))
+            self.row_document_offsets[rows] = np.cumsum(lengths) - lengths
+            self.video_documents[video_id] = " ".join(parts)
+
+    def get_video_document(self, video_id: str) -> str:
+        """Toàn bộ transcript của video (đã dựng sẵn), chuỗi rỗng nếu video không có lời thoại."""
+        return self.video_documents.get(str(video_id), "")
+
+    def highlight_video_document(self, video_id: str, queries: List[str]) -> str:
+        """
+        Trả về HTML transcript đầy đủ của video với các đoạn khớp truy vấn được bọc <mark>.
+        Vị trí tô sáng lấy từ posting có vị trí của inverted index, chỉ trên các dòng của video.
+        """
+        document = self.get_video_document(video_id)
+        queries = [q for q in queries if q and q.strip()]
+        if not document or not queries or self.index is None:
+            return html.escape(document).replace("\n", "<br>")
+
+        rows = self.timeline.video_rows(video_id)
+        span_starts, span_ends = [], []
+        for query in queries:
+            match_rows, char_starts, char_ends = self.index.highlight_offsets(query, rows)
+            base = self.row_document_offsets[match_rows]
+            span_starts.append(base + char_starts)
+            span_ends.append(base + char_ends)
+        return _mark_spans(document, np.concatenate(span_starts), np.concatenate(span_ends))
+
+    def highlight_rows(self, rows: np.ndarray, queries: List[str]) -> List[str]:
+        """
+        HTML đã tô sáng của từng dòng trong `rows` (giữ nguyên thứ tự), dùng offset từ
+        inverted index. Chỉ nên gọi cho các dòng đang hiển thị (một trang kết quả).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        texts = self.full_data['transcript_text'].to_numpy()[rows]
+        queries = [q for q in queries if q and q.strip()]
+        if not queries or self.index is None or len(rows) == 0:
+            return [html.escape(text).replace("\n", "<br>") for text in texts]
+
+        match_rows, span_starts, span_ends = [], [], []
+        for query in queries:
+            query_rows, char_starts, char_ends = self.index.highlight_offsets(query, rows)
+            match_rows.append(query_rows)
+            span_starts.append(char_starts)
+            span_ends.append(char_ends)
+        match_rows = np.concatenate(match_rows)
+        span_starts = np.concatenate(span_starts)
+        span_ends = np.concatenate(span_ends)
+
+        highlighted = []
+        for row, text in zip(rows.tolist(), texts):
+            mask = match_rows == row
+            highlighted.append(_mark_spans(text, span_starts[mask], span_ends[mask]))
+        return highlighted
+
+    def get_video_transcript(self, video_id: str, t_start: Optional[float] = None, t_end: Optional[float] = None) -> pd.DataFrame:
+        """
+        Lấy các dòng transcript của một video theo thứ tự thời gian (tùy chọn giới hạn
+        trong [t_start, t_end]) bằng chỉ mục thời gian, không cần quét toàn bộ DataFrame.
+        """
+        if self.full_data is None or self.timeline is None:
+            return pd.DataFrame()
+        if t_start is None and t_end is None:
+            rows = self.timeline.video_rows(video_id)
+        else:
+            rows = self.timeline.frames_between(
+                video_id,
+                float('-inf') if t_start is None else t_start,
+                float('inf') if t_end is None else t_end
+            )
+        return self.full_data.iloc[rows]
+
     def search(self, search_term: str, current_results: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
-        Thực hiện tìm kiếm trên transcript. (Logic không thay đổi)
+        Thực hiện tìm kiếm trên transcript bằng inverted index: một dòng khớp khi chứa
+        TẤT CẢ các từ của truy vấn (sau chuẩn hóa NFC, chữ thường, tùy chọn bỏ dấu).
+        Hỗ trợ "cụm từ chính xác", A NEAR/k B và tiền_tố*.
         """
         if self.full_data is None:
             print("--- ⚠️ TranscriptSearcher chưa được khởi tạo thành công. Bỏ qua tìm kiếm. ---")
@@ -51,10 +263,206 @@ class TranscriptSearcher:
         if not search_term or not search_term.strip():
             return current_results if current_results is not None else self.full_data
 
-        source_df = self.full_data if current_results is None else current_results
-        
-        filtered_df = source_df[
-            source_df['transcript_text'].str.contains(search_term, case=False, na=False)
-        ].copy()
-        
-        return filtered_df
\ No newline at end of file
+        candidate_rows = current_results.index.to_numpy() if current_results is not None else None
+        return self.full_data.iloc[self.search_rows(search_term, candidate_rows)].copy()
+
+    def search_rows(self, search_term: str, candidate_rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Giống search() nhưng chỉ trả về mảng chỉ số dòng (vị trí trong full_data, tăng dần),
+        không dựng DataFrame. Dùng để lọc nhiều tầng với số lượng kết quả lớn.
+        """
+        if candidate_rows is not None:
+            candidate_rows = np.asarray(candidate_rows, dtype=np.int64)
+        if not search_term or not search_term.strip():
+            return np.arange(len(self.full_data), dtype=np.int64) if candidate_rows is None else candidate_rows
+
+        matched_rows = self.index.search(search_term) if self.index is not None else None
+        if matched_rows is None:
+            # Truy vấn không có token nào (chỉ dấu câu...) -> so khớp chuỗi con như cũ.
+            texts = self.full_data['transcript_text']
+            if candidate_rows is not None:
+                texts = texts.iloc[candidate_rows]
+            contains = texts.str.contains(search_term, case=False, na=False, regex=False).to_numpy()
+            return texts.index.to_numpy(dtype=np.int64)[contains]
+
+        matched_rows = np.asarray(matched_rows, dtype=np.int64)
+        if candidate_rows is None:
+            return matched_rows
+        # Chỉ số của full_data là vị trí dòng (đã reset_index), nên giao trực tiếp theo chỉ số.
+        return candidate_rows[np.isin(candidate_rows, matched_rows)]
+
+    def search_ranked(self,
+                      search_term: str,
+                      top_n: int = 200,
+                      current_results: Optional[pd.DataFrame] = None,
+                      proximity_weight: float = 0.5,
+                      proximity_pool: int = 3
+                     ) -> pd.DataFrame:
+        """
+        Tìm kiếm có xếp hạng: chấm điểm BM25 trên inverted index và chỉ trả về top-N.
+
+        Với truy vấn nhiều từ, top (proximity_pool * top_n) ứng viên được tra vị trí từ
+        trong posting list để tìm cửa sổ ngắn nhất chứa các từ của truy vấn; điểm được nhân thêm
+        (1 + proximity_weight * (số từ khớp - 1) / độ dài cửa sổ), nên các dòng có các từ
+        đứng gần nhau được đẩy lên.
+
+        Returns:
+            pd.DataFrame: Các dòng top-N (theo điểm giảm dần) kèm cột 'bm25_score'.
+        """
+        if self.full_data is None or self.index is None:
+            print("--- ⚠️ TranscriptSearcher chưa được khởi tạo thành công. Bỏ qua tìm kiếm. ---")
+            return pd.DataFrame()
+
+        candidate_rows = current_results.index.to_numpy() if current_results is not None else None
+        rows, scores = self.index.bm25(search_term, top_n=top_n * proximity_pool, candidate_rows=candidate_rows)
+        if len(rows) == 0:
+            return pd.DataFrame()
+
+        query_terms = self.index.scoring_terms(search_term)
+        if len(query_terms) > 1 and proximity_weight > 0:
+            scores = scores.astype(np.float64)
+            for i, row in enumerate(rows):
+                term_positions = [
+                    (int(position), term)
+                    for term in query_terms
+                    for position in self.index.positions_in_row(term, row)
+                ]
+                span = min_cover_span(term_positions)
+                if span:
+                    matched_terms = len({term for _, term in term_positions})
+                    scores[i] *= 1.0 + proximity_weight * (matched_terms - 1) / span
+
+        top = np.argsort(-scores, kind='stable')[:top_n]
+        ranked_df = self.full_data.iloc[rows[top]].copy()
+        ranked_df['bm25_score'] = np.round(scores[top], 4)
+        return ranked_df
+
+    def search_cooccurrence(self, terms: List[str], window_seconds: float = 30.0) -> pd.DataFrame:
+        """
+        Tìm các đoạn mà TẤT CẢ các truy vấn con được nói trong cùng một video, cách nhau
+        không quá window_seconds giây (có thể nằm ở các dòng transcript khác nhau).
+
+        Mỗi truy vấn con được giải bằng inverted index thành các dòng khớp; các dòng được
+        chuyển thành khóa tổng hợp (video, timestamp) đã sắp xếp. Mỗi lần khớp của bất kỳ
+        truy vấn con nào được thử làm điểm đầu của cửa sổ [t, t + window]; cửa sổ hợp lệ khi
+        chứa ít nhất một lần khớp của MỌI truy vấn con (kiểm tra bằng searchsorted, vector hóa),
+        nên mọi cặp trong một nhóm đồng xuất hiện đều cách nhau không quá window giây.
+
+        Returns:
+            pd.DataFrame: Các dòng thuộc ít nhất một nhóm đồng xuất hiện hợp lệ,
+                          sắp xếp theo video rồi timestamp.
+        """
+        if self.full_data is None or self.index is None:
+            print("--- ⚠️ TranscriptSearcher chưa được khởi tạo thành công. Bỏ qua tìm kiếm. ---")
+            return pd.DataFrame()
+
+        hit_rows = []
+        for term in terms:
+            if not term or not term.strip():
+                continue
+            rows = self.index.search(term)
+            if rows is None:
+                continue
+            if len(rows) == 0:
+                return pd.DataFrame()
+            hit_rows.append(rows.astype(np.int64))
+        if not hit_rows:
+            return pd.DataFrame()
+        if len(hit_rows) == 1:
+            return self.full_data.iloc[hit_rows[0]].copy()
+
+        window = abs(float(window_seconds))
+        all_hits = np.concatenate(hit_rows)
+        ts_min = float(self._timestamps[all_hits].min())
+        span = float(self._timestamps[all_hits].max()) - ts_min + 2.0 * window + 1.0
+
+        def _keys(rows: np.ndarray) -> np.ndarray:
+            return self._video_codes[rows] * span + (self._timestamps[rows] - ts_min)
+
+        window_starts = np.unique(_keys(all_hits))
+        valid = np.ones(len(window_starts), dtype=bool)
+        windows = []
+        for term_rows in hit_rows:
+            order = np.argsort(_keys(term_rows), kind='stable')
+            sorted_rows, sorted_keys = term_rows[order], _keys(term_rows)[order]
+            lo = np.searchsorted(sorted_keys, window_starts, side='left')
+            hi = np.searchsorted(sorted_keys, window_starts + window, side='right')
+            valid &= hi > lo
+            windows.append((sorted_rows, lo, hi))
+        if not valid.any():
+            return pd.DataFrame()
+
+        matched = []
+        for sorted_rows, lo, hi in windows:
+            # Hợp của các đoạn [lo, hi) của những cửa sổ hợp lệ, bằng mảng hiệu + cumsum.
+            coverage = np.zeros(len(sorted_rows) + 1, dtype=np.int64)
+            np.add.at(coverage, lo[valid], 1)
+            np.add.at(coverage, hi[valid], -1)
+            matched.append(sorted_rows[np.cumsum(coverage[:-1]) > 0])
+        rows = np.unique(np.concatenate(matched))
+        rows = rows[np.lexsort((self._timestamps[rows], self._video_codes[rows]))]
+        return self.full_data.iloc[rows].copy()
+
+    def semantic_search(self, query: str, k: int = 100, current_results: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """
+        Tìm kiếm ngữ nghĩa (bắt được cách diễn đạt khác): một lần encode truy vấn bằng
+        Bi-Encoder + một lần tra ANN trên chỉ mục FAISS dựng offline.
+
+        Returns:
+            pd.DataFrame: Tối đa k dòng (điểm giảm dần) kèm cột 'semantic_score'.
+        """
+        if self.full_data is None or self.semantic_index is None or not query or not query.strip():
+            return pd.DataFrame()
+
+        query_vector = self.embedding_model.encode([query], convert_to_numpy=True).astype('float32')
+        query_vector = np.ascontiguousarray(query_vector.reshape(1, -1))
+        faiss.normalize_L2(query_vector)
+        # Lấy dư để bù cho các cửa sổ trùng dòng mốc hoặc bị lọc bởi current_results.
+        fetch_k = min(self.semantic_index.ntotal, k * (4 if current_results is not None else 2))
+        scores, window_ids = self.semantic_index.search(query_vector, fetch_k)
+        valid = window_ids[0] >= 0
+        rows = self.semantic_window_rows[window_ids[0][valid]].astype(np.int64)
+        scores = scores[0][valid]
+
+        if current_results is not None:
+            in_results = np.isin(rows, current_results.index.to_numpy())
+            rows, scores = rows[in_results], scores[in_results]
+        # Kết quả FAISS đã theo điểm giảm dần: giữ lần xuất hiện đầu tiên của mỗi dòng.
+        rows, first = np.unique(rows, return_index=True)
+        order = np.argsort(first)[:k]
+        ranked_df = self.full_data.iloc[rows[order]].copy()
+        ranked_df['semantic_score'] = np.round(scores[first[order]], 4)
+        return ranked_df
+
+    def search_hybrid(self,
+                      query: str,
+                      top_n: int = 200,
+                      current_results: Optional[pd.DataFrame] = None,
+                      rrf_k: int = 60
+                     ) -> pd.DataFrame:
+        """
+        Tìm kiếm lai: BM25 (từ khóa) và ngữ nghĩa chạy SONG SONG, rồi hợp nhất bằng
+        Reciprocal Rank Fusion: score = sum(1 / (rrf_k + rank)).
+
+        Returns:
+            pd.DataFrame: Top-N dòng kèm cột 'hybrid_score'.
+        """
+        if self.full_data is None:
+            return pd.DataFrame()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            keyword_future = executor.submit(self.search_ranked, query, top_n, current_results)
+            semantic_future = executor.submit(self.semantic_search, query, top_n, current_results)
+            ranked_lists = [keyword_future.result(), semantic_future.result()]
+
+        fused_scores = {}
+        for ranked_df in ranked_lists:
+            for rank, row in enumerate(ranked_df.index.tolist(), 1):
+                fused_scores[row] = fused_scores.get(row, 0.0) + 1.0 / (rrf_k + rank)
+        if not fused_scores:
+            return pd.DataFrame()
+
+        fused = sorted(fused_scores.items(), key=lambda item: item[1], reverse=True)[:top_n]
+        hybrid_df = self.full_data.loc[[row for row, _ in fused]].copy()
+        hybrid_df['hybrid_score'] = np.round([score for _, score in fused], 5)
+        return hybrid_df
+
@@ -2,31 +2,13 @@ import time
 import re
 import json
 import hashlib
-from collections import deque
 from typing import Dict, Optional, Any
 
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 from PIL import Image
 
-
-class RateLimiter:
-    """Token-bucket đơn giản cho giới hạn requests-per-minute."""
-    def __init__(self, rpm_limit: int = 12):
-        self.capacity = max(1, rpm_limit)
-        self.window = 60.0
-        self.events = deque()  
-
-    def acquire(self):
-        now = time.time()
-        while self.events and now - self.events[0] > self.window:
-            self.events.popleft()
-        if len(self.events) >= self.capacity:
-            sleep_s = self.window - (now - self.events[0]) + 0.01
-            if sleep_s > 0:
-                time.sleep(sleep_s)
-            return self.acquire()
-        self.events.append(time.time())
+from utils.api_utils import RateLimiter
 
 
 class VQAHandler:
@@ -0,0 +1,84 @@
+import random
+
+import numpy as np
+import pytest
+
+from utils.temporal_utils import deduplicate_temporally, temporal_keep_mask
+
+
+def _original_deduplicate(results, time_threshold):
+    """Cài đặt ban đầu trong MasterSearcher: so với frame được giữ gần nhất của video."""
+    last_timestamp_per_video = {}
+    deduplicated_results = []
+    for result in results:
+        video_id = result.get('video_id')
+        timestamp = result.get('timestamp')
+        if not video_id or timestamp is None:
+            continue
+        last_seen_timestamp = last_timestamp_per_video.get(video_id)
+        if last_seen_timestamp is None or abs(timestamp - last_seen_timestamp) > time_threshold:
+            deduplicated_results.append(result)
+            last_timestamp_per_video[video_id] = timestamp
+    return deduplicated_results
+
+
+def _brute_force_mask(video_ids, timestamps, time_threshold):
+    """Giữ một phần tử khi không có phần tử đã giữ nào cùng video cách nó <= ngưỡng."""
+    keep = []
+    kept = []
+    for video_id, timestamp in zip(video_ids, timestamps):
+        if not video_id or timestamp is None:
+            keep.append(False)
+            continue
+        ok = all(v != video_id or abs(timestamp - t) > time_threshold for v, t in kept)
+        keep.append(ok)
+        if ok:
+            kept.append((video_id, timestamp))
+    return np.array(keep, dtype=bool)
+
+
+@pytest.mark.parametrize('time_threshold', [1, 2, 5, 0.2, 0.3, 1.1])
+def test_exact_threshold_matches_original_on_ordered_frames(time_threshold):
+    # Các frame cách nhau đúng bằng ngưỡng (hoặc bội số của nó) theo thứ tự thời gian:
+    # cài đặt ban đầu và mặt nạ mới phải giữ/bỏ giống hệt nhau.
+    results = []
+    for video_id in ('L01_V001', 'L01_V002', 'L02_V010'):
+        for step in range(40):
+            results.append({'video_id': video_id, 'timestamp': step * time_threshold / 2})
+            results.append({'video_id': video_id, 'timestamp': 19 + step * time_threshold})
+    results.sort(key=lambda r: (r['video_id'], r['timestamp']))
+
+    assert deduplicate_temporally(results, time_threshold) == _original_deduplicate(results, time_threshold)
+
+
+def test_frames_exactly_threshold_apart_suppress_each_other():
+    results = [
+        {'video_id': 'V1', 'timestamp': 19.0},
+        {'video_id': 'V1', 'timestamp': 20.0},
+        {'video_id': 'V1', 'timestamp': 21.5},
+        {'video_id': 'V2', 'timestamp': 20.0},
+    ]
+    kept = deduplicate_temporally(results, 1.0)
+    assert [(r['video_id'], r['timestamp']) for r in kept] == [('V1', 19.0), ('V1', 21.5), ('V2', 20.0)]
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_matches_brute_force_on_random_inputs(seed):
+    rng = random.Random(seed)
+    time_threshold = rng.choice([0, 1, 2, 3, 0.1, 0.2, 0.3, 0.7, 2.5])
+    video_pool = ['V1', 'V2', 'V3', None, '']
+    if rng.random() < 0.5:
+        timestamps = [rng.randint(0, 40) for _ in range(120)]
+    else:
+        timestamps = [round(rng.uniform(0, 10), 1) for _ in range(120)]
+    timestamps = [None if rng.random() < 0.05 else t for t in timestamps]
+    video_ids = [rng.choice(video_pool) for _ in timestamps]
+
+    expected = _brute_force_mask(video_ids, timestamps, time_threshold)
+    np.testing.assert_array_equal(temporal_keep_mask(video_ids, timestamps, time_threshold), expected)
+
+
+def test_empty_and_invalid_inputs():
+    assert temporal_keep_mask([], [], 2.0).tolist() == []
+    assert temporal_keep_mask([None, 'V1'], [1.0, None], 2.0).tolist() == [False, False]
+    assert deduplicate_temporally([], 2.0) == []
@@ -0,0 +1,175 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import search_core.master_searcher as master_searcher_module
+import search_core.trake_solver as trake_solver_module
+from search_core.master_searcher import LLM_STAGE_WORKERS, MasterSearcher
+from search_core.task_analyzer import TaskType
+from search_core.trake_solver import TRAKESolver
+from utils.deadline import Deadline
+
+SLOW_CALL_S = 2.0
+
+
+def _candidates(query_text, top_k):
+    return [
+        {
+            'keyframe_id': f'{query_text}_{i}',
+            'video_id': f'V{i % 3}',
+            'timestamp': float(i * 10 + len(query_text)),
+            'clip_score': 1.0 - i / 100.0,
+            'original_index': i,
+        }
+        for i in range(min(top_k, 20))
+    ]
+
+
+class StubBasicSearcher:
+    def search(self, query_text, top_k):
+        return _candidates(query_text, top_k)
+
+    def search_batch(self, query_texts, top_k):
+        return [_candidates(text, top_k) for text in query_texts]
+
+
+class StubSemanticSearcher:
+    def __init__(self):
+        self.basic_searcher = StubBasicSearcher()
+        self.reranked_queries = []
+
+    def search_iter(self, query_text, top_k_final, top_k_retrieval, precomputed_analysis=None,
+                    weights=None, deadline=None, stage_report=None, initial_candidates=None):
+        candidates = initial_candidates or self.basic_searcher.search(query_text, top_k_retrieval)
+        results = []
+        for cand in candidates[:top_k_final]:
+            result = dict(cand)
+            result['scores'] = {'clip_score': cand['clip_score']}
+            result['final_score'] = cand['clip_score']
+            results.append(result)
+        if stage_report is not None:
+            stage_report['retrieval'] = 'ran'
+        yield 'spatial', results
+        yield 'final', results
+
+    def search(self, query_text, **kwargs):
+        self.reranked_queries.append(query_text)
+        final = []
+        for stage_name, results in self.search_iter(query_text, **kwargs):
+            if stage_name == 'final':
+                final = results
+        return final
+
+
+class SlowDecomposeSolver:
+    """Solver giả: phân rã treo lâu hơn toàn bộ deadline."""
+    def __init__(self):
+        self.find_sequences_called = False
+
+    def decompose_query(self, query):
+        time.sleep(SLOW_CALL_S)
+        return ['bước một', 'bước hai']
+
+    def find_sequences(self, *args, **kwargs):
+        self.find_sequences_called = True
+        return []
+
+
+class SlowAnalysisHandler:
+    """AI handler giả: phân rã nhanh, phân tích từng bước con treo lâu."""
+    def decompose_trake_query(self, query):
+        return ['người mở cửa', 'người bước vào']
+
+    def analyze_query_fully(self, query):
+        time.sleep(SLOW_CALL_S)
+        return {'search_context': query + ' (đã phân tích)'}
+
+
+def _make_master(trake_solver):
+    master = MasterSearcher.__new__(MasterSearcher)
+    master.semantic_searcher = StubSemanticSearcher()
+    master.trake_solver = trake_solver
+    master.gemini_handler = None
+    master.openai_handler = None
+    master.ai_enabled = False
+    master.video_path_map = None
+    master.transcript_searcher = None
+    master._keyframe_transcript_rows = None
+    master._llm_executor = ThreadPoolExecutor(max_workers=LLM_STAGE_WORKERS)
+    master._llm_slots = threading.BoundedSemaphore(LLM_STAGE_WORKERS)
+    return master
+
+
+def _run(master, deadline_ms):
+    config = {'deadline_ms': deadline_ms, 'top_k_final': 10, 'kis_retrieval': 20}
+    analysis = {'task_type': 'TRAKE', 'search_context': 'mở cửa rồi bước vào'}
+    start = time.monotonic()
+    response = master._search_uncached('mở cửa rồi bước vào', config, precomputed_analysis=analysis)
+    return response, time.monotonic() - start
+
+
+def test_slow_decomposition_falls_back_to_kis_within_deadline(monkeypatch):
+    monkeypatch.setitem(master_searcher_module.STAGE_MIN_BUDGET_MS, 'trake', 50)
+    solver = SlowDecomposeSolver()
+    master = _make_master(solver)
+
+    response, elapsed = _run(master, deadline_ms=800)
+
+    assert elapsed < 0.8 + 0.3
+    assert response['stages']['trake'] == 'timeout'
+    assert response['task_type'] == TaskType.KIS
+    assert response['results']
+    assert response['degraded']
+    assert not solver.find_sequences_called
+
+
+def test_slow_sub_query_analysis_keeps_trake_within_deadline(monkeypatch):
+    monkeypatch.setitem(master_searcher_module.STAGE_MIN_BUDGET_MS, 'trake', 50)
+    monkeypatch.setattr(trake_solver_module, 'SUB_QUERY_ANALYSIS_MIN_BUDGET_MS', 50)
+    master = _make_master(TRAKESolver(ai_handler=SlowAnalysisHandler()))
+
+    response, elapsed = _run(master, deadline_ms=1500)
+
+    assert elapsed < 1.5 + 0.3
+    assert response['stages']['trake'] == 'partial'
+    assert response['task_type'] == TaskType.TRAKE
+    assert response['results']
+    assert response['degraded']
+
+
+def test_find_sequences_skips_analysis_and_rerank_when_budget_is_spent():
+    searcher = StubSemanticSearcher()
+    solver = TRAKESolver(ai_handler=SlowAnalysisHandler())
+    stage_report = {'trake': 'ran'}
+
+    start = time.monotonic()
+    sequences = solver.find_sequences(
+        ['người mở cửa', 'người bước vào'], searcher, original_query_analysis={},
+        top_k_per_step=10, max_sequences=5,
+        deadline=Deadline(1), reserve_ms=500, stage_report=stage_report
+    )
+
+    assert time.monotonic() - start < 0.5
+    assert stage_report['trake'] == 'partial'
+    assert searcher.reranked_queries == []
+    assert sequences
+    assert all(len(seq['sequence']) == 2 for seq in sequences)
+
+
+def test_find_sequences_without_deadline_runs_every_step():
+    class FastHandler(SlowAnalysisHandler):
+        def analyze_query_fully(self, query):
+            return {'search_context': query}
+
+    searcher = StubSemanticSearcher()
+    stage_report = {'trake': 'ran'}
+    sequences = TRAKESolver(ai_handler=FastHandler()).find_sequences(
+        ['người mở cửa', 'người bước vào'], searcher, original_query_analysis={},
+        top_k_per_step=10, max_sequences=5, stage_report=stage_report
+    )
+
+    assert stage_report['trake'] == 'ran'
+    assert sorted(searcher.reranked_queries) == ['người bước vào', 'người mở cửa']
+    assert sequences
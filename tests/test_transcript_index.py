@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from search_core.transcript_index import TranscriptIndex
+
+TEXTS = [
+    "chào mừng các bạn đến với bản tin thời sự việt nam",
+    "cơn bão số ba đổ bộ vào miền trung",
+    "anh minh là kinh tế gia hàng đầu",
+    "chúng ta cùng xem diễn biến thời tiết",
+    "đội tuyển bóng đá giành chiến thắng",
+]
+
+
+@pytest.fixture(scope='module')
+def index():
+    return TranscriptIndex.build(TEXTS)
+
+
+def _fuzzy_terms(index, term, **kwargs):
+    return [candidate for _, candidate, _ in index.fuzzy_term_ids(term, **kwargs)]
+
+
+@pytest.mark.parametrize('query_term, expected', [
+    ('viet', 'việt'),
+    ('mình', 'minh'),
+    ('te', 'tế'),
+    ('bao', 'bão'),
+    ('báo', 'bão'),
+    ('thoi', 'thời'),
+])
+def test_fuzzy_lookup_tolerates_a_wrong_tone_mark(index, query_term, expected):
+    matches = index.fuzzy_term_ids(query_term)
+    assert expected in [candidate for _, candidate, _ in matches]
+    assert dict((candidate, distance) for _, candidate, distance in matches)[expected] == 1
+
+
+def test_fuzzy_lookup_ranks_by_edit_distance_on_original_form(index):
+    # 'bão' khớp chính xác (0 lỗi) phải đứng trước 'ba'/'bạn' (1 lỗi).
+    matches = index.fuzzy_term_ids('bão')
+    assert matches[0][1:] == ('bão', 0)
+    assert [distance for _, _, distance in matches] == sorted(distance for _, _, distance in matches)
+
+
+def test_fuzzy_lookup_respects_max_edits(index):
+    assert 'việt' not in _fuzzy_terms(index, 'viet', max_edits=0)
+    assert 'việt' not in _fuzzy_terms(index, 'vet')
+
+
+@pytest.mark.parametrize('query, expected_rows', [
+    ('viet~', [0]),
+    ('bao~ trung', [1]),
+    ('kinh te~', [2]),
+])
+def test_fuzzy_query_finds_rows_with_tone_mark_errors(index, query, expected_rows):
+    np.testing.assert_array_equal(index.search(query), expected_rows)
+
+
+def test_fuzzy_lookup_after_save_and_load(index, tmp_path):
+    path = str(tmp_path / 'transcript_index.npz')
+    index.save(path)
+    loaded = TranscriptIndex.load(path)
+    assert 'việt' in _fuzzy_terms(loaded, 'viet')
+    assert 'bão' in _fuzzy_terms(loaded, 'bao')
@@ -4,15 +4,25 @@ import os
 import base64
 from typing import Dict, Any, List
 from search_core.task_analyzer import TaskType
+from utils.thumbnail_store import get_thumbnail_store
 
-def encode_image_to_base64(image_path: str) -> str:
-    """Mã hóa một file ảnh thành chuỗi base64 để nhúng vào HTML."""
+def encode_image_to_base64(image_path: str, use_thumbnail: bool = True) -> str:
+    """
+    Mã hóa một file ảnh thành chuỗi base64 để nhúng vào HTML.
+    Mặc định nhúng thumbnail (nhỏ hơn nhiều) thay vì ảnh gốc độ phân giải đầy đủ.
+    """
     if not image_path or not os.path.isfile(image_path):
         return ""
+    mime_type = "image/jpeg"
+    if use_thumbnail:
+        thumbnail_store = get_thumbnail_store()
+        thumbnail_path = thumbnail_store.get(image_path)
+        if thumbnail_path != image_path:
+            image_path, mime_type = thumbnail_path, thumbnail_store.mime_type
     try:
         with open(image_path, "rb") as image_file:
             encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-            return f"data:image/jpeg;base64,{encoded_string}"
+            return f"data:{mime_type};base64,{encoded_string}"
     except Exception as e:
         print(f"--- ⚠️ Lỗi khi mã hóa ảnh {image_path}: {e} ---")
         return ""
@@ -1,5 +1,7 @@
 import gradio as gr
 
+from config import TRANSCRIPT_MODES, TRANSCRIPT_MODE_FILTER
+
 custom_css = """
 /* === CÀI ĐẶT CHUNG & RESET === */
 footer {
@@ -122,6 +124,8 @@ def build_ui(connect_events_fn):
         selected_candidate_for_submission = gr.State()
         transcript_results_state = gr.State()
         transcript_selected_index_state = gr.State()
+        transcript_page_state = gr.State(1)
+        frame_strip_state = gr.State()
         video_path_map_state = gr.State()
 
         gr.HTML(app_header_html)
@@ -150,12 +154,22 @@ def build_ui(connect_events_fn):
                                 label="w - Trọng số Chi tiết (Fine-grained)",
                                 info="Ưu tiên các kết quả khớp với mô tả chi tiết về đối tượng (màu mắt, hoa văn...)."
                             )
+                            w_transcript_slider = gr.Slider(
+                                minimum=0.0, maximum=1.0, value=0.0, step=0.05,
+                                label="w - Trọng số Lời thoại (Transcript)",
+                                info="0 = chỉ dùng hình ảnh. Lớn hơn 0: tìm song song trong transcript và hợp nhất với kết quả CLIP theo từng keyframe (weighted RRF)."
+                            )
                             lambda_mmr_slider = gr.Slider(minimum=0.0, maximum=1.0, value=0.7, step=0.05, label="λ - MMR (Đa dạng hóa)")
                             initial_retrieval_slider = gr.Slider(
                                 minimum=50, maximum=1000, value=500, step=50,
                                 label="Số lượng ứng viên thô (CLIP/FAISS)",
                                 info="Số lượng kết quả lấy ra ở vòng đầu tiên trước khi rerank. Tăng lên cho query khó, giảm xuống để tăng tốc độ."
                             )
+                            deadline_slider = gr.Slider(
+                                minimum=0, maximum=60000, value=0, step=500,
+                                label="⏱️ Ngân sách thời gian (ms)",
+                                info="0 = không giới hạn. Khi sắp hết giờ, các bước tùy chọn (Gemini, grounding, xác thực chi tiết, VQA) sẽ bị bỏ qua để luôn có kết quả CLIP đúng hạn."
+                            )
                         status_output = gr.HTML()
                         gr.Markdown("### 2. Kết quả Visual")
                         with gr.Row(equal_height=True, variant='compact'):
@@ -166,9 +180,22 @@ def build_ui(connect_events_fn):
 
                     with gr.TabItem("👂 Tai Thính (Transcript Intel)"):
                         gr.Markdown("### 1. Điều tra bằng Lời thoại")
-                        transcript_query_1 = gr.Textbox(label="🔍 Tìm kiếm trong toàn bộ transcript...", placeholder="Ví dụ: biến đổi khí hậu")
+                        transcript_query_1 = gr.Textbox(label="🔍 Tìm kiếm trong toàn bộ transcript...", placeholder='Ví dụ: "biến đổi khí hậu" · bão NEAR/5 miền · kinh* tế · nguyễn~ (sai chính tả)')
                         transcript_query_2 = gr.Textbox(label="...và trong kết quả đó, tìm tiếp...", placeholder="Ví dụ: Việt Nam")
                         transcript_query_3 = gr.Textbox(label="...cuối cùng, lọc theo...", placeholder="Ví dụ: giải pháp")
+                        with gr.Row():
+                            transcript_mode_radio = gr.Radio(
+                                choices=TRANSCRIPT_MODES,
+                                value=TRANSCRIPT_MODE_FILTER,
+                                label="Chế độ tìm kiếm",
+                                info="Xếp hạng/Hybrid: ô 1 là truy vấn chính, ô 2-3 dùng để lọc trước. Đồng xuất hiện: các ô được nói gần nhau trong cùng video.",
+                                scale=3
+                            )
+                            transcript_window_slider = gr.Slider(
+                                minimum=5, maximum=300, value=30, step=5,
+                                label="Cửa sổ đồng xuất hiện (giây)",
+                                scale=1
+                            )
                         with gr.Row():
                             transcript_search_button = gr.Button("🎙️ Bắt đầu Điều tra", variant="primary")
                             transcript_clear_button = gr.Button("🧹 Xóa bộ lọc")
@@ -177,6 +204,10 @@ def build_ui(connect_events_fn):
                         with gr.Row():
                              add_transcript_top_button = gr.Button("➕ Thêm kết quả đã chọn vào Top 1", variant="primary")
                              add_transcript_bottom_button = gr.Button("➕ Thêm kết quả đã chọn vào cuối")
+                        with gr.Row(equal_height=True, variant='compact'):
+                            transcript_prev_page_button = gr.Button("◀️ Trang trước")
+                            transcript_page_info_display = gr.Markdown("Trang 1 / 1")
+                            transcript_next_page_button = gr.Button("▶️ Trang sau")
                         transcript_results_df = gr.DataFrame(
                         headers=["Video ID", "FPS", "Timestamp (s)", "Nội dung Lời thoại", "Keyframe Path"], 
                         datatype=["str", "number", "number", "markdown", "str"],
@@ -216,6 +247,9 @@ def build_ui(connect_events_fn):
                     frame_calculator_time_input = gr.Textbox(label="Nhập Thời gian", placeholder="Ví dụ: 123.45 (giây) hoặc 2:03.45 (phút:giây)")
                     frame_calculator_button = gr.Button("Tính toán Frame Index")
                     frame_calculator_output = gr.Textbox(label="✅ Kết quả Frame Index (để copy)", interactive=False, show_copy_button=True)
+                with gr.Accordion("🎞️ Dải Khung hình quanh Thời điểm", open=False):
+                    frame_strip_button = gr.Button("🎞️ Trích Dải Khung hình (từ kết quả đang chọn)")
+                    frame_strip_gallery = gr.Gallery(label="Chọn một khung để điền vào Máy tính Frame", columns=5, height=240, object_fit="contain", allow_preview=False)
                 with gr.Accordion("💾 Xuất File Nộp bài", open=True):
                     query_id_input = gr.Textbox(label="Nhập Query ID", placeholder="Ví dụ: query_01")
                     submission_button = gr.Button("💾 Tạo File CSV (từ nội dung đã sửa)")
@@ -230,12 +264,16 @@ def build_ui(connect_events_fn):
             "selected_candidate_for_submission": selected_candidate_for_submission,
             "transcript_results_state": transcript_results_state,
             "transcript_selected_index_state": transcript_selected_index_state,
+            "transcript_page_state": transcript_page_state,
+            "frame_strip_state": frame_strip_state,
             "video_path_map_state": video_path_map_state,
             # Tab Mắt Thần
             "query_input": query_input, "search_button": search_button, "num_results": num_results,
             "w_clip_slider": w_clip_slider, "w_obj_slider": w_obj_slider, "w_semantic_slider": w_semantic_slider,
             "lambda_mmr_slider": lambda_mmr_slider, "clear_button": clear_button,
             "initial_retrieval_slider": initial_retrieval_slider,
+            "deadline_slider": deadline_slider,
+            "w_transcript_slider": w_transcript_slider,
             "w_spatial_slider": w_spatial_slider, 
             "w_fine_grained_slider": w_fine_grained_slider, 
             "status_output": status_output, "prev_page_button": prev_page_button,
@@ -243,10 +281,15 @@ def build_ui(connect_events_fn):
             "results_gallery": results_gallery,
             # Tab Tai Thính
             "transcript_query_1": transcript_query_1, "transcript_query_2": transcript_query_2,
-            "transcript_query_3": transcript_query_3, "transcript_search_button": transcript_search_button,
+            "transcript_query_3": transcript_query_3, "transcript_mode_radio": transcript_mode_radio,
+            "transcript_window_slider": transcript_window_slider,
+            "transcript_search_button": transcript_search_button,
             "transcript_clear_button": transcript_clear_button, "transcript_results_count": transcript_results_count,
             "add_transcript_top_button": add_transcript_top_button, "add_transcript_bottom_button": add_transcript_bottom_button,
             "transcript_results_df": transcript_results_df,
+            "transcript_prev_page_button": transcript_prev_page_button,
+            "transcript_page_info_display": transcript_page_info_display,
+            "transcript_next_page_button": transcript_next_page_button,
             # Cột Phải - Trạm Phân tích Hợp nhất
             "selected_image_display": selected_image_display, "video_player": video_player,
             "full_transcript_display": full_transcript_display, "analysis_display_html": analysis_display_html,
@@ -260,6 +303,7 @@ def build_ui(connect_events_fn):
             # Cột Phải - Máy tính Thời gian
             "frame_calculator_video_id": frame_calculator_video_id, "frame_calculator_time_input": frame_calculator_time_input,
             "frame_calculator_button": frame_calculator_button, "frame_calculator_output": frame_calculator_output,
+            "frame_strip_button": frame_strip_button, "frame_strip_gallery": frame_strip_gallery,
             # Cột Phải - Vùng Xuất File
             "query_id_input": query_id_input, "submission_button": submission_button,
             "submission_file_output": submission_file_output,
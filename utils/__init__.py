@@ -1,6 +1,14 @@
 
-from .video_utils import create_video_segment
-from .api_utils import api_retrier
+from .video_utils import (
+    create_video_segment,
+    ClipCache,
+    ClipPrefetcher,
+    IFrameIndex,
+    get_clip_cache,
+    extract_frame_strip
+)
+from .thumbnail_store import ThumbnailStore, get_thumbnail_store
+from .api_utils import api_retrier, RateLimiter
 from .formatting import (
     format_results_for_gallery,
     format_for_submission,
@@ -9,10 +17,18 @@ from .formatting import (
 
 __all__ = [
     'create_video_segment',
+    'ClipCache',
+    'ClipPrefetcher',
+    'IFrameIndex',
+    'get_clip_cache',
+    'extract_frame_strip',
+    'ThumbnailStore',
+    'get_thumbnail_store',
     'format_results_for_gallery',
     'format_for_submission',
     'generate_submission_file',
-    'api_retrier'
+    'api_retrier',
+    'RateLimiter'
 ]
 
 print("--- 📦 Package 'utils' đã được khởi tạo ---")
@@ -1,7 +1,34 @@
 import time
 import random
+import threading
+from collections import deque
 from functools import wraps
 
+
+class RateLimiter:
+    """
+    Giới hạn requests-per-minute theo cửa sổ trượt, an toàn khi dùng từ nhiều luồng.
+    acquire() sẽ chặn (sleep) cho đến khi được phép gửi request tiếp theo.
+    """
+    def __init__(self, rpm_limit: int = 12):
+        self.capacity = max(1, rpm_limit)
+        self.window = 60.0
+        self.events = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                while self.events and now - self.events[0] > self.window:
+                    self.events.popleft()
+                if len(self.events) < self.capacity:
+                    self.events.append(now)
+                    return
+                sleep_s = self.window - (now - self.events[0]) + 0.01
+            time.sleep(max(sleep_s, 0.01))
+
+
 def api_retrier(max_retries=5, initial_delay=1, backoff_factor=2, jitter=0.1):
     """
     Một decorator để tự động thử lại các lệnh gọi API Gemini khi gặp lỗi 429.
@@ -1,9 +1,13 @@
 # /utils/cache_manager.py
 
 import os
+import sys
+import time
 import pickle
+import threading
+from collections import OrderedDict
 import numpy as np
-from typing import Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 class ObjectVectorCache:
     """
@@ -49,4 +53,207 @@ class ObjectVectorCache:
             print(f"--- ❌ Lỗi nghiêm trọng khi lưu cache xuống đĩa: {e} ---")
             
     def __len__(self):
-        return len(self.cache)
\ No newline at end of file
+        return len(self.cache)
+
+
+def estimate_nbytes(obj: Any, _seen: Optional[set] = None) -> int:
+    """
+    Ước lượng (xấp xỉ) dung lượng bộ nhớ của một object Python lồng nhau.
+    Mỗi object chỉ được đếm một lần, nên các candidate dùng chung không bị tính lặp.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_nbytes(k, _seen) + estimate_nbytes(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_nbytes(item, _seen) for item in obj)
+    return size
+
+
+class SearchResultCache:
+    """
+    Cache kết quả tìm kiếm trong bộ nhớ (LRU + TTL + giới hạn dung lượng).
+    - Key do nơi gọi tự xây dựng (query đã chuẩn hóa + các tham số ảnh hưởng kết quả).
+    - Giá trị được lưu nguyên object, nên các request giống nhau dùng chung các candidate.
+    - Thread-safe, vì Gradio có thể xử lý nhiều phiên cùng lúc.
+    """
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: float = 1800.0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Any, Tuple[Any, int, float]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Optional[Any]:
+        """Lấy giá trị theo key. Trả về None nếu không có hoặc đã hết hạn."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, nbytes, created_at = entry
+            if time.time() - created_at > self.ttl_seconds:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Any, value: Any):
+        """Thêm một giá trị vào cache và loại bỏ các entry cũ nhất nếu vượt dung lượng."""
+        nbytes = estimate_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, nbytes, time.time())
+            self._total_bytes += nbytes
+            while self._total_bytes > self.max_bytes and self._entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def _remove(self, key: Any):
+        _, nbytes, _ = self._entries.pop(key)
+        self._total_bytes -= nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê nhanh để đưa vào metrics của từng request."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hit_rate,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskBudgetLRU:
+    """
+    Chỉ mục LRU trong bộ nhớ cho các file cache trên đĩa, giới hạn theo tổng dung lượng.
+    - Thư mục chỉ được quét MỘT lần khi khởi tạo (thứ tự LRU theo mtime).
+    - get()/add() chỉ thao tác trên chỉ mục trong bộ nhớ, không liệt kê hay stat thư mục.
+    - Việc xóa file vượt ngân sách chạy trên một thread nền, không chặn nơi gọi.
+    """
+    def __init__(self, directory: str, max_bytes: int, temp_prefix: str = ".tmp_"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.temp_prefix = temp_prefix
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._evict_event = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        self._load_existing()
+        self._evictor = threading.Thread(target=self._evict_loop, name=f"disk-lru-evictor:{directory}", daemon=True)
+        self._evictor.start()
+        self._evict_event.set()
+
+    def _load_existing(self):
+        """Nạp các file đã có (từ phiên trước) vào chỉ mục; xóa các file tạm dở dang."""
+        existing = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.startswith(self.temp_prefix):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+                continue
+            stat = entry.stat()
+            existing.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, nbytes in sorted(existing):
+            self._entries[name] = nbytes
+            self._total_bytes += nbytes
+        if existing:
+            print(f"--- 🗃️ Cache đĩa '{self.directory}': nạp {len(existing)} file ({self._total_bytes / 1e6:.1f} MB). ---")
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def temp_path_for(self, name: str) -> str:
+        """Đường dẫn file tạm (cùng thư mục, giữ nguyên phần mở rộng) để ghi rồi os.replace."""
+        return os.path.join(self.directory, f"{self.temp_prefix}{threading.get_ident()}_{name}")
+
+    def get(self, name: str) -> Optional[str]:
+        """Trả về đường dẫn nếu file có trong cache (và đánh dấu vừa dùng), ngược lại None."""
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        path = self.path_for(name)
+        if os.path.exists(path):
+            return path
+        # File bị xóa từ bên ngoài -> bỏ khỏi chỉ mục.
+        with self._lock:
+            if name in self._entries:
+                self._total_bytes -= self._entries.pop(name)
+        return None
+
+    def add(self, name: str) -> str:
+        """Ghi nhận một file vừa được tạo xong trong thư mục và kích hoạt dọn dẹp nền nếu cần."""
+        path = self.path_for(name)
+        nbytes = os.path.getsize(path)
+        with self._lock:
+            if name in self._entries:
+                self._total_bytes -= self._entries.pop(name)
+            self._entries[name] = nbytes
+            self._total_bytes += nbytes
+            over_budget = self._total_bytes > self.max_bytes
+        if over_budget:
+            self._evict_event.set()
+        return path
+
+    def _evict_loop(self):
+        while True:
+            self._evict_event.wait()
+            self._evict_event.clear()
+            victims = []
+            with self._lock:
+                # Luôn giữ lại file mới nhất, kể cả khi riêng nó đã vượt ngân sách.
+                while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                    name, nbytes = self._entries.popitem(last=False)
+                    self._total_bytes -= nbytes
+                    victims.append(name)
+            for name in victims:
+                try:
+                    os.remove(self.path_for(name))
+                except OSError:
+                    pass
+            if victims:
+                print(f"   -> 🧹 Cache đĩa: đã xóa {len(victims)} file cũ nhất để giữ dưới {self.max_bytes / 1e6:.0f} MB.")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._total_bytes, 'max_bytes': self.max_bytes}
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,44 @@
+# /utils/deadline.py
+
+import time
+from typing import Optional
+
+
+class Deadline:
+    """
+    Ngân sách thời gian cho một request tìm kiếm.
+
+    Được tạo từ config['deadline_ms']; nếu budget_ms là None hoặc <= 0 thì
+    deadline bị vô hiệu hóa và mọi stage đều được phép chạy.
+    """
+    def __init__(self, budget_ms: Optional[float] = None):
+        self.budget_ms = float(budget_ms) if budget_ms else None
+        if self.budget_ms is not None and self.budget_ms <= 0:
+            self.budget_ms = None
+        self._start = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_ms is not None
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self._start) * 1000.0
+
+    def remaining_ms(self) -> float:
+        """Thời gian còn lại (ms). Trả về vô cực nếu deadline bị vô hiệu hóa."""
+        if not self.enabled:
+            return float('inf')
+        return self.budget_ms - self.elapsed_ms()
+
+    def allows(self, cost_ms: float) -> bool:
+        """True nếu thời gian còn lại đủ cho một stage có chi phí ước tính cost_ms."""
+        return self.remaining_ms() >= cost_ms
+
+    def timeout_s(self, reserve_ms: float = 0.0) -> Optional[float]:
+        """
+        Timeout (giây) dùng cho future.result()/as_completed(), chừa lại reserve_ms
+        cho các stage bắt buộc phía sau. Trả về None nếu deadline bị vô hiệu hóa.
+        """
+        if not self.enabled:
+            return None
+        return max(0.0, (self.remaining_ms() - reserve_ms) / 1000.0)
@@ -3,6 +3,9 @@ import pandas as pd
 from typing import List, Dict, Any
 import os
 import json
+
+from .thumbnail_store import get_thumbnail_store
+
 def format_submission_list_to_csv_string(submission_list: List[Dict], fps_map: dict) -> str:
     """
     Chuyển danh sách nộp bài thành một chuỗi CSV để hiển thị và chỉnh sửa.
@@ -41,6 +44,7 @@ def format_results_for_gallery(response: Dict[str, Any]) -> List[str]:
     """
     Định dạng kết quả thô thành định dạng cho gr.Gallery (chỉ trả về đường dẫn ảnh).
     PHIÊN BẢN "COCKPIT V3.3"
+    Trả về đường dẫn THUMBNAIL; ảnh gốc chỉ được tải khi người dùng chọn một kết quả.
     """
     results = response.get("results", [])
     task_type = response.get("task_type")
@@ -61,11 +65,12 @@ def format_results_for_gallery(response: Dict[str, Any]) -> List[str]:
         if keyframe_path and os.path.isfile(keyframe_path):
             gallery_paths.append(keyframe_path)
             
-    return gallery_paths
+    return get_thumbnail_store().get_many(gallery_paths)
 
 def format_results_for_mute_gallery(response: Dict[str, Any]) -> List[str]:
     """
     Định dạng kết quả thô CHỈ LẤY ĐƯỜNG DẪN ẢNH cho "Lưới ảnh câm" (Cockpit v3.3).
+    Trả về đường dẫn THUMBNAIL; ảnh gốc chỉ được tải khi người dùng chọn một kết quả.
     """
     print("\n" + "="*20 + " DEBUG LOG: format_results_for_mute_gallery " + "="*20)
     print(f"-> Nhận được response với các key: {response.keys() if isinstance(response, dict) else 'Không phải dict'}")
@@ -103,7 +108,7 @@ def format_results_for_mute_gallery(response: Dict[str, Any]) -> List[str]:
             if path and os.path.isfile(path):
                 keyframe_paths.append(path)
 
-    return keyframe_paths
+    return get_thumbnail_store().get_many(keyframe_paths)
 
 def format_for_submission(response: Dict[str, Any], max_results: int = 100) -> pd.DataFrame:
     """
@@ -0,0 +1,80 @@
+# /utils/singleflight.py
+
+import hashlib
+import json
+import threading
+from concurrent.futures import CancelledError, Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Gộp các lời gọi trùng nhau đang chạy đồng thời (request coalescing).
+
+    Lời gọi đầu tiên với một key sẽ thực sự chạy hàm; các lời gọi cùng key đến
+    trong lúc nó đang chạy sẽ chờ và nhận chung kết quả (hoặc chung exception).
+    Khi lời gọi kết thúc, key được giải phóng nên các lời gọi sau sẽ chạy lại từ đầu.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+
+    def begin(self, key: Hashable) -> Tuple[Future, bool]:
+        """
+        Đăng ký một lời gọi với key. Trả về (future, is_leader): leader phải tự hoàn tất
+        future (set_result/set_exception, hoặc cancel() nếu bỏ dở) rồi gọi end(); các lời gọi
+        khác chỉ chờ future.result(). Dùng khi kết quả được tạo dần (ví dụ một generator).
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+        return future, is_leader
+
+    def end(self, key: Hashable, future: Future):
+        """Giải phóng key sau khi leader đã hoàn tất future."""
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Chạy fn(*args, **kwargs) một lần cho mỗi key đang bay.
+        Nếu leader đang bay bỏ dở (future bị cancel) thì lời gọi này thử lại từ đầu.
+
+        Returns:
+            Tuple[Any, bool]: (kết quả, shared) - shared=True nếu kết quả được
+                              lấy từ một lời gọi khác đang chạy cùng lúc.
+        """
+        future, is_leader = self.begin(key)
+        while not is_leader:
+            try:
+                return future.result(), True
+            except CancelledError:
+                future, is_leader = self.begin(key)
+
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self.end(key, future)
+
+    def in_flight(self) -> int:
+        """Số lượng key đang được xử lý."""
+        with self._lock:
+            return len(self._in_flight)
+
+
+def make_request_key(*parts: Any) -> str:
+    """
+    Tạo key ngắn gọn (SHA1) cho một request từ các thành phần có thể serialize JSON
+    (prompt, messages, tham số model...). Dùng cho SingleFlight ở tầng API handler.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
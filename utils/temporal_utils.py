@@ -0,0 +1,202 @@
+# /utils/temporal_utils.py
+
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence
+
+
+def _window_bounds(sorted_ts: np.ndarray, time_threshold: float):
+    """
+    Với mảng timestamp đã sắp xếp của MỘT video, trả về (lo, hi) sao cho
+    sorted_ts[lo[i]:hi[i]] đúng là các phần tử có |sorted_ts[i] - t| <= time_threshold.
+
+    searchsorted trên t ± N cho biên gần đúng (phép cộng/trừ số thực có thể làm tròn);
+    biên sau đó được hiệu chỉnh bằng chính phép so sánh |t_i - t_j| <= N.
+    """
+    last = len(sorted_ts) - 1
+    lo = np.searchsorted(sorted_ts, sorted_ts - time_threshold, side='left')
+    hi = np.searchsorted(sorted_ts, sorted_ts + time_threshold, side='right')
+    while True:
+        widen = (lo > 0) & (np.abs(sorted_ts - sorted_ts[np.maximum(lo - 1, 0)]) <= time_threshold)
+        shrink = np.abs(sorted_ts - sorted_ts[np.minimum(lo, last)]) > time_threshold
+        if not (widen.any() or shrink.any()):
+            break
+        lo = lo - widen + shrink
+    while True:
+        widen = (hi <= last) & (np.abs(sorted_ts[np.minimum(hi, last)] - sorted_ts) <= time_threshold)
+        shrink = np.abs(sorted_ts[np.maximum(hi - 1, 0)] - sorted_ts) > time_threshold
+        if not (widen.any() or shrink.any()):
+            break
+        hi = hi + widen - shrink
+    return lo, hi
+
+
+def temporal_keep_mask(video_ids: Sequence[Any], timestamps: Sequence[float], time_threshold: float) -> np.ndarray:
+    """
+    Tính mặt nạ giữ/bỏ cho bài toán lọc trùng lặp thời gian (NMS 1 chiều theo video).
+
+    Các phần tử được duyệt theo thứ tự đầu vào (thường là thứ tự điểm giảm dần).
+    Một phần tử được giữ lại khi và chỉ khi KHÔNG có phần tử nào đã được giữ trước đó
+    thuộc cùng video và cách nó <= time_threshold giây. Nhờ vậy đảm bảo
+    "không có hai frame được giữ nào trong cùng video cách nhau <= N giây",
+    kể cả khi các frame gần nhau đến không theo thứ tự điểm.
+
+    Cài đặt: sắp xếp một lần theo (video, timestamp), dùng searchsorted trong đoạn
+    của từng video để tính sẵn cửa sổ [t - N, t + N] của mọi phần tử, sau đó mỗi
+    frame được giữ chỉ cần một phép gán slice để "dập" toàn bộ lân cận của nó.
+
+    Args:
+        video_ids (Sequence[Any]): Video ID của từng phần tử (None = không hợp lệ).
+        timestamps (Sequence[float]): Timestamp (giây) của từng phần tử (None/NaN = không hợp lệ).
+        time_threshold (float): Ngưỡng thời gian (giây).
+
+    Returns:
+        np.ndarray: Mảng bool cùng độ dài, True = giữ lại.
+    """
+    n = len(video_ids)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+
+    ts = np.array([np.nan if t is None else t for t in timestamps], dtype=np.float64)
+    valid = ~np.isnan(ts) & np.array([bool(v) for v in video_ids], dtype=bool)
+    if not valid.any():
+        return keep
+
+    valid_idx = np.flatnonzero(valid)
+    if time_threshold < 0:
+        keep[valid_idx] = True
+        return keep
+    _, codes = np.unique(np.asarray(video_ids, dtype=object)[valid_idx].astype(str), return_inverse=True)
+    ts_valid = ts[valid_idx]
+
+    # Sắp xếp theo (video, timestamp); cửa sổ của mỗi frame được tìm bằng searchsorted
+    # trên timestamp GỐC bên trong đoạn của video đó, không cần khóa số thực tổng hợp.
+    order = np.lexsort((ts_valid, codes))
+    sorted_ts = ts_valid[order]
+    sorted_codes = codes[order]
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    video_numbers = np.arange(int(sorted_codes[-1]) + 1)
+    starts = np.searchsorted(sorted_codes, video_numbers, side='left')
+    ends = np.searchsorted(sorted_codes, video_numbers, side='right')
+    lo_sorted = np.empty(len(order), dtype=np.int64)
+    hi_sorted = np.empty(len(order), dtype=np.int64)
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        lo, hi = _window_bounds(sorted_ts[start:end], time_threshold)
+        lo_sorted[start:end] = start + lo
+        hi_sorted[start:end] = start + hi
+    lo_all = lo_sorted[rank]
+    hi_all = hi_sorted[rank]
+
+    # Frame không có láng giềng nào trong cửa sổ luôn được giữ; chỉ các frame có láng giềng
+    # mới cần duyệt tuần tự theo thứ tự điểm (phụ thuộc vào các frame đã giữ trước đó).
+    isolated = (hi_all - lo_all) <= 1
+    keep[valid_idx[isolated]] = True
+
+    suppressed = np.zeros(len(order), dtype=bool)
+    for i, r, lo, hi in zip(*(a.tolist() for a in (
+            np.flatnonzero(~isolated), rank[~isolated], lo_all[~isolated], hi_all[~isolated]))):
+        if suppressed[r]:
+            continue
+        keep[valid_idx[i]] = True
+        suppressed[lo:hi] = True
+    return keep
+
+
+def deduplicate_temporally(results: List[Dict[str, Any]], time_threshold: float) -> List[Dict[str, Any]]:
+    """
+    Lọc trùng lặp thời gian trên danh sách kết quả (đã sắp xếp theo điểm).
+
+    Args:
+        results (List[Dict[str, Any]]): Danh sách kết quả, mỗi phần tử có 'video_id' và 'timestamp'.
+        time_threshold (float): Ngưỡng thời gian (giây).
+
+    Returns:
+        List[Dict[str, Any]]: Danh sách kết quả được giữ lại, giữ nguyên thứ tự ban đầu.
+    """
+    if not results:
+        return []
+    keep = temporal_keep_mask(
+        [r.get('video_id') for r in results],
+        [r.get('timestamp') for r in results],
+        time_threshold
+    )
+    return [r for r, k in zip(results, keep) if k]
+
+
+class VideoTimelineIndex:
+    """
+    Chỉ mục thời gian theo từng video, dựng MỘT lần khi nạp metadata.
+
+    Các dòng được sắp xếp theo (video_id, timestamp); mỗi video ứng với một đoạn
+    [start, end) liên tục trong mảng đã sắp xếp, nên mọi truy vấn "frame của video V
+    trong khoảng [t1, t2]" hay "keyframe kế tiếp sau t" chỉ cần một lần tra dict và
+    một phép searchsorted (bisect) trên mảng timestamp NumPy.
+
+    Mọi hàm trả về CHỈ SỐ DÒNG GỐC (vị trí trong DataFrame/danh sách đầu vào).
+    """
+    def __init__(self, video_ids: Sequence[Any], timestamps: Sequence[float]):
+        ts = np.array([np.nan if t is None else t for t in timestamps], dtype=np.float64)
+        videos = np.asarray(video_ids, dtype=object).astype(str)
+        valid_rows = np.flatnonzero(~np.isnan(ts))
+
+        unique_videos, codes = np.unique(videos[valid_rows], return_inverse=True)
+        order = np.lexsort((ts[valid_rows], codes))
+        self.rows: np.ndarray = valid_rows[order]
+        self.timestamps: np.ndarray = ts[self.rows]
+
+        sorted_codes = codes[order]
+        starts = np.searchsorted(sorted_codes, np.arange(len(unique_videos)), side='left')
+        ends = np.searchsorted(sorted_codes, np.arange(len(unique_videos)), side='right')
+        self._offsets: Dict[str, tuple] = {
+            video_id: (int(start), int(end))
+            for video_id, start, end in zip(unique_videos.tolist(), starts, ends)
+        }
+
+    @classmethod
+    def from_dataframe(cls, df, video_col: str = 'video_id', ts_col: str = 'timestamp') -> 'VideoTimelineIndex':
+        """Dựng chỉ mục từ một DataFrame (chỉ số trả về là vị trí dòng, dùng với df.iloc)."""
+        return cls(df[video_col].to_numpy(), df[ts_col].to_numpy())
+
+    def __contains__(self, video_id: Any) -> bool:
+        return str(video_id) in self._offsets
+
+    @property
+    def video_ids(self) -> List[str]:
+        return list(self._offsets.keys())
+
+    def video_rows(self, video_id: Any) -> np.ndarray:
+        """Tất cả dòng của video, theo thứ tự timestamp tăng dần."""
+        start, end = self._offsets.get(str(video_id), (0, 0))
+        return self.rows[start:end]
+
+    def frames_between(self, video_id: Any, t_start: float, t_end: float, inclusive: bool = True) -> np.ndarray:
+        """
+        Các dòng của video có timestamp trong [t_start, t_end] (hoặc (t_start, t_end) nếu
+        inclusive=False), theo thứ tự thời gian.
+        """
+        start, end = self._offsets.get(str(video_id), (0, 0))
+        if start == end:
+            return self.rows[0:0]
+        video_ts = self.timestamps[start:end]
+        lo = np.searchsorted(video_ts, t_start, side='left' if inclusive else 'right')
+        hi = np.searchsorted(video_ts, t_end, side='right' if inclusive else 'left')
+        return self.rows[start + lo:start + max(lo, hi)]
+
+    def rows_after(self, video_id: Any, t: float) -> np.ndarray:
+        """Các dòng của video có timestamp > t, theo thứ tự thời gian."""
+        start, end = self._offsets.get(str(video_id), (0, 0))
+        lo = np.searchsorted(self.timestamps[start:end], t, side='right')
+        return self.rows[start + lo:end]
+
+    def next_keyframe_after(self, video_id: Any, t: float) -> Optional[int]:
+        """Dòng của keyframe đầu tiên có timestamp > t trong video, hoặc None."""
+        rows = self.rows_after(video_id, t)
+        return int(rows[0]) if len(rows) else None
+
+    def previous_keyframe_before(self, video_id: Any, t: float) -> Optional[int]:
+        """Dòng của keyframe cuối cùng có timestamp < t trong video, hoặc None."""
+        start, end = self._offsets.get(str(video_id), (0, 0))
+        hi = np.searchsorted(self.timestamps[start:end], t, side='left')
+        return int(self.rows[start + hi - 1]) if hi > 0 else None
@@ -0,0 +1,127 @@
+# /utils/thumbnail_store.py
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from PIL import Image, features
+
+from .cache_manager import DiskBudgetLRU
+from .singleflight import SingleFlight
+
+DEFAULT_THUMBNAIL_DIR = "/kaggle/working/thumbnails"
+# Cạnh dài tối đa (px) của thumbnail hiển thị trong gallery.
+THUMBNAIL_MAX_SIZE = 320
+THUMBNAIL_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024
+THUMBNAIL_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+
+
+class ThumbnailStore:
+    """
+    Kho thumbnail (WebP, hoặc JPEG nếu PIL không hỗ trợ WebP) của keyframe, key theo keyframe_id.
+    - Gallery chỉ nhận thumbnail; ảnh gốc độ phân giải đầy đủ chỉ được tải khi người dùng chọn.
+    - Thumbnail được tạo lười (lần đầu cần đến) hoặc dựng sẵn offline bằng generate().
+    - Dung lượng được giới hạn bởi DiskBudgetLRU; các yêu cầu trùng key chỉ tạo MỘT lần.
+    """
+    def __init__(self,
+                 thumbnail_dir: str = DEFAULT_THUMBNAIL_DIR,
+                 max_size: int = THUMBNAIL_MAX_SIZE,
+                 max_bytes: int = THUMBNAIL_CACHE_MAX_BYTES,
+                 image_format: str = THUMBNAIL_FORMAT,
+                 quality: int = 80,
+                 max_workers: int = 8):
+        self.max_size = max_size
+        self.image_format = image_format
+        self.quality = quality
+        self.extension = 'webp' if image_format == 'WEBP' else 'jpg'
+        self.store = DiskBudgetLRU(thumbnail_dir, max_bytes=max_bytes)
+        self._flight = SingleFlight()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumbnail")
+
+    @staticmethod
+    def keyframe_id_from_path(keyframe_path: str) -> str:
+        return os.path.splitext(os.path.basename(keyframe_path))[0]
+
+    def thumbnail_name(self, keyframe_id: str) -> str:
+        return f"{keyframe_id}_{self.max_size}.{self.extension}"
+
+    @property
+    def mime_type(self) -> str:
+        return 'image/webp' if self.image_format == 'WEBP' else 'image/jpeg'
+
+    def get(self, keyframe_path: str, keyframe_id: Optional[str] = None) -> str:
+        """
+        Đường dẫn thumbnail của keyframe (tạo nếu chưa có). Nếu không tạo được thì
+        trả về chính ảnh gốc để giao diện vẫn hiển thị được.
+        """
+        name = self.thumbnail_name(keyframe_id or self.keyframe_id_from_path(keyframe_path))
+        cached_path = self.store.get(name)
+        if cached_path:
+            return cached_path
+        try:
+            thumbnail_path, _ = self._flight.do(name, self._create, keyframe_path, name)
+            return thumbnail_path
+        except Exception as e:
+            print(f"--- ⚠️ Lỗi khi tạo thumbnail cho {keyframe_path}: {e}. Dùng ảnh gốc. ---")
+            return keyframe_path
+
+    def get_many(self, keyframe_paths: List[str]) -> List[str]:
+        """Như get() cho nhiều keyframe; các thumbnail còn thiếu được tạo song song. Giữ nguyên thứ tự."""
+        return list(self._executor.map(self.get, keyframe_paths))
+
+    def _create(self, keyframe_path: str, name: str) -> str:
+        cached_path = self.store.get(name)
+        if cached_path:
+            return cached_path
+        temp_path = self.store.temp_path_for(name)
+        try:
+            with Image.open(keyframe_path) as image:
+                image.draft('RGB', (self.max_size, self.max_size))
+                image = image.convert('RGB')
+                image.thumbnail((self.max_size, self.max_size))
+                image.save(temp_path, format=self.image_format, quality=self.quality)
+            os.replace(temp_path, self.store.path_for(name))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return self.store.add(name)
+
+    def generate(self, keyframe_paths: List[str]) -> Dict[str, int]:
+        """
+        Dựng sẵn (offline) thumbnail cho toàn bộ keyframe, song song trên pool của store.
+
+        Returns:
+            Dict[str, int]: Thống kê {'created', 'existing', 'failed'}.
+        """
+        stats = {'created': 0, 'existing': 0, 'failed': 0}
+        stats_lock = threading.Lock()
+
+        def _generate_one(keyframe_path: str):
+            name = self.thumbnail_name(self.keyframe_id_from_path(keyframe_path))
+            if name in self.store:
+                outcome = 'existing'
+            else:
+                try:
+                    self._flight.do(name, self._create, keyframe_path, name)
+                    outcome = 'created'
+                except Exception:
+                    outcome = 'failed'
+            with stats_lock:
+                stats[outcome] += 1
+
+        for _ in self._executor.map(_generate_one, keyframe_paths):
+            pass
+        return stats
+
+
+_thumbnail_stores: Dict[str, ThumbnailStore] = {}
+_thumbnail_stores_lock = threading.Lock()
+
+def get_thumbnail_store(thumbnail_dir: str = DEFAULT_THUMBNAIL_DIR) -> ThumbnailStore:
+    """ThumbnailStore dùng chung cho mỗi thư mục (tạo ở lần gọi đầu tiên)."""
+    with _thumbnail_stores_lock:
+        if thumbnail_dir not in _thumbnail_stores:
+            _thumbnail_stores[thumbnail_dir] = ThumbnailStore(thumbnail_dir)
+        return _thumbnail_stores[thumbnail_dir]
@@ -1,21 +1,274 @@
 import ffmpeg
 import os
+import re
 import time
 import shutil
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .cache_manager import DiskBudgetLRU, SearchResultCache
+from .singleflight import SingleFlight
+
+DEFAULT_CLIP_DIR = "/kaggle/working/temp_clips"
+# Tổng dung lượng tối đa của thư mục clip; vượt quá thì clip ít dùng nhất bị xóa (trên thread nền).
+CLIP_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+# Điểm bắt đầu clip được làm tròn theo lưới này (giây) để các lần chọn gần nhau dùng chung một file.
+CLIP_START_GRID_SECONDS = 1.0
+# Lệnh ffmpeg cho các job nền: chạy với độ ưu tiên CPU thấp nhất để không tranh với yêu cầu của người dùng.
+PREFETCH_FFMPEG_CMD = ['nice', '-n', '19', 'ffmpeg'] if shutil.which('nice') else 'ffmpeg'
+# Dải khung hình quanh một thời điểm: số khung, bước nhảy (tính bằng frame) và chiều rộng thumbnail (px).
+FRAME_STRIP_FRAMES = 9
+FRAME_STRIP_STRIDE = 5
+FRAME_STRIP_THUMB_WIDTH = 192
+# Bộ nhớ tối đa cho các dải khung hình đã giải mã (LRU theo video + thời điểm).
+FRAME_STRIP_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+
+class IFrameIndex:
+    """
+    Thời điểm các I-frame của từng video (dựng offline bằng build_iframe_index.py),
+    lưu gọn dạng CSR: video_ids (n,), offsets (n+1,) và times (nối liền, tăng dần trong từng video).
+    Dùng để đặt điểm bắt đầu clip đúng vào một I-frame, nhờ đó cắt bằng copy codec luôn sạch.
+    """
+    def __init__(self, video_ids: Sequence[str], offsets: np.ndarray, times: np.ndarray):
+        self.video_ids = np.asarray(video_ids).astype(str)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.times = np.asarray(times, dtype=np.float64)
+        self._positions = {video_id: i for i, video_id in enumerate(self.video_ids.tolist())}
+
+    @classmethod
+    def from_dict(cls, iframe_times: Dict[str, Sequence[float]]) -> 'IFrameIndex':
+        video_ids = sorted(iframe_times)
+        arrays = [np.unique(np.asarray(iframe_times[video_id], dtype=np.float64)) for video_id in video_ids]
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(times) for times in arrays])
+        times = np.concatenate(arrays) if arrays else np.empty(0, dtype=np.float64)
+        return cls(video_ids, offsets, times)
+
+    def save(self, path: str):
+        np.savez_compressed(path, video_ids=self.video_ids, offsets=self.offsets, times=self.times.astype(np.float32))
+
+    @classmethod
+    def load(cls, path: str) -> 'IFrameIndex':
+        with np.load(path) as data:
+            return cls(data['video_ids'], data['offsets'], data['times'])
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_id in self._positions
+
+    def __len__(self):
+        return len(self.video_ids)
+
+    def previous_iframe(self, video_id: str, t: float) -> Optional[float]:
+        """I-frame cuối cùng tại hoặc trước thời điểm t (None nếu video không có trong index)."""
+        position = self._positions.get(video_id)
+        if position is None:
+            return None
+        times = self.times[self.offsets[position]:self.offsets[position + 1]]
+        if len(times) == 0:
+            return None
+        # Dung sai nhỏ vì thời điểm được lưu dạng float32.
+        i = int(np.searchsorted(times, t + 1e-3, side='right')) - 1
+        return float(times[max(i, 0)])
+
+
+class ClipCache:
+    """
+    Cache các đoạn clip đã cắt trên đĩa, key xác định theo (video, start đã làm tròn, duration).
+    - Chọn lại cùng một kết quả sẽ dùng lại clip cũ thay vì chạy lại ffmpeg.
+    - Các yêu cầu trùng key đến cùng lúc chỉ cắt MỘT lần (SingleFlight). Yêu cầu tiền cảnh và
+      prefetch nền gộp trong hai nhóm riêng: người dùng không bao giờ phải chờ một lần cắt
+      đang chạy với `nice`.
+    - ffmpeg ghi ra file tạm rồi os.replace, nên không bao giờ trả về clip dở dang.
+    - Dung lượng được giới hạn bởi DiskBudgetLRU (dọn dẹp trên thread nền).
+    - Nếu có IFrameIndex, điểm bắt đầu được lùi về I-frame gần nhất phía trước (thời lượng
+      được kéo dài tương ứng) nên cắt bằng copy codec hầu như luôn thành công, không cần re-encode.
+    """
+    def __init__(self,
+                 output_dir: str = DEFAULT_CLIP_DIR,
+                 max_bytes: int = CLIP_CACHE_MAX_BYTES,
+                 start_grid: float = CLIP_START_GRID_SECONDS,
+                 iframe_index: Optional[IFrameIndex] = None):
+        self.store = DiskBudgetLRU(output_dir, max_bytes=max_bytes)
+        self.start_grid = start_grid
+        self.iframe_index = iframe_index
+        self._flight = SingleFlight()
+        self._background_flight = SingleFlight()
+        self._foreground_cuts = 0
+        self._foreground_lock = threading.Lock()
+
+    def clip_start(self, timestamp: float, duration: int) -> float:
+        """Điểm bắt đầu clip (clip nhận timestamp làm tâm), làm tròn theo lưới start_grid."""
+        start = max(0.0, timestamp - (duration / 2))
+        if self.start_grid > 0:
+            start = round(start / self.start_grid) * self.start_grid
+        return start
+
+    @staticmethod
+    def clip_name(video_path: str, start: float, duration: int) -> str:
+        video_name = os.path.splitext(os.path.basename(video_path))[0]
+        return f"clip_{video_name}_{int(round(start * 1000))}_{duration}.mp4"
+
+    def get(self, video_path: str, timestamp: float, duration: int = 30) -> Optional[str]:
+        """Đường dẫn clip nếu đã có trong cache, ngược lại None (không cắt)."""
+        return self.store.get(self.clip_name(video_path, self.clip_start(timestamp, duration), duration))
+
+    def get_or_create(self, video_path: str, timestamp: float, duration: int = 30, background: bool = False) -> Optional[str]:
+        """
+        Trả về clip đã cache hoặc cắt mới (các lời gọi trùng key được gộp lại).
+        background=True dành cho prefetch: ffmpeg chạy với `nice` và không tính là yêu cầu tiền cảnh.
+        Yêu cầu tiền cảnh không gộp vào lần cắt nền đang chạy mà tự cắt với độ ưu tiên bình thường
+        (hai lần cắt ghi ra file tạm riêng, kết quả giống hệt nhau).
+        """
+        start_time = self.clip_start(timestamp, duration)
+        clip_name = self.clip_name(video_path, start_time, duration)
+        cached_path = self.store.get(clip_name)
+        if cached_path:
+            if not background:
+                print(f"--- ⚡ Dùng lại clip đã cắt: '{clip_name}' ---")
+            return cached_path
+        if background:
+            clip_path, _ = self._background_flight.do(clip_name, self._cut, video_path, start_time, duration, clip_name, PREFETCH_FFMPEG_CMD)
+            return clip_path
+        with self._foreground_lock:
+            self._foreground_cuts += 1
+        try:
+            clip_path, _ = self._flight.do(clip_name, self._cut, video_path, start_time, duration, clip_name)
+            return clip_path
+        finally:
+            with self._foreground_lock:
+                self._foreground_cuts -= 1
+
+    def _align_to_iframe(self, video_path: str, start_time: float, duration: int) -> Tuple[float, float]:
+        """
+        Lùi điểm bắt đầu về I-frame đứng trước và kéo dài thời lượng để vẫn phủ hết
+        [start_time, start_time + duration]. Giữ nguyên nếu video không có trong IFrameIndex.
+        """
+        if self.iframe_index is None:
+            return start_time, duration
+        video_id = os.path.splitext(os.path.basename(video_path))[0]
+        iframe_time = self.iframe_index.previous_iframe(video_id, start_time)
+        if iframe_time is None:
+            return start_time, duration
+        return iframe_time, duration + (start_time - iframe_time)
+
+    def foreground_active(self) -> bool:
+        """Có yêu cầu cắt clip nào từ người dùng đang chạy hay không."""
+        with self._foreground_lock:
+            return self._foreground_cuts > 0
+
+    def _cut(self, video_path: str, start_time: float, duration: int, clip_name: str, cmd='ffmpeg') -> Optional[str]:
+        # Một lời gọi khác có thể vừa cắt xong ngay trước khi ta vào SingleFlight.
+        cached_path = self.store.get(clip_name)
+        if cached_path:
+            return cached_path
+        temp_path = self.store.temp_path_for(clip_name)
+        cut_start, cut_duration = self._align_to_iframe(video_path, start_time, duration)
+        print(f"--- 🎬 Bắt đầu tạo clip: Nguồn='{os.path.basename(video_path)}', Start={cut_start:.2f}s, Output='{clip_name}' ---")
+        if not _cut_with_ffmpeg(video_path, cut_start, cut_duration, temp_path, cmd=cmd):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None
+        os.replace(temp_path, self.store.path_for(clip_name))
+        return self.store.add(clip_name)
+
+
+class ClipPrefetcher:
+    """
+    Cắt trước (prefetch) clip xem thử cho các kết quả người dùng nhiều khả năng sẽ chọn.
+    - Pool worker có giới hạn; ffmpeg chạy với `nice`, và worker nhường chỗ khi có
+      yêu cầu cắt clip tiền cảnh đang chạy.
+    - Mỗi phiên (session) có một "thế hệ" prefetch: schedule() mới sẽ làm các job
+      chưa chạy của thế hệ cũ tự hủy khi đến lượt (job đang cắt dở vẫn chạy xong, vì
+      clip đó vẫn được cache lại). Trạng thái của phiên được xóa ngay khi phiên không
+      còn job nào đang chờ, nên số phiên đã từng dùng không làm bộ nhớ tăng dần.
+    """
+    def __init__(self, clip_cache: ClipCache, max_workers: int = 2, duration: int = 30):
+        self.clip_cache = clip_cache
+        self.duration = duration
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="clip-prefetch")
+        self._generations: Dict[str, int] = {}
+        self._pending_jobs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def schedule(self, session_id: str, items: List[Tuple[str, float]]) -> int:
+        """
+        Bắt đầu một thế hệ prefetch mới cho phiên với danh sách (video_path, timestamp)
+        theo thứ tự ưu tiên; các job cũ của phiên bị hủy.
+
+        Returns:
+            int: Số thế hệ mới của phiên.
+        """
+        items = [(video_path, timestamp) for video_path, timestamp in items
+                 if video_path and os.path.exists(video_path)]
+        with self._lock:
+            generation = self._generations.get(session_id, 0) + 1
+            self._generations[session_id] = generation
+            self._pending_jobs[session_id] = self._pending_jobs.get(session_id, 0) + len(items)
+            if not self._pending_jobs[session_id]:
+                self._forget(session_id)
+        for video_path, timestamp in items:
+            self._executor.submit(self._prefetch, session_id, generation, video_path, timestamp)
+        return generation
+
+    def _forget(self, session_id: str):
+        """Xóa trạng thái của phiên (gọi khi đang giữ self._lock)."""
+        self._generations.pop(session_id, None)
+        self._pending_jobs.pop(session_id, None)
+
+    def _job_finished(self, session_id: str):
+        with self._lock:
+            self._pending_jobs[session_id] -= 1
+            if self._pending_jobs[session_id] <= 0:
+                self._forget(session_id)
+
+    def _is_current(self, session_id: str, generation: int) -> bool:
+        with self._lock:
+            return self._generations.get(session_id) == generation
+
+    def _prefetch(self, session_id: str, generation: int, video_path: str, timestamp: float):
+        try:
+            while self.clip_cache.foreground_active():
+                if not self._is_current(session_id, generation):
+                    return
+                time.sleep(0.05)
+            if not self._is_current(session_id, generation):
+                return
+            self.clip_cache.get_or_create(video_path, timestamp, self.duration, background=True)
+        except Exception as e:
+            print(f"--- ⚠️ Lỗi khi prefetch clip '{os.path.basename(video_path)}' @ {timestamp:.2f}s: {e} ---")
+        finally:
+            self._job_finished(session_id)
+
+
+_clip_caches: Dict[str, ClipCache] = {}
+_clip_caches_lock = threading.Lock()
+
+def get_clip_cache(output_dir: str = DEFAULT_CLIP_DIR, iframe_index: Optional[IFrameIndex] = None) -> ClipCache:
+    """ClipCache dùng chung cho mỗi thư mục output (tạo ở lần gọi đầu tiên; iframe_index nếu có sẽ được gắn vào)."""
+    with _clip_caches_lock:
+        if output_dir not in _clip_caches:
+            _clip_caches[output_dir] = ClipCache(output_dir)
+        if iframe_index is not None:
+            _clip_caches[output_dir].iframe_index = iframe_index
+        return _clip_caches[output_dir]
+
 
 def create_video_segment(
     video_path: Optional[str],
     timestamp: float,
     duration: int = 30,
-    output_dir: str = "/kaggle/working/temp_clips"
+    output_dir: str = DEFAULT_CLIP_DIR
 ) -> Optional[str]:
     """
     Cắt một đoạn video ngắn từ một file video lớn tại một timestamp cho trước.
 
-    Hàm này sẽ cố gắng cắt video bằng cách sao chép codec (rất nhanh) trước.
-    Nếu thất bại (thường do keyframe không align), nó sẽ tự động thử lại bằng cách
-    re-encode video (chậm hơn nhưng đáng tin cậy hơn).
+    Clip được cache theo (video, start làm tròn theo lưới, duration) trong ClipCache của
+    output_dir, nên chọn lại cùng một kết quả sẽ không chạy lại ffmpeg.
 
     Args:
         video_path (Optional[str]): Đường dẫn đầy đủ đến file video nguồn.
@@ -24,7 +277,7 @@ def create_video_segment(
         output_dir (str): Thư mục để lưu các file clip tạm thời.
 
     Returns:
-        Optional[str]: Đường dẫn đến file video clip đã được tạo, hoặc None nếu có lỗi.
+        Optional[str]: Đường dẫn đến file video clip, hoặc None nếu có lỗi.
     """
     if not video_path or not isinstance(video_path, str):
         print(f"--- ⚠️ Lỗi Cắt Video: Đường dẫn video không hợp lệ (giá trị là {video_path}). ---")
@@ -33,27 +286,24 @@ def create_video_segment(
     if not os.path.exists(video_path):
         print(f"--- ⚠️ Lỗi Cắt Video: File video không tồn tại tại '{video_path}'. ---")
         return None
-    
-    os.makedirs(output_dir, exist_ok=True)
-    cleanup_old_clips(output_dir, max_age_seconds=600) 
-    start_time = max(0, timestamp - (duration / 2))
-    
-    timestamp_ms = int(time.time() * 1000)
-    output_filename = f"clip_{os.path.basename(video_path)}_{timestamp_ms}.mp4"
-    output_clip_path = os.path.join(output_dir, output_filename)
-    
-    print(f"--- 🎬 Bắt đầu tạo clip: Nguồn='{os.path.basename(video_path)}', Time={timestamp:.2f}s, Output='{output_filename}' ---")
 
+    return get_clip_cache(output_dir).get_or_create(video_path, timestamp, duration)
+
+def _cut_with_ffmpeg(video_path: str, start_time: float, duration: int, output_clip_path: str, cmd='ffmpeg') -> bool:
+    """
+    Cắt clip bằng ffmpeg. Thử sao chép codec (rất nhanh) trước; nếu thất bại (thường do
+    keyframe không align) thì thử lại bằng re-encode (chậm hơn nhưng đáng tin cậy hơn).
+    """
     try:
         print("   -> Thử phương pháp cắt nhanh (copy codec)...")
         (
             ffmpeg
             .input(video_path, ss=start_time)
             .output(output_clip_path, t=duration, c='copy', y=None) 
-            .run(overwrite_output=True, quiet=True, capture_stdout=True, capture_stderr=True)
+            .run(cmd=cmd, overwrite_output=True, quiet=True, capture_stdout=True, capture_stderr=True)
         )
         print("   -> ✅ Cắt nhanh thành công!")
-        return output_clip_path
+        return True
     except ffmpeg.Error as e:
         print(f"   -> ⚠️ Cắt nhanh thất bại. Lỗi FFMPEG: {e.stderr.decode('utf8')}")
     try:
@@ -62,17 +312,152 @@ def create_video_segment(
             ffmpeg
             .input(video_path, ss=start_time)
             .output(output_clip_path, t=duration, y=None) 
-            .run(overwrite_output=True, quiet=True, capture_stdout=True, capture_stderr=True)
+            .run(cmd=cmd, overwrite_output=True, quiet=True, capture_stdout=True, capture_stderr=True)
         )
         print("   -> ✅ Re-encode thành công!")
-        return output_clip_path
+        return True
     except ffmpeg.Error as e:
         print(f"--- ❌ Lỗi Cắt Video: Cả hai phương pháp đều thất bại. Lỗi FFMPEG cuối cùng: {e.stderr.decode('utf8')} ---")
-        return None
+        return False
+
+_frame_strip_cache = SearchResultCache(max_bytes=FRAME_STRIP_CACHE_MAX_BYTES, ttl_seconds=3600.0)
+
+def _parse_frame_rate(rate: str) -> float:
+    numerator, _, denominator = str(rate).partition('/')
+    try:
+        return float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+# pts (số nguyên) của từng khung hình và time_base của đầu vào filter, trong log của showinfo.
+_SHOWINFO_PTS_PATTERN = re.compile(rb'\bn:\s*\d+\s+pts:\s*(-?\d+)\s+pts_time:')
+_SHOWINFO_TIME_BASE_PATTERN = re.compile(rb'config in time_base:\s*(\d+)/(\d+)')
+
+# Tùy chọn giữ nguyên nhịp khung khi xuất: fps_mode từ ffmpeg 5.1; bản cũ hơn (ví dụ ffmpeg 4.x
+# của Ubuntu 22.04 / Kaggle) chỉ hiểu vsync. Chuyển hẳn sang vsync ở lần đầu ffmpeg từ chối fps_mode.
+_passthrough_sync_option = 'fps_mode'
+
+def _ffmpeg_error_tail(stderr: Optional[bytes], max_lines: int = 3) -> str:
+    """Vài dòng cuối của stderr ffmpeg (dòng lỗi thật nằm sau phần banner/cấu hình)."""
+    lines = [line for line in (stderr or b'').decode('utf8', errors='ignore').splitlines() if line.strip()]
+    return ' | '.join(lines[-max_lines:])
+
+def _decode_strip_frames(video_path: str, seek_time: float, width: int, height: int, max_frames: int) -> Tuple[bytes, bytes]:
+    """Chạy ffmpeg giải mã dải khung hình; trả về (rawvideo RGB, log stderr có showinfo)."""
+    global _passthrough_sync_option
+    while True:
+        try:
+            return (
+                ffmpeg
+                .input(video_path, ss=seek_time, copyts=None)
+                .filter('showinfo')
+                .filter('scale', width, height)
+                .output('pipe:', format='rawvideo', pix_fmt='rgb24', vframes=max_frames,
+                        **{_passthrough_sync_option: 'passthrough'})
+                .run(capture_stdout=True, capture_stderr=True)
+            )
+        except ffmpeg.Error as e:
+            if _passthrough_sync_option != 'fps_mode' or b'fps_mode' not in (e.stderr or b''):
+                raise
+            print("--- ⚠️ ffmpeg không hỗ trợ fps_mode (bản cũ hơn 5.1), chuyển sang vsync. ---")
+            _passthrough_sync_option = 'vsync'
+
+@lru_cache(maxsize=1024)
+def _probe_video_stream(video_path: str) -> Tuple[int, int, float, float]:
+    """(width, height, fps, start_time) của luồng video đầu tiên; cache theo đường dẫn để chỉ probe một lần."""
+    stream = ffmpeg.probe(video_path, select_streams='v:0')['streams'][0]
+    fps = _parse_frame_rate(stream.get('avg_frame_rate')) or _parse_frame_rate(stream.get('r_frame_rate'))
+    return int(stream['width']), int(stream['height']), fps, float(stream.get('start_time') or 0.0)
+
+def extract_frame_strip(
+    video_path: str,
+    timestamp: float,
+    n: int = FRAME_STRIP_FRAMES,
+    stride: int = FRAME_STRIP_STRIDE,
+    fps: Optional[float] = None,
+    width: int = FRAME_STRIP_THUMB_WIDTH
+) -> List[Tuple[np.ndarray, int, float]]:
+    """
+    Giải mã `n` khung hình quanh `timestamp` (cách nhau `stride` frame) trong MỘT lần chạy ffmpeg:
+    seek tới ngay trước khung đầu dải, giải mã liên tục đến khung cuối, thu nhỏ và đọc thẳng
+    rawvideo RGB từ pipe vào bộ nhớ, không ghi file tạm.
+
+    Số frame của mỗi khung được tính từ pts thực của khung đã giải mã (giữ timestamp gốc bằng
+    -copyts, đọc pts và time_base qua filter showinfo, trừ start_time của luồng) chứ không suy ra từ vị trí seek,
+    nên không bị lệch một khung khi seek bằng số thực hay khi luồng có start_time khác 0.
+
+    Kết quả được cache (LRU) theo (video, thời điểm, n, stride, fps, width).
+
+    Args:
+        video_path (str): Đường dẫn video nguồn.
+        timestamp (float): Thời điểm trung tâm của dải (giây).
+        n (int): Số khung hình của dải.
+        stride (int): Khoảng cách (số frame) giữa hai khung liên tiếp trong dải.
+        fps (Optional[float]): FPS dùng để quy đổi frame <-> giây (thường lấy từ fps_map);
+            None thì dùng FPS đọc từ file.
+        width (int): Chiều rộng thumbnail (px).
+
+    Returns:
+        List[Tuple[np.ndarray, int, float]]: Danh sách (ảnh RGB HxWx3 uint8, số frame, thời điểm giây),
+            theo thứ tự thời gian. Rỗng nếu có lỗi.
+    """
+    if not video_path or not os.path.exists(video_path) or n <= 0:
+        return []
+    stride = max(1, int(stride))
+    cache_key = (video_path, round(float(timestamp), 3), n, stride, fps, width)
+    cached_strip = _frame_strip_cache.get(cache_key)
+    if cached_strip is not None:
+        return cached_strip
+
+    try:
+        source_width, source_height, probed_fps, stream_start = _probe_video_stream(video_path)
+    except (ffmpeg.Error, KeyError, IndexError, ValueError) as e:
+        print(f"--- ⚠️ Lỗi Dải Khung Hình: Không đọc được thông tin video '{video_path}': {e} ---")
+        return []
+    fps = fps or probed_fps or 30.0
+    height = max(2, int(round(width * source_height / source_width / 2)) * 2)
+    frame_bytes = width * height * 3
+
+    center_frame = int(round(float(timestamp) * fps))
+    first_frame = max(0, center_frame - (n // 2) * stride)
+    wanted_frames = set(range(first_frame, first_frame + n * stride, stride))
+    # Seek sớm nửa khung để khung đầu dải chắc chắn được giải mã; dư thêm vài khung ở cuối.
+    seek_time = max(0.0, (first_frame - 0.5) / fps)
+    try:
+        raw_frames, log = _decode_strip_frames(video_path, seek_time, width, height, (n - 1) * stride + 3)
+    except ffmpeg.Error as e:
+        print(f"--- ⚠️ Lỗi Dải Khung Hình: ffmpeg thất bại với '{video_path}': {_ffmpeg_error_tail(e.stderr)} ---")
+        return []
+
+    # Tính từ pts nguyên và time_base: pts_time trong log chỉ có 6 chữ số có nghĩa.
+    time_base = _SHOWINFO_TIME_BASE_PATTERN.search(log)
+    if time_base is None:
+        print("--- ⚠️ Lỗi Dải Khung Hình: Không đọc được time_base từ ffmpeg. ---")
+        return []
+    seconds_per_tick = int(time_base.group(1)) / int(time_base.group(2))
+    pts_times = [int(pts) * seconds_per_tick for pts in _SHOWINFO_PTS_PATTERN.findall(log)]
+    frame_count = min(len(pts_times), len(raw_frames) // frame_bytes)
+    frames = np.frombuffer(raw_frames, dtype=np.uint8, count=frame_count * frame_bytes)
+    frames = frames.reshape(frame_count, height, width, 3)
+    strip = []
+    for i in range(frame_count):
+        frame_time = pts_times[i] - stream_start
+        frame_number = int(round(frame_time * fps))
+        if frame_number in wanted_frames:
+            wanted_frames.discard(frame_number)
+            # Chép riêng từng khung: view vào buffer sẽ giữ cả lần giải mã trong cache
+            # trong khi ước lượng dung lượng của cache chỉ đếm các khung được giữ.
+            strip.append((frames[i].copy(), frame_number, frame_time))
+    if strip:
+        _frame_strip_cache.set(cache_key, strip)
+    else:
+        print(f"--- ⚠️ Lỗi Dải Khung Hình: Không giải mã được khung nào quanh {timestamp}s của '{video_path}'. ---")
+    return strip
 
 def cleanup_old_clips(directory: str, max_age_seconds: int):
     """
     Dọn dẹp các file clip cũ trong một thư mục để giải phóng dung lượng.
+    (Không còn được gọi khi cắt clip; ClipCache tự giới hạn dung lượng bằng DiskBudgetLRU.)
 
     Args:
         directory (str): Thư mục chứa các file clip.